@@ -33,7 +33,10 @@ setup(
         'console_scripts': [
             'exppar = simtools.bin.exppar:main',
             'genseed = simtools.bin.genseed:main',
-            'runsim = simtools.bin.runsim:main'
+            'runsim = simtools.bin.runsim:main',
+            'simdedup = simtools.bin.simdedup:main',
+            'simls = simtools.bin.simls:main',
+            'simpack = simtools.bin.simpack:main'
             ]
         },
     extras_require={'tests': "pytest"},
@@ -8,11 +8,31 @@ Python.
 __version__ = '0.1.0'
 __author__ = "Przemyslaw (Mack) Nowak"
 
+import sys
+
+from .archive import ArchiveIndex, pack_sim_dirs
 from .argparse import parse_args, parse_known_args
+from .batch import (classify_failure, make_sim_dirs, plan_batch, run_batch,
+                    SimPool)
+from .data import Aggregator, load_data, Recorder
+from .ensemble import Ensemble, stack_params
 from .params import (export_params, load_paramnames, load_params, ParamSets,
-                     Params)
+                     Params, sweep_params)
+from .progress import BatchProgress
+from .queue import run_worker, SimQueue
 from .random import generate_seed
-from .simrun import (generate_sim_dirname, generate_sim_id, load_sim_dirnames,
-                     make_dirs, norm_executable, run_sim)
-from .utils import save_platform, save_versions
-from . import argparse, params, random, simrun, utils
+from .registry import Registry
+from .simrun import (copy_file, cpu_slots, finalize_sim_dir, ForkServer,
+                     generate_sim_dirname, generate_sim_id, is_partial_dirname,
+                     iter_sim_dirnames, list_sim_dirnames, load_sim_dirnames,
+                     make_dirs, make_sim_cmd, move_sim_dir, norm_executable,
+                     place_process, reserve_sim_dir, run_sim, run_sim_cmd,
+                     run_sim_inproc, shard_sim_dirname)
+from .store import FileStore
+from .utils import save_manifest, save_platform, save_versions
+from . import (archive, argparse, batch, checkpoint, data, ensemble, params,
+               progress, queue, random, registry, simrun, store, utils)
+
+if sys.version_info >= (3, 5):
+    from .asyncrun import run_sim_async
+    from . import asyncrun
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Simulation archive services.
+
+Simulation archive services provide the following functionality:
+
+- packing complete simulation directories into a zip archive, written
+  atomically, along with an index of the simulation directories it contains;
+- listing simulation directories packed into an archive;
+- indexing archives in a directory by names of simulation directories packed
+  into them;
+- resolving paths passing through an archive, such as
+  'pack_000001.zip/20001030_070809/params.json';
+- reading files packed into archives directly through the central directory
+  of the archive, without extracting it, keeping recently used archives open.
+"""
+
+import collections
+import errno
+import io
+import os
+import re
+import tempfile
+import threading
+import zipfile
+
+ARCHIVE_SUFFIX = ".zip"
+PACK_PREFIX = "pack_"
+PACK_SIZE = 1000
+PACK_INDEX_NAME = ".simdirs.txt"
+ARCHIVE_CACHE_SIZE = 8
+
+_archive_cache = collections.OrderedDict()
+_archive_cache_lock = threading.Lock()
+
+
+def pack_sim_dirs(archive_filename, sim_dirnames, sim_master_dirname=None,
+                  compress=True):
+    """Pack simulation directories into a zip archive."""
+    if os.path.lexists(archive_filename):
+        raise OSError(errno.EEXIST, "Archive already exists",
+                      archive_filename)
+    if sim_master_dirname is None:
+        sim_master_dirname = os.curdir
+
+    # Write the archive to a temporary file in the same directory and rename
+    # it only once it is complete, so that a partially written archive is
+    # never mistaken for a complete one
+    dirname = os.path.dirname(os.path.abspath(archive_filename))
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=dirname, prefix="." + os.path.basename(archive_filename),
+        suffix=".tmp")
+    os.close(tmp_fd)
+    compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+    try:
+        with zipfile.ZipFile(tmp_path, 'w', compression,
+                             allowZip64=True) as archive:
+            archived_dirnames = []
+            for sim_dirname in sim_dirnames:
+                sim_path = os.path.join(sim_master_dirname, sim_dirname)
+                if not os.path.isdir(sim_path):
+                    raise OSError(errno.ENOENT, "No such directory", sim_path)
+                member_dirname = _member_name(sim_dirname)
+                _pack_dir(archive, sim_path, member_dirname)
+                archived_dirnames.append(member_dirname)
+
+            # Save the index of simulation directories packed into the
+            # archive as the last member
+            archive.writestr(PACK_INDEX_NAME, "".join(
+                name + "\n" for name in archived_dirnames))
+        with open(tmp_path, 'rb') as tmp_file:
+            os.fsync(tmp_file.fileno())
+        os.rename(tmp_path, archive_filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return archived_dirnames
+
+
+def list_packed_sim_dirnames(archive_filename):
+    """List names of simulation directories packed into an archive."""
+    archive = _open_archive(archive_filename)
+    try:
+        index = archive.read(PACK_INDEX_NAME).decode('utf-8')
+    except KeyError:
+        return []
+    return [line for line in index.splitlines() if line]
+
+
+def list_archives(dirname=None):
+    """List names of archives in a directory."""
+    if dirname is None:
+        dirname = os.curdir
+    return sorted(
+        filename for filename in os.listdir(dirname)
+        if filename.lower().endswith(ARCHIVE_SUFFIX)
+        and not filename.startswith(".")
+        and os.path.isfile(os.path.join(dirname, filename)))
+
+
+def generate_archive_filename(dirname=None):
+    """Generate name of the next archive of simulation directories."""
+    pattern = re.compile(r"^{0}(\d+){1}$".format(re.escape(PACK_PREFIX),
+                                                  re.escape(ARCHIVE_SUFFIX)))
+    numbers = [int(match.group(1)) for match in
+               map(pattern.match, list_archives(dirname)) if match]
+    return "{0}{1:06d}{2}".format(PACK_PREFIX, max(numbers or [0]) + 1,
+                                  ARCHIVE_SUFFIX)
+
+
+class ArchiveIndex(object):
+    """Index of simulation directories packed into archives in a directory."""
+
+    def __init__(self, dirname=None):
+        self.dirname = dirname if dirname is not None else os.curdir
+        self._archive_filenames = {}
+        for archive_filename in list_archives(self.dirname):
+            archive_path = os.path.join(self.dirname, archive_filename)
+            for sim_dirname in list_packed_sim_dirnames(archive_path):
+                self._archive_filenames[sim_dirname] = archive_path
+
+    def __contains__(self, sim_dirname):
+        return _member_name(sim_dirname) in self._archive_filenames
+
+    def __len__(self):
+        return len(self._archive_filenames)
+
+    def find(self, sim_dirname):
+        """Find the archive into which a simulation directory is packed."""
+        return self._archive_filenames.get(_member_name(sim_dirname))
+
+    def locate(self, sim_dirname, filename=None):
+        """Determine the path to a packed simulation directory or its file."""
+        archive_path = self.find(sim_dirname)
+        if archive_path is None:
+            return None
+        sim_path = os.path.join(archive_path, os.path.normpath(sim_dirname))
+        return os.path.join(sim_path, filename) if filename else sim_path
+
+
+def split_archive_path(path):
+    """Split path passing through an archive into archive and member names."""
+    components = os.path.normpath(path).split(os.sep)
+    for n_components in range(1, len(components)):
+        archive_filename = os.sep.join(components[:n_components])
+        if (archive_filename.lower().endswith(ARCHIVE_SUFFIX)
+                and os.path.isfile(archive_filename)):
+            return archive_filename, "/".join(components[n_components:])
+    return None
+
+
+def is_file(path):
+    """Check if path is a regular file, possibly packed into an archive."""
+    if os.path.isfile(path):
+        return True
+    archive_path = split_archive_path(path)
+    if archive_path is None:
+        return False
+    archive_filename, member_name = archive_path
+    try:
+        _open_archive(archive_filename).getinfo(member_name)
+    except KeyError:
+        return False
+    return True
+
+
+def open_file(path):
+    """Open a file for reading as text, possibly packed into an archive."""
+    # If the path passes through an archive, read the packed file through the
+    # central directory of the archive
+    archive_path = None
+    if not os.path.exists(path):
+        archive_path = split_archive_path(path)
+    if archive_path is None:
+        return open(path)
+    archive_filename, member_name = archive_path
+    try:
+        contents = _open_archive(archive_filename).read(member_name)
+    except KeyError:
+        raise IOError(errno.ENOENT, "No such file", path)
+    return io.StringIO(contents.decode('utf-8'), newline=None)
+
+
+def _member_name(sim_dirname):
+    """Convert simulation directory name to the name of archive member."""
+    return "/".join(os.path.normpath(sim_dirname).split(os.sep))
+
+
+def _open_archive(archive_filename):
+    """Open an archive, reusing it if it has been opened recently."""
+    # Identify the archive along with its modification time and size, so that
+    # an archive that has been replaced is opened again
+    stat_result = os.stat(archive_filename)
+    key = (os.path.abspath(archive_filename), stat_result.st_mtime,
+           stat_result.st_size)
+    with _archive_cache_lock:
+        archive = _archive_cache.pop(key, None)
+        if archive is None:
+            archive = zipfile.ZipFile(archive_filename)
+        _archive_cache[key] = archive
+        while len(_archive_cache) > ARCHIVE_CACHE_SIZE:
+            _archive_cache.popitem(last=False)[1].close()
+    return archive
+
+
+def _pack_dir(archive, dirname, member_dirname):
+    """Pack a directory into an archive recursively."""
+    archive.write(dirname, member_dirname + "/")
+    for dirpath, subdirnames, filenames in os.walk(dirname):
+        subdirnames.sort()
+        rel_dirpath = os.path.relpath(dirpath, dirname)
+        if rel_dirpath == os.curdir:
+            member_dirpath = member_dirname
+        else:
+            member_dirpath = "/".join([member_dirname]
+                                      + rel_dirpath.split(os.sep))
+            archive.write(dirpath, member_dirpath + "/")
+        for filename in sorted(filenames):
+            archive.write(os.path.join(dirpath, filename),
+                          member_dirpath + "/" + filename)
@@ -4,7 +4,9 @@
 Command line argument parsing services provide the following functionality:
 
 - specifying which predefined options are supported;
-- parsing command line arguments to populate supported options.
+- parsing command line arguments to populate supported options;
+- recognizing parameters passed by the launcher through an environment
+  variable instead of a parameter file.
 """
 
 from __future__ import absolute_import
@@ -12,7 +14,8 @@ from __future__ import absolute_import
 import argparse
 import os
 
-from simtools.base import Dict
+from simtools.base import Dict, parse_cpu_list
+from simtools.params import ENV_PARAMS_FILENAME, PARAMS_ENV_VAR
 
 
 def dir_r_type(dirname):
@@ -48,6 +51,55 @@ def file_r_type(filename):
     return filename
 
 
+def file_r_stdin_type(filename):
+    """Check if file exists and is readable, unless it is '-' (stdin)."""
+    if filename == "-":
+        return filename
+    return file_r_type(filename)
+
+
+def size_type(size):
+    """Check if size is a positive number of bytes with an optional suffix."""
+    SIZE_SUFFIXES = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30,
+                     'T': 1 << 40}
+
+    suffix = size[-1:].upper() if size[-1:].isalpha() else ""
+    try:
+        n_bytes = int(size[:len(size) - len(suffix)]) * SIZE_SUFFIXES[suffix]
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError("invalid size: '{}'".format(size))
+    if n_bytes <= 0:
+        raise argparse.ArgumentTypeError(
+            "invalid size: '{}' (expected positive size)".format(size))
+    return n_bytes
+
+
+def cpu_list_type(cpu_list):
+    """Check if list of CPUs is valid."""
+    try:
+        cpus = parse_cpu_list(cpu_list)
+    except ValueError:
+        cpus = []
+    if not cpus or min(cpus) < 0:
+        raise argparse.ArgumentTypeError(
+            "invalid list of CPUs: '{}'".format(cpu_list))
+    return cpus
+
+
+def ionice_type(ionice):
+    """Check if I/O scheduling class and optional priority are valid."""
+    io_class, _, io_level = ionice.partition(":")
+    try:
+        io_class = int(io_class)
+        io_level = int(io_level or 0)
+    except ValueError:
+        io_class = io_level = None
+    if io_class not in (1, 2, 3) or io_level not in range(8):
+        raise argparse.ArgumentTypeError(
+            "invalid I/O scheduling class and priority: '{}'".format(ionice))
+    return io_class, io_level
+
+
 all_options = {
     'data_dirname': {
         'arg': ["-d", "--data-dir"],
@@ -98,7 +150,9 @@ def parse_args(allowed_options, only_long_names=False, parser=None):
     """Parse command line arguments."""
     parser = _make_parser(allowed_options, allow_extra_args=False,
                           only_long_names=only_long_names, parser=parser)
-    return Dict(vars(parser.parse_args()))
+    args = Dict(vars(parser.parse_args()))
+    _apply_env_params(allowed_options, args)
+    return args
 
 
 def parse_known_args(allowed_options, only_long_names=False, parser=None):
@@ -106,7 +160,20 @@ def parse_known_args(allowed_options, only_long_names=False, parser=None):
     parser = _make_parser(allowed_options, allow_extra_args=True,
                           only_long_names=only_long_names, parser=parser)
     args, extra_args = parser.parse_known_args()
-    return Dict(vars(args)), extra_args
+    args = Dict(vars(args))
+    _apply_env_params(allowed_options, args)
+    return args, extra_args
+
+
+def _apply_env_params(allowed_options, args):
+    """Refer to parameters passed through an environment variable."""
+    # If no parameter file is specified but the launcher has passed parameters
+    # through an environment variable, refer to them instead, so that they are
+    # loaded by 'load_params()' as if they were read from a file
+    if ('params_filename' in allowed_options
+        and args.params_filename is None
+        and PARAMS_ENV_VAR in os.environ):
+        args.params_filename = ENV_PARAMS_FILENAME
 
 
 def _make_parser(allowed_options, allow_extra_args, only_long_names, parser):
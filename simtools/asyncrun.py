@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Asynchronous simulation launch services.
+
+Asynchronous simulation launch services provide launching simulation as a
+coroutine, with output of the child process streamed to log files. They require
+Python 3.5 or later.
+"""
+
+import asyncio
+import os
+
+from simtools.simrun import make_sim_cmd
+
+CHUNK_SIZE = 1 << 16
+TERMINATE_TIMEOUT = 5.0
+
+
+async def run_sim_async(model_filename, params_filename=None, sim_id=None,
+                        data_dirname=None, executable=None, model_args=None,
+                        sim_path=None, stdout_filename=None,
+                        stderr_filename=None,
+                        terminate_timeout=TERMINATE_TIMEOUT):
+    """Launch simulation asynchronously."""
+    # Determine absolute paths to the model file and the parameter file, since
+    # the simulation runs in the simulation directory
+    cmd = make_sim_cmd(os.path.abspath(model_filename),
+                       os.path.abspath(params_filename)
+                       if params_filename else None,
+                       sim_id, data_dirname, executable, model_args)
+
+    # If necessary, open log files (relative to the simulation directory)
+    log_files = []
+    try:
+        stdout_file = _open_log(stdout_filename, sim_path, log_files)
+        if stderr_filename is not None and stderr_filename == stdout_filename:
+            stderr_file = None
+            stderr = asyncio.subprocess.STDOUT
+        else:
+            stderr_file = _open_log(stderr_filename, sim_path, log_files)
+            stderr = asyncio.subprocess.PIPE if stderr_file else None
+
+        # Launch simulation as a child process
+        process = await asyncio.create_subprocess_exec(
+            *cmd, cwd=sim_path,
+            stdout=asyncio.subprocess.PIPE if stdout_file else None,
+            stderr=stderr)
+
+        # Stream output of the child process to the log files and wait for
+        # the child process to finish; if cancelled, stop the child process
+        try:
+            pumps = [_pump(stream, log_file) for stream, log_file in (
+                (process.stdout, stdout_file), (process.stderr, stderr_file))
+                if log_file is not None]
+            await asyncio.gather(*pumps)
+            return await process.wait()
+        except asyncio.CancelledError:
+            await _stop(process, terminate_timeout)
+            raise
+    finally:
+        for log_file in log_files:
+            log_file.close()
+
+
+def _open_log(filename, sim_path, log_files):
+    """Open log file in the simulation directory."""
+    if filename is None:
+        return None
+    if sim_path is not None:
+        filename = os.path.join(sim_path, filename)
+    log_file = open(filename, 'wb')
+    log_files.append(log_file)
+    return log_file
+
+
+async def _pump(stream, log_file):
+    """Copy data from a stream to a log file until the end of the stream."""
+    while True:
+        chunk = await stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        log_file.write(chunk)
+
+
+async def _stop(process, terminate_timeout):
+    """Terminate child process, killing it if it does not terminate."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), terminate_timeout)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
@@ -9,9 +9,14 @@ structure:
 They also provide the following functionality:
 
 - checking if object is an iterable;
-- checking if object is a string.
+- checking if object is a string;
+- flattening nested sequences of values;
+- parsing list of CPUs;
+- checking if modules can be imported, without importing them;
+- renaming file, replacing the destination file if it exists.
 """
 
+import os
 import sys
 
 
@@ -33,6 +38,45 @@ def is_string(obj):
         return isinstance(obj, basestring)
 
 
+def flatten(values):
+    """Flatten nested sequences of values."""
+    if not is_iterable(values) or is_string(values):
+        return [values]
+    return [item for value in values for item in flatten(value)]
+
+
+def parse_cpu_list(cpu_list):
+    """Parse list of CPUs in the format such as '0-3,8,10-11'."""
+    cpus = []
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        first, _, last = cpu_range.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def check_modules(module_names):
+    """Check if modules can be imported, without importing them."""
+    try:
+        from importlib.util import find_spec
+    except ImportError:
+        return
+    for module_name in module_names:
+        if find_spec(module_name) is None:
+            raise ImportError("No module named '{}'".format(module_name))
+
+
+def replace_file(src_filename, dst_filename):
+    """Rename file, replacing the destination file if it exists."""
+    # Unlike 'os.rename()', 'os.replace()' replaces an existing destination
+    # file on all platforms (including Windows)
+    if hasattr(os, 'replace'):
+        os.replace(src_filename, dst_filename)
+    else:
+        os.rename(src_filename, dst_filename)
+
+
 class Dict(dict):
     """Dictionary with access to values through attributes."""
 
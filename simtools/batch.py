@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""Batch launch services.
+
+Batch launch services provide the following functionality:
+
+- keeping a pool of warm worker processes that run simulations in-process;
+- launching a batch of simulations in parallel, either as child processes,
+  in-process in warm worker processes, or forked from a server with preloaded
+  modules;
+- placing parallel simulations on separate CPU slots assigned in a round-robin
+  manner, limiting their thread counts and setting their priorities;
+- classifying failed simulations and retrying them with exponential backoff,
+  recording every attempt in a run manifest and a run registry;
+- planning a batch of simulations without launching it, checking for
+  collisions of simulation directories, and creating simulation directories
+  in parallel;
+- reporting progress of a batch of simulations in a status line and a status
+  file.
+"""
+
+from __future__ import absolute_import
+
+import collections
+import errno
+import functools
+import importlib
+import itertools
+import multiprocessing
+import multiprocessing.pool
+import os
+import sys
+import threading
+import time
+import traceback
+
+from simtools.base import check_modules, Dict, is_string
+from simtools.progress import BatchProgress, STATUS_INTERVAL
+from simtools.registry import Registry
+from simtools.simrun import (cpu_slots, ForkServer, generate_sim_dirname,
+                             generate_sim_id, make_dirs, make_sim_cmd,
+                             place_process, run_sim_cmd, run_sim_inproc,
+                             THREAD_ENV_VARS)
+from simtools.utils import save_manifest
+
+if sys.version_info[0] == 3:
+    import queue
+else:
+    import Queue as queue
+
+LAUNCH_MODES = ('subprocess', 'pool', 'forkserver')
+FAILURE_CLASSES = ('exit', 'signal', 'timeout', 'launch')
+RETRYABLE_FAILURES = ('signal', 'timeout', 'launch')
+WORKER_POLL_INTERVAL = 0.1  # seconds between checks of worker processes
+
+_started_tasks = None  # queue of tasks started by a worker process
+
+
+class SimPool(object):
+    """Pool of warm worker processes running simulations in-process."""
+
+    def __init__(self, n_workers=None, preload=None,
+                 max_tasks_per_worker=None, slots=None, n_threads=None,
+                 nice=None, ionice=None):
+        # Validate names of modules to be preloaded
+        if preload is None:
+            preload = []
+        elif is_string(preload):
+            raise TypeError("'preload' is a string.")
+        preload = list(preload)
+
+        # Import the modules to be preloaded so that import errors are
+        # reported immediately (and, if worker processes are forked, so that
+        # they inherit the imported modules), unless the number of threads is
+        # limited, in which case the modules must be imported by worker
+        # processes only after the limit has been set
+        if n_threads is None and slots is None:
+            _import_modules(preload)
+        else:
+            check_modules(preload)
+
+        # Start worker processes, each of which places itself on the next CPU
+        # slot and reports its process id whenever it starts a task, so that
+        # the task can be failed if the worker process dies while running it
+        slot_counter = multiprocessing.Value('i', 0)
+        self._started_tasks = multiprocessing.SimpleQueue()
+        self._task_ids = itertools.count()
+        self._task_pids = {}
+        self._lock = threading.Lock()
+        self._pool = multiprocessing.Pool(
+            n_workers, _init_worker,
+            (preload, slots, slot_counter, n_threads, nice, ionice,
+             self._started_tasks),
+            max_tasks_per_worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def run_sim(self, model_filename, params_filename=None, sim_id=None,
+                data_dirname=None, model_args=None, sim_path=None,
+                params=None):
+        """Launch simulation in a worker process."""
+        task = self._submit(run_sim_inproc, (
+            model_filename, params_filename, sim_id, data_dirname, model_args,
+            sim_path, params))
+        return self._wait(*task)
+
+    def run_sims(self, sims):
+        """Launch simulations in worker processes."""
+        tasks = [self._submit(_run_sim_inproc, (Dict(sim),)) for sim in sims]
+        try:
+            return [self._wait(*task) for task in tasks]
+        finally:
+            with self._lock:
+                for task_id, _ in tasks:
+                    self._task_pids.pop(task_id, None)
+
+    def _submit(self, func, args):
+        """Submit a task to be run in a worker process."""
+        with self._lock:
+            task_id = next(self._task_ids)
+            self._task_pids[task_id] = None
+        return task_id, self._pool.apply_async(_run_task,
+                                               (task_id, func, args))
+
+    def _wait(self, task_id, result):
+        """Wait for the result of a task, unless its worker process dies."""
+        try:
+            while not result.ready():
+                result.wait(WORKER_POLL_INTERVAL)
+                if result.ready() or not self._is_lost(task_id):
+                    continue
+
+                # The result may still be on its way from a worker process
+                # that has exited after completing the task; otherwise, fail
+                # the task in the pool, so that closing the pool does not
+                # wait for it
+                result.wait(WORKER_POLL_INTERVAL)
+                if not result.ready():
+                    result._set(0, (False, RuntimeError(
+                        "Worker process has died while running the "
+                        "simulation.")))
+            return result.get()
+        finally:
+            with self._lock:
+                self._task_pids.pop(task_id, None)
+
+    def _is_lost(self, task_id):
+        """Check if the worker process running a task has died."""
+        # Record process ids of worker processes running pending tasks
+        with self._lock:
+            while not self._started_tasks.empty():
+                started_task_id, pid = self._started_tasks.get()
+                if started_task_id in self._task_pids:
+                    self._task_pids[started_task_id] = pid
+            pid = self._task_pids.get(task_id)
+        if pid is None:
+            return False
+
+        # Dead worker processes are replaced by the pool
+        return pid not in [process.pid for process in list(self._pool._pool)
+                           if process.exitcode is None]
+
+    def close(self):
+        """Wait for worker processes to complete pending simulations."""
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """Stop worker processes immediately."""
+        self._pool.terminate()
+        self._pool.join()
+
+
+def run_batch(sims, n_workers=None, mode='subprocess', preload=None,
+              pin_cpus=False, cpus_per_sim=None, n_threads=None, nice=None,
+              ionice=None, max_attempts=1, retry_on=RETRYABLE_FAILURES,
+              backoff=1.0, backoff_factor=2.0, fresh_dir=False,
+              manifest_filename=None, registry_filename=None, dry_run=False,
+              progress=False, status_filename=None,
+              status_interval=STATUS_INTERVAL, **kwargs):
+    """Launch a batch of simulations."""
+    # Validate launch mode
+    if mode not in LAUNCH_MODES:
+        raise ValueError("Launch mode '{}' is not supported.".format(mode))
+    if kwargs and mode != 'subprocess':
+        raise TypeError("Arguments {} are supported only in launch mode "
+                        "'subprocess'.".format(", ".join(
+                            "'{}'".format(arg) for arg in sorted(kwargs))))
+
+    # Validate retry settings
+    if max_attempts < 1:
+        raise ValueError("'max_attempts' is less than 1.")
+    if is_string(retry_on):
+        raise TypeError("'retry_on' is a string.")
+    for failure in retry_on:
+        if failure not in FAILURE_CLASSES:
+            raise ValueError(
+                "Failure class '{}' is not supported.".format(failure))
+
+    # Validate parameters passed through an environment variable
+    sims = [Dict(sim) for sim in sims]
+    for sim in sims:
+        if sim.get('params') is not None and sim.get('params_filename'):
+            raise ValueError("Both 'params_filename' and 'params' are "
+                             "specified for a simulation.")
+
+    # If requested, only determine command lines of simulations
+    if dry_run:
+        return [_plan_sim(sim) for sim in sims]
+
+    # If necessary, divide CPUs into slots, one per worker
+    if n_workers is None:
+        n_workers = multiprocessing.cpu_count()
+    slots = cpu_slots(n_workers, cpus_per_sim) if pin_cpus else None
+
+    # Launch simulations either in warm worker processes (each of which is
+    # placed on its own CPU slot) or as child processes (possibly forked from a
+    # server) supervised by worker threads
+    sim_pool = None
+    fork_server = None
+    if mode == 'pool':
+        sim_pool = SimPool(n_workers, preload, slots=slots,
+                           n_threads=n_threads, nice=nice, ionice=ionice)
+        launch = functools.partial(_run_pooled_sim, sim_pool)
+        slots = None
+    elif mode == 'forkserver':
+        fork_server = ForkServer(preload)
+        launch = functools.partial(_run_forked_sim, fork_server)
+    else:
+        launch = functools.partial(_run_sim, **kwargs)
+    free_slots = queue.Queue()
+    for slot in slots or []:
+        free_slots.put(slot)
+    run = functools.partial(
+        _run_sim_with_retries,
+        functools.partial(_run_sim_in_slot, launch, free_slots, slots,
+                          n_threads, nice, ionice),
+        max_attempts, retry_on, backoff, backoff_factor, fresh_dir,
+        manifest_filename,
+        Registry(registry_filename) if registry_filename else None)
+
+    # If requested, report progress of the batch from a background thread,
+    # which worker threads only notify when simulations start and finish
+    batch_progress = None
+    if progress or status_filename:
+        batch_progress = BatchProgress(
+            len(sims), sys.stderr if progress else None, status_filename,
+            status_interval)
+        batch_progress.start()
+        run = functools.partial(_run_sim_with_progress, run, batch_progress)
+    pool = multiprocessing.pool.ThreadPool(n_workers)
+    try:
+        return pool.map(run, sims, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        if sim_pool is not None:
+            sim_pool.close()
+        if fork_server is not None:
+            fork_server.close()
+        if batch_progress is not None:
+            batch_progress.stop()
+
+
+def plan_batch(sims, sim_master_dirname=None, tmp=False, id_scheme='unique',
+               shard=None):
+    """Plan a batch of simulations without launching it."""
+    # Determine simulation ids and simulation directories of simulations
+    # whose simulation directories have not been specified, making the
+    # generated simulation ids unique within the batch
+    plan = []
+    sim_ids = set()
+    for sim in sims:
+        sim = Dict(sim)
+        if sim.get('sim_path') is None:
+            if sim.get('sim_id') is None:
+                sim_id = generate_sim_id(id_scheme)
+                unique_sim_id = sim_id
+                n_repeats = 0
+                while unique_sim_id in sim_ids:
+                    n_repeats += 1
+                    unique_sim_id = "{0}_{1}".format(sim_id, n_repeats)
+                sim.sim_id = unique_sim_id
+            sim_ids.add(sim.sim_id)
+            sim_dirname = generate_sim_dirname(tmp, sim.sim_id, shard)
+            sim.sim_path = (os.path.join(sim_master_dirname, sim_dirname)
+                            if sim_master_dirname is not None
+                            else sim_dirname)
+        plan.append(_plan_sim(sim))
+
+    # Check that no simulation directory is planned twice or already exists,
+    # listing each parent directory only once
+    sim_dirnames = collections.defaultdict(set)
+    collisions = []
+    for sim in plan:
+        parent_dirname, sim_dirname = os.path.split(
+            os.path.normpath(sim.sim_path))
+        parent_dirname = parent_dirname or os.curdir
+        if sim_dirname in sim_dirnames[parent_dirname]:
+            collisions.append(sim.sim_path)
+        sim_dirnames[parent_dirname].add(sim_dirname)
+    for parent_dirname, dirnames in sorted(sim_dirnames.items()):
+        try:
+            existing_dirnames = set(os.listdir(parent_dirname))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            continue
+        collisions += [os.path.join(parent_dirname, dirname)
+                       for dirname in sorted(dirnames & existing_dirnames)]
+    if collisions:
+        raise OSError(errno.EEXIST, "Simulation directories already exist or "
+                      "are planned more than once: {}".format(
+                          ", ".join(collisions)))
+    return plan
+
+
+def make_sim_dirs(sims, n_workers=None):
+    """Create directory structures for simulations in parallel."""
+    # Create parent directories first, so that they are not created by several
+    # threads at the same time
+    sims = [Dict(sim) for sim in sims]
+    for parent_dirname in sorted(set(
+            os.path.dirname(os.path.normpath(sim.sim_path)) for sim in sims)):
+        if parent_dirname and not os.path.isdir(parent_dirname):
+            os.makedirs(parent_dirname)
+
+    pool = multiprocessing.pool.ThreadPool(n_workers)
+    try:
+        return pool.map(_make_sim_dirs, sims, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def classify_failure(run_info):
+    """Determine the class of failure of a simulation, if it failed."""
+    if run_info.get('error') is not None:
+        return 'launch'
+    if run_info.exit_status == 0:
+        return None
+    if run_info.get('cause') in ('signal', 'timeout'):
+        return run_info.cause
+    return 'signal' if run_info.exit_status < 0 else 'exit'
+
+
+def _import_modules(module_names):
+    """Import modules."""
+    for module_name in module_names:
+        importlib.import_module(module_name)
+
+
+def _init_worker(preload, slots, slot_counter, n_threads, nice, ionice,
+                 started_tasks):
+    """Initialize worker process."""
+    global _started_tasks
+    _started_tasks = started_tasks
+
+    # Determine the CPU slot of the worker process
+    if slots:
+        with slot_counter.get_lock():
+            cpus = slots[slot_counter.value % len(slots)]
+            slot_counter.value += 1
+    else:
+        cpus = None
+
+    # Place the worker process on CPUs, set its priorities, and limit the
+    # number of threads before importing the modules to be preloaded
+    if n_threads is None and cpus is not None:
+        n_threads = len(cpus)
+    if n_threads is not None:
+        for env_var in THREAD_ENV_VARS:
+            os.environ[env_var] = str(n_threads)
+    place_process(cpus, nice, ionice)
+    _import_modules(preload)
+
+
+def _run_task(task_id, func, args):
+    """Run a task in a worker process, reporting its start to the pool."""
+    _started_tasks.put((task_id, os.getpid()))
+    return func(*args)
+
+
+def _make_sim_dirs(sim):
+    """Create directory structure for simulation described by a dictionary."""
+    return make_dirs(sim.sim_path, data_dirname=sim.get('data_dirname'))
+
+
+def _plan_sim(sim):
+    """Determine the command line of simulation described by a dictionary."""
+    sim.cmd = make_sim_cmd(sim.model_filename, sim.get('params_filename'),
+                           sim.get('sim_id'), sim.get('data_dirname'),
+                           sim.get('executable'), sim.get('model_args'))
+    return sim
+
+
+def _run_sim_in_slot(launch, free_slots, slots, n_threads, nice, ionice,
+                     sim):
+    """Launch simulation in a free CPU slot."""
+    cpus = free_slots.get() if slots else None
+    try:
+        return launch(sim, cpus=cpus, n_threads=n_threads, nice=nice,
+                      ionice=ionice)
+    finally:
+        if slots:
+            free_slots.put(cpus)
+
+
+def _run_sim_with_retries(launch, max_attempts, retry_on, backoff,
+                          backoff_factor, fresh_dir, manifest_filename,
+                          registry, sim):
+    """Launch simulation, retrying it after failures of specific classes."""
+    attempts = []
+    for attempt in range(1, max_attempts + 1):
+        # If requested, move the simulation directory left by the previous
+        # attempt (if any) aside and start over in a fresh one
+        if attempt > 1 and fresh_dir and sim.get('sim_path') is not None:
+            if os.path.exists(sim.sim_path):
+                attempt_sim_path = "{0}.attempt{1}".format(sim.sim_path,
+                                                           attempt - 1)
+                os.rename(sim.sim_path, attempt_sim_path)
+                if registry is not None:
+                    registry.move_sim(sim.sim_path, attempt_sim_path)
+            make_dirs(sim.sim_path, data_dirname=sim.get('data_dirname'))
+
+        # Launch simulation, treating any error raised before the simulation
+        # finishes as a launch error, and if necessary, record the attempt in
+        # the run registry
+        if registry is not None:
+            run_id = registry.add_run(
+                sim.get('sim_id'), sim.get('sim_path'), _plan_sim(sim).cmd,
+                sim.get('params_filename'), attempt, sim.get('params'))
+        start_time = time.time()
+        try:
+            run_info = launch(sim)
+        except Exception:
+            run_info = Dict(exit_status=None, cause='launch',
+                            error=traceback.format_exc())
+        if run_info.get('wall_time') is None:
+            run_info.wall_time = time.time() - start_time
+        run_info.attempt = attempt
+        run_info.failure = classify_failure(run_info)
+        attempts.append(run_info)
+        if registry is not None:
+            if run_info.failure == 'launch':
+                registry.fail_run(run_id, run_info.error)
+            else:
+                registry.finish_run(run_id, run_info)
+
+        # Finish unless the simulation failed in a way that is worth retrying
+        if (run_info.failure not in retry_on
+            or attempt == max_attempts):
+            break
+        time.sleep(backoff * backoff_factor ** (attempt - 1))
+
+    # If necessary, save run information, including all attempts, to a
+    # manifest in the simulation directory (unless the simulation could not be
+    # launched before its directory was created)
+    sim_dirname = sim.get('sim_path') or os.curdir
+    if manifest_filename and os.path.isdir(sim_dirname):
+        manifest = Dict(run_info)
+        manifest.attempts = attempts
+        save_manifest(os.path.join(sim_dirname, manifest_filename), manifest)
+
+    # A simulation that could not be launched has no exit status, so that the
+    # statuses of other simulations in the batch are still returned
+    return run_info.exit_status
+
+
+def _run_sim_with_progress(run, batch_progress, sim):
+    """Launch simulation, recording its start and finish in batch progress."""
+    batch_progress.start_sim()
+    start_time = time.time()
+    exit_status = None
+    try:
+        exit_status = run(sim)
+    finally:
+        batch_progress.finish_sim(exit_status, time.time() - start_time)
+    return exit_status
+
+
+def _run_sim(sim, **kwargs):
+    """Launch simulation described by a dictionary as a child process."""
+    # Determine absolute paths to the model file and the parameter file, since
+    # the simulation runs in its simulation directory
+    params_filename = sim.get('params_filename')
+    cmd = make_sim_cmd(os.path.abspath(sim.model_filename),
+                       os.path.abspath(params_filename)
+                       if params_filename else None,
+                       sim.get('sim_id'), sim.get('data_dirname'),
+                       sim.get('executable'), sim.get('model_args'))
+    return run_sim_cmd(cmd, sim.get('sim_path'), params=sim.get('params'),
+                       **kwargs)
+
+
+def _run_forked_sim(server, sim, **kwargs):
+    """Launch simulation described by a dictionary forked from a server."""
+    exit_status = server.run_sim(
+        sim.model_filename, sim.get('params_filename'), sim.get('sim_id'),
+        sim.get('data_dirname'), sim.get('model_args'), sim.get('sim_path'),
+        params=sim.get('params'), **kwargs)
+    return Dict(exit_status=exit_status)
+
+
+def _run_pooled_sim(sim_pool, sim, **kwargs):
+    """Launch simulation described by a dictionary in a warm worker process."""
+    # Worker processes have been placed on CPUs when they were started, so the
+    # placement arguments are ignored
+    exit_status = sim_pool.run_sim(
+        sim.model_filename, sim.get('params_filename'), sim.get('sim_id'),
+        sim.get('data_dirname'), sim.get('model_args'), sim.get('sim_path'),
+        sim.get('params'))
+    return Dict(exit_status=exit_status)
+
+
+def _run_sim_inproc(sim):
+    """Launch simulation described by a dictionary in-process."""
+    return run_sim_inproc(sim.model_filename, sim.get('params_filename'),
+                          sim.get('sim_id'), sim.get('data_dirname'),
+                          sim.get('model_args'), sim.get('sim_path'),
+                          sim.get('params'))
@@ -5,21 +5,27 @@
 Parameter exporter is a console script that exports parameters of multiple
 simulations to a file. It first loads from a text file the names of parameters
 to be exported along with an optional mapping that defines how these names
-should be substituted with different ones, then loads from another text file
-the names of relevant simulation directories, and finally, as the parameters
-are collected by traversing the simulation directories and loading appropriate
-parameter files, it exports them to a file.
+should be substituted with different ones, then reads from another text file
+(or the standard input) the names of relevant simulation directories, possibly
+as glob patterns, and finally, as the parameters are collected by traversing
+the simulation directories and loading appropriate parameter files, it exports
+them to a file. The names of simulation directories are streamed, so that
+parameters are exported as soon as the first simulation directory is read.
+Parameter files of simulation directories that have been packed into archives
+are read directly from the archives.
 """
 
 __all__ = ['main']
 
 import argparse
+import errno
 import os
 import sys
 
-from simtools.argparse import dir_r_type, file_r_type
+from simtools.archive import ArchiveIndex, is_file
+from simtools.argparse import dir_r_type, file_r_stdin_type, file_r_type
 from simtools.params import export_params, load_paramnames
-from simtools.simrun import load_sim_dirnames
+from simtools.simrun import SHARD_SCHEMES, iter_sim_dirnames
 
 extra_options = {
     'csv': {
@@ -47,6 +53,17 @@ def parse_args():
         "-m", "--master-dir", metavar="MASTERDIR",
         dest='sim_master_dirname', type=dir_r_type,
         help="parent directory of simulation directories")
+    parser.add_argument(
+        "-a", "--archive-dir", metavar="ARCHIVEDIR",
+        dest='archive_dirname', type=dir_r_type,
+        help="look up simulation directories that do not exist in archives "
+             "in ARCHIVEDIR; default: MASTERDIR")
+    parser.add_argument(
+        "--shard", metavar="SCHEME",
+        dest='shard', choices=SHARD_SCHEMES,
+        help="look up bare names of simulation directories in nested shard "
+             "directories of MASTERDIR created according to SCHEME ('hash' "
+             "or 'date')")
     parser.add_argument(
         "-n", "--number",
         dest='with_numbers', action='store_true', default=False,
@@ -57,8 +74,9 @@ def parse_args():
         help="file with names of parameters to export")
     parser.add_argument(
         "sim_dirnames_filename", metavar="SIMDIRFILE",
-        type=file_r_type,
-        help="file with names of simulation directories")
+        type=file_r_stdin_type,
+        help="file with names of simulation directories or glob patterns "
+             "('-' to read them from the standard input)")
     parser.add_argument(
         "params_filename", metavar="PARAMFILE",
         help="name of parameter file")
@@ -119,26 +137,50 @@ def main():
     if not paramnames_map:
         paramnames_map = None
 
-    # Load names of simulation directories from the file with names of
-    # simulation directories
-    sim_dirnames = load_sim_dirnames(args.sim_dirnames_filename)
-
-    # Determine paths to parameter files
-    if args.sim_master_dirname is not None:
-        params_paths = [os.path.join(args.sim_master_dirname, sim_dirname,
-                                     args.params_filename)
-                        for sim_dirname in sim_dirnames]
-    else:
-        params_paths = [os.path.join(sim_dirname, args.params_filename)
-                        for sim_dirname in sim_dirnames]
-    for param_path in params_paths:
-        if not os.path.isfile(param_path):
-            sys.exit("{0}: error: parameter file: no such file: "
-                     "'{1}'".format(os.path.basename(sys.argv[0]), param_path))
-
-    # Export parameters of multiple simulations to a file
-    export_params(args.export_filename, params_paths, paramnames,
-                  paramnames_map, args.with_numbers, **options)
+    # Stream names of simulation directories from the file with names of
+    # simulation directories and determine paths to parameter files
+    sim_dirnames = iter_sim_dirnames(args.sim_dirnames_filename,
+                                     args.sim_master_dirname, shard=args.shard)
+    params_paths = generate_params_paths(
+        sim_dirnames, args.sim_master_dirname, args.params_filename,
+        args.archive_dirname)
+
+    # Export parameters of multiple simulations to a file as the parameter
+    # files are found
+    try:
+        export_params(args.export_filename, params_paths, paramnames,
+                      paramnames_map, args.with_numbers, **options)
+    except IOError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        sys.exit("{0}: error: parameter file: no such file: "
+                 "'{1}'".format(os.path.basename(sys.argv[0]), e.filename))
+
+
+def generate_params_paths(sim_dirnames, sim_master_dirname, params_filename,
+                          archive_dirname=None):
+    """Generate paths to parameter files in simulation directories."""
+    archive_index = None
+    for sim_dirname in sim_dirnames:
+        if sim_master_dirname is not None:
+            params_path = os.path.join(sim_master_dirname, sim_dirname,
+                                       params_filename)
+        else:
+            params_path = os.path.join(sim_dirname, params_filename)
+
+        # If the parameter file does not exist (possibly in an archive the
+        # path passes through), look up the simulation directory in archives,
+        # indexing them when the first one is needed
+        if not is_file(params_path):
+            if archive_index is None:
+                archive_index = ArchiveIndex(
+                    archive_dirname or sim_master_dirname)
+            packed_params_path = archive_index.locate(sim_dirname,
+                                                      params_filename)
+            if packed_params_path is None or not is_file(packed_params_path):
+                raise IOError(errno.ENOENT, "No such file", params_path)
+            params_path = packed_params_path
+        yield params_path
 
 
 if __name__ == '__main__':
@@ -9,20 +9,56 @@ changes the current working directory to the simulation directory, and finally
 launches a simulation as a child process, passing all relevant command line
 arguments to the model. Optionally, before launching the simulation, it can
 also copy the model file as well as an optional parameter file to the
-simulation directory.
+simulation directory, either as regular copies or as hard links, symbolic
+links, or clones sharing data blocks with the originals, or place them in a
+content-addressed store and hard link them from there, or pass parameters to
+the model through an environment variable instead of the parameter file. Also
+optionally, it can limit the wall time, memory, and CPU time of the simulation,
+place it on specific CPUs with a matching thread count and priorities, redirect
+its output to a log file, and after the simulation finishes, save run
+information, including resource usage of the child process, to a manifest in
+the simulation directory or record it in a run registry shared by all
+launchers. It can also create the simulation directory under a partial name
+that is changed to the final one only once the simulation has succeeded, and
+run the simulation in a staging directory on a fast local file system and then
+move the simulation directory to the master directory, or to a quarantine
+directory if the simulation fails.
+
+Instead of launching the simulation, the simulation launcher can also print its
+plan, enqueue it in a spool directory, possibly shared by several computers, or
+run as a worker that claims queued simulations and launches them one after
+another.
 """
 
+from __future__ import print_function
+
 __all__ = ['main']
 
 import argparse
+import functools
+import json
 import os
 import shutil
 import sys
 
-from simtools.argparse import file_r_type
-from simtools.simrun import (TMP_DIR_PREFIX, generate_sim_dirname,
-                             generate_sim_id, make_dirs, norm_executable,
-                             run_sim)
+from simtools.argparse import (cpu_list_type, dir_w_type, file_r_type,
+                               ionice_type, size_type)
+from simtools.base import Dict
+from simtools.batch import plan_batch
+from simtools.params import load_params, PARAMS_ENV_VAR
+from simtools.queue import LEASE_TIMEOUT, SimQueue, run_worker
+from simtools.registry import REGISTRY_FILENAME
+from simtools.simrun import (COPY_MODES, MANIFEST_FILENAME,
+                             PARTIAL_DIR_SUFFIX, SHARD_SCHEMES,
+                             SIM_ID_SCHEMES, TMP_DIR_PREFIX, copy_file,
+                             finalize_sim_dir, generate_partial_dirname,
+                             generate_sim_dirname, generate_sim_id,
+                             is_partial_dirname, make_dirs, move_sim_dir,
+                             norm_executable, reserve_sim_dir, run_sim,
+                             shard_sim_dirname)
+from simtools.store import STORE_DIRNAME, FileStore
+
+QUARANTINE_DIRNAME = ".quarantine"
 
 
 def parse_args():
@@ -56,6 +92,12 @@ def parse_args():
         "-p", "--params", metavar="PARAMFILE",
         dest='params_filename', type=file_r_type,
         help="parameter file")
+    parser.add_argument(
+        "--params-env",
+        dest='params_env', action='store_true',
+        help="load the parameter file once and pass the parameters to the "
+             "model through environment variable {} instead of the "
+             "parameter file".format(PARAMS_ENV_VAR))
     sim_id_group = parser.add_mutually_exclusive_group()
     sim_id_group.add_argument(
         "-i", "--simid", metavar="ID",
@@ -65,6 +107,20 @@ def parse_args():
         "--no-simid",
         dest='with_sim_id', action='store_false', default=True,
         help="do not pass simulation id to the model")
+    parser.add_argument(
+        "--id-scheme", metavar="SCHEME",
+        dest='id_scheme', choices=SIM_ID_SCHEMES, default='datetime',
+        help="generate simulation id according to SCHEME: local date and time "
+             "('datetime'), local date and time with microseconds "
+             "('datetime_us'), the latter followed by host name and process "
+             "id ('unique'), or ULID ('ulid'); default: 'datetime'")
+    parser.add_argument(
+        "--shard", metavar="SCHEME",
+        dest='shard', choices=SHARD_SCHEMES,
+        help="create simulation directory in nested shard directories of "
+             "MASTERDIR according to SCHEME: hash of the name of the "
+             "simulation directory ('hash') or date and hour of the "
+             "simulation id ('date')")
     copy_model_group = parser.add_mutually_exclusive_group()
     copy_model_group.add_argument(
         "--copy-model",
@@ -85,27 +141,239 @@ def parse_args():
         dest='copy_params_filename',
         help="copy the parameter file to the simulation directory as "
              "PARAMFILECOPY")
+    manifest_group = parser.add_mutually_exclusive_group()
+    manifest_group.add_argument(
+        "--manifest",
+        dest='save_manifest', action='store_true',
+        help="save run information, including resource usage, to the "
+             "manifest '{}' in the simulation directory"
+             "".format(MANIFEST_FILENAME))
+    manifest_group.add_argument(
+        "--manifest-file", metavar="MANIFESTFILE",
+        dest='manifest_filename',
+        help="save run information, including resource usage, to the "
+             "manifest MANIFESTFILE in the simulation directory")
+    registry_group = parser.add_mutually_exclusive_group()
+    registry_group.add_argument(
+        "--registry",
+        dest='use_registry', action='store_true',
+        help="record the launch and the outcome of the simulation, including "
+             "resource usage, in the run registry '{}' in the master "
+             "directory".format(REGISTRY_FILENAME))
+    registry_group.add_argument(
+        "--registry-file", metavar="REGISTRYFILE",
+        dest='registry_filename',
+        help="record the launch and the outcome of the simulation, including "
+             "resource usage, in the run registry REGISTRYFILE")
+    parser.add_argument(
+        "--timeout", metavar="SECONDS",
+        dest='timeout', type=float,
+        help="stop the simulation (along with all processes it started) if "
+             "it does not finish within SECONDS")
+    parser.add_argument(
+        "--max-memory", metavar="SIZE",
+        dest='max_memory', type=size_type,
+        help="limit the virtual memory of the simulation to SIZE bytes "
+             "(optionally followed by suffix K, M, G, or T)")
+    parser.add_argument(
+        "--max-cpu-time", metavar="SECONDS",
+        dest='max_cpu_time', type=int,
+        help="limit the CPU time of the simulation to SECONDS")
+    parser.add_argument(
+        "--log", metavar="LOGFILE",
+        dest='log_filename',
+        help="redirect standard output and standard error of the simulation "
+             "to LOGFILE in the simulation directory")
+    parser.add_argument(
+        "--log-max-size", metavar="SIZE",
+        dest='log_max_size', type=size_type,
+        help="after the simulation finishes, truncate the log file to SIZE "
+             "bytes (optionally followed by suffix K, M, G, or T)")
+    parser.add_argument(
+        "--log-compress",
+        dest='compress_log', action='store_true',
+        help="after the simulation finishes, compress the log file with gzip")
+    parser.add_argument(
+        "--cpus", metavar="CPULIST",
+        dest='cpus', type=cpu_list_type,
+        help="run the simulation only on CPUs in CPULIST (for example "
+             "'0-3,8')")
+    parser.add_argument(
+        "--threads", metavar="N",
+        dest='n_threads', type=int,
+        help="limit OpenMP and BLAS libraries used by the simulation to N "
+             "threads; default: the number of CPUs in CPULIST, if specified")
+    parser.add_argument(
+        "--nice", metavar="N",
+        dest='nice', type=int,
+        help="increase the niceness of the simulation by N")
+    parser.add_argument(
+        "--ionice", metavar="CLASS[:LEVEL]",
+        dest='ionice', type=ionice_type,
+        help="run the simulation with I/O scheduling class CLASS (1: "
+             "realtime, 2: best-effort, 3: idle) and priority LEVEL (0-7)")
+    parser.add_argument(
+        "--copy-mode", metavar="MODE",
+        dest='copy_mode', choices=COPY_MODES + ('store', ), default='copy',
+        help="copy files to the simulation directory as regular copies "
+             "('copy'), read-only hard links or, for writable files, "
+             "read-only copies ('hardlink'), clones sharing "
+             "data blocks if supported by the file system ('reflink'), "
+             "symbolic links ('symlink'), or hard links to read-only blobs "
+             "kept in the content-addressed store '{}' in the master "
+             "directory ('store'); default: 'copy'".format(STORE_DIRNAME))
+    parser.add_argument(
+        "--partial",
+        dest='partial', action='store_true',
+        help="create the simulation directory as '{}' and rename it to "
+             "SIMDIR only if the simulation succeeds".format(
+                 generate_partial_dirname("SIMDIR")))
+    parser.add_argument(
+        "--stage-dir", metavar="STAGEDIR",
+        dest='stage_dirname',
+        help="run the simulation in a directory of the same name in STAGEDIR "
+             "(for example on a local or in-memory file system) and, after "
+             "the simulation finishes, move it to the simulation directory")
+    parser.add_argument(
+        "--quarantine-dir", metavar="QUARANTINEDIR",
+        dest='quarantine_dirname',
+        help="move simulations run in STAGEDIR that have failed to "
+             "QUARANTINEDIR instead of the master directory; default: '{}' in "
+             "the master directory".format(QUARANTINE_DIRNAME))
+    queue_group = parser.add_mutually_exclusive_group()
+    queue_group.add_argument(
+        "--plan",
+        dest='plan', action='store_true',
+        help="do not launch the simulation and print its plan (simulation "
+             "id, simulation directory, command line, and parameter file) "
+             "instead")
+    queue_group.add_argument(
+        "--plan-file", metavar="PLANFILE",
+        dest='plan_filename',
+        help="do not launch the simulation and save its plan to PLANFILE "
+             "instead")
+    queue_group.add_argument(
+        "--enqueue", metavar="SPOOLDIR",
+        dest='enqueue_dirname',
+        help="do not launch the simulation and enqueue it in the spool "
+             "directory SPOOLDIR instead")
+    queue_group.add_argument(
+        "--worker", metavar="SPOOLDIR",
+        dest='worker_dirname',
+        help="run as a worker launching simulations enqueued in the spool "
+             "directory SPOOLDIR until there are none left")
+    queue_group.add_argument(
+        "--resume", metavar="SIMDIR",
+        dest='resume_dirname', type=dir_w_type,
+        help="do not create a simulation directory and relaunch the model in "
+             "the existing simulation directory SIMDIR instead, so that it "
+             "continues from its latest checkpoint")
+    parser.add_argument(
+        "--wait",
+        dest='wait', action='store_true',
+        help="keep the worker waiting for new simulations when there are "
+             "none left")
+    parser.add_argument(
+        "--lease-timeout", metavar="SECONDS",
+        dest='lease_timeout', type=float, default=LEASE_TIMEOUT,
+        help="requeue simulations claimed by workers that have not shown "
+             "any sign of life for SECONDS; default: {}".format(LEASE_TIMEOUT))
     parser.add_argument(
         "model_filename", metavar="MODELFILE",
-        type=file_r_type,
-        help="model file")
+        nargs='?', type=file_r_type,
+        help="model file (not used by a worker)")
     parser.add_argument(
         "model_args", metavar="...",
         nargs=argparse.REMAINDER,
         help="optional additional arguments passed to the model file")
     args = parser.parse_args()
-    if not args.executable and not os.access(args.model_filename, os.X_OK):
-        parser.error("argument MODELFILE: permission denied: "
-                     "'{}'".format(args.model_filename))
-    if args.copy_params and not args.params_filename:
-        parser.error("argument --copy-params: requires argument -p/--params")
-    if args.copy_params_filename and not args.params_filename:
-        parser.error("argument --copy-params-rename: requires argument "
-                     "-p/--params")
+    if args.worker_dirname:
+        for arg, option in (('model_filename', "MODELFILE"),
+                            ('executable', "-e/--exec"),
+                            ('sim_dirname', "-s/--sim-dir"),
+                            ('sim_id', "-i/--simid"),
+                            ('data_dirname', "-d/--data-dir"),
+                            ('params_filename', "-p/--params")):
+            if getattr(args, arg):
+                parser.error("argument {}: not allowed with argument "
+                             "--worker".format(option))
+        if args.lease_timeout <= 0:
+            parser.error("argument --lease-timeout: invalid value: expected "
+                         "positive number")
+    else:
+        if args.wait:
+            parser.error("argument --wait: requires argument --worker")
+        if args.resume_dirname:
+            for arg, option in (('sim_dirname', "-s/--sim-dir"),
+                                ('tmp_dir', "-t/--tmp-dir"),
+                                ('partial', "--partial"),
+                                ('shard', "--shard"),
+                                ('stage_dirname', "--stage-dir"),
+                                ('copy_model', "--copy-model"),
+                                ('copy_model_filename',
+                                 "--copy-model-rename"),
+                                ('copy_params', "--copy-params"),
+                                ('copy_params_filename',
+                                 "--copy-params-rename")):
+                if getattr(args, arg):
+                    parser.error("argument {}: not allowed with argument "
+                                 "--resume".format(option))
+        if not args.model_filename:
+            parser.error("the following arguments are required: MODELFILE")
+        if (not args.executable
+                and not os.access(args.model_filename, os.X_OK)):
+            parser.error("argument MODELFILE: permission denied: "
+                         "'{}'".format(args.model_filename))
+        if args.copy_params and not args.params_filename:
+            parser.error("argument --copy-params: requires argument "
+                         "-p/--params")
+        if args.copy_params_filename and not args.params_filename:
+            parser.error("argument --copy-params-rename: requires argument "
+                         "-p/--params")
+        if args.params_env and not args.params_filename:
+            parser.error("argument --params-env: requires argument "
+                         "-p/--params")
     if args.copy_model_filename:
         args.copy_model = True
     if args.copy_params_filename:
         args.copy_params = True
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error("argument --timeout: invalid value: expected positive "
+                     "number")
+    if args.max_cpu_time is not None and args.max_cpu_time <= 0:
+        parser.error("argument --max-cpu-time: invalid value: expected "
+                     "positive number")
+    if args.n_threads is not None and args.n_threads <= 0:
+        parser.error("argument --threads: invalid value: expected positive "
+                     "number")
+    if args.log_max_size is not None and not args.log_filename:
+        parser.error("argument --log-max-size: requires argument --log")
+    if args.compress_log and not args.log_filename:
+        parser.error("argument --log-compress: requires argument --log")
+    if args.quarantine_dirname and not args.stage_dirname:
+        parser.error("argument --quarantine-dir: requires argument "
+                     "--stage-dir")
+    if args.shard == 'date':
+        # Names of simulation directories must start with date and hour
+        if args.sim_dirname or args.sim_id:
+            sim_dirname = args.sim_dirname or generate_sim_dirname(
+                args.tmp_dir, args.sim_id)
+            try:
+                shard_sim_dirname(sim_dirname, args.shard)
+            except ValueError:
+                parser.error("argument --shard: scheme 'date' requires a "
+                             "simulation directory name starting with date "
+                             "and hour: '{}'".format(sim_dirname))
+        elif args.id_scheme == 'ulid':
+            parser.error("argument --shard: scheme 'date' not allowed with "
+                         "argument --id-scheme 'ulid'")
+    if args.save_manifest:
+        args.manifest_filename = MANIFEST_FILENAME
+    if args.use_registry:
+        args.registry_filename = os.path.join(
+            args.sim_master_dirname or os.curdir, REGISTRY_FILENAME)
+    if args.registry_filename:
+        args.registry_filename = os.path.abspath(args.registry_filename)
     return args
 
 
@@ -113,59 +381,219 @@ def main():
     # Process command line arguments
     args = parse_args()
 
-    # If necessary, determine simulation id
-    if args.with_sim_id and not args.sim_id:
-        sim_id = generate_sim_id()
+    # If necessary, normalize the format of the executable
+    if args.executable:
+        executable = norm_executable(args.executable)
     else:
-        sim_id = args.sim_id
+        executable = None
 
-    # If necessary, generate simulation directory name
-    if args.sim_dirname:
-        sim_dirname = args.sim_dirname
+    # If requested, plan simulation, checking that its simulation directory
+    # does not exist yet, instead of launching it
+    if args.plan or args.plan_filename:
+        sim_id = args.sim_id or generate_sim_id(args.id_scheme)
+        if args.sim_dirname:
+            sim_dirname = args.sim_dirname
+            if args.shard:
+                sim_dirname = shard_sim_dirname(sim_dirname, args.shard)
+        else:
+            sim_dirname = generate_sim_dirname(args.tmp_dir, sim_id,
+                                               args.shard)
+        sim = Dict(
+            model_filename=os.path.abspath(args.model_filename),
+            params_filename=(os.path.abspath(args.params_filename)
+                             if args.params_filename else None),
+            sim_id=sim_id if args.with_sim_id else None,
+            data_dirname=args.data_dirname, executable=executable,
+            model_args=args.model_args,
+            sim_path=os.path.abspath(os.path.join(
+                args.sim_master_dirname or os.curdir, sim_dirname)))
+        plan = plan_batch([sim])
+        if args.plan_filename:
+            with open(args.plan_filename, 'w') as plan_file:
+                json.dump(plan, plan_file, indent=4)
+        else:
+            json.dump(plan, sys.stdout, indent=4)
+            print()
+        return 0
+
+    # If requested, enqueue simulation instead of launching it
+    if args.enqueue_dirname:
+        queue = SimQueue(args.enqueue_dirname)
+        if args.params_env:
+            job_id = queue.put(args.model_filename, None, args.data_dirname,
+                               executable, args.model_args,
+                               load_params(args.params_filename))
+        else:
+            job_id = queue.put(args.model_filename, args.params_filename,
+                               args.data_dirname, executable, args.model_args)
+        print(job_id)
+        return 0
+
+    # If necessary, open the content-addressed store and use it for copying
+    # files to the simulation directory
+    if args.copy_mode == 'store':
+        store = FileStore(os.path.join(args.sim_master_dirname or os.curdir,
+                                       STORE_DIRNAME))
+        copy = store.place
+    else:
+        copy = functools.partial(copy_file, mode=args.copy_mode)
+
+    # If requested, run as a worker launching enqueued simulations
+    if args.worker_dirname:
+        queue = SimQueue(args.worker_dirname, args.lease_timeout)
+        run_worker(queue, args.sim_master_dirname, tmp=args.tmp_dir,
+                   id_scheme=args.id_scheme, wait=args.wait,
+                   launch=functools.partial(launch_sim, args, copy),
+                   partial=args.partial, shard=args.shard,
+                   registry_filename=args.registry_filename)
+        return 0
+
+    if args.resume_dirname:
+        # Relaunch simulation in its existing simulation directory, using the
+        # simulation id from the name of the directory unless specified
+        sim_path = args.resume_dirname
+        if args.with_sim_id and not args.sim_id:
+            sim_id = resume_sim_id(sim_path)
+        else:
+            sim_id = args.sim_id
+    elif not args.sim_id and not args.sim_dirname:
+        # Create directory structure for simulation, generating simulation id
+        # and reserving a uniquely named simulation directory
+        sim_id, sim_path = reserve_sim_dir(
+            args.sim_master_dirname, args.data_dirname, args.tmp_dir,
+            args.id_scheme, partial=args.partial, shard=args.shard)
+    else:
+        # If necessary, determine simulation id
+        if args.with_sim_id and not args.sim_id:
+            sim_id = generate_sim_id(args.id_scheme)
+        else:
+            sim_id = args.sim_id
+
+        # If necessary, generate simulation directory name
+        if args.sim_dirname:
+            sim_dirname = args.sim_dirname
+        else:
+            sim_dirname = generate_sim_dirname(args.tmp_dir, sim_id)
+
+        # Create directory structure for simulation
+        sim_path = make_dirs(sim_dirname, args.sim_master_dirname,
+                             args.data_dirname, args.partial, args.shard)
+
+    # Launch simulation
+    sim = Dict(model_filename=args.model_filename,
+               params_filename=args.params_filename, sim_id=sim_id,
+               data_dirname=args.data_dirname, executable=executable,
+               model_args=args.model_args, sim_path=sim_path)
+    exit_status = launch_sim(args, copy, sim)
+
+    # If necessary, rename the simulation directory to its final name once the
+    # simulation has succeeded
+    if (exit_status == 0
+            and (args.partial
+                 or args.resume_dirname and is_partial_dirname(sim_path))):
+        finalize_sim_dir(sim_path, args.registry_filename,
+                         args.manifest_filename)
+    return exit_status
+
+
+def launch_sim(args, copy, sim):
+    """Launch simulation, if requested, in the staging directory."""
+    # If requested, run the simulation in a directory of the same name in the
+    # staging directory, keeping the simulation directory as a placeholder
+    final_sim_path = os.path.abspath(sim.sim_path)
+    if args.stage_dirname:
+        sim_path = os.path.abspath(make_dirs(
+            os.path.basename(final_sim_path), args.stage_dirname,
+            sim.data_dirname))
     else:
-        sim_dirname = generate_sim_dirname(args.tmp_dir, sim_id)
+        sim_path = final_sim_path
 
-    # Create directory structure for simulation
-    sim_path = make_dirs(sim_dirname, args.sim_master_dirname,
-                         args.data_dirname)
+    # Launch the simulation, removing both the staged simulation directory and
+    # its placeholder if the simulation cannot be launched
+    try:
+        exit_status = _launch_sim(args, copy, sim, sim_path)
+    except Exception:
+        if args.stage_dirname:
+            shutil.rmtree(sim_path, ignore_errors=True)
+            shutil.rmtree(final_sim_path, ignore_errors=True)
+        raise
 
+    # If necessary, move the staged simulation directory to replace its
+    # placeholder or, if the simulation has failed, to the quarantine
+    # directory
+    if args.stage_dirname:
+        if exit_status == 0:
+            move_sim_dir(sim_path, final_sim_path,
+                         registry_filename=args.registry_filename,
+                         manifest_filename=args.manifest_filename)
+        else:
+            quarantine_dirname = args.quarantine_dirname or os.path.join(
+                os.path.dirname(final_sim_path), QUARANTINE_DIRNAME)
+            if not os.path.isdir(quarantine_dirname):
+                os.makedirs(quarantine_dirname)
+            move_sim_dir(sim_path, os.path.join(
+                quarantine_dirname, os.path.basename(final_sim_path)),
+                registry_filename=args.registry_filename,
+                manifest_filename=args.manifest_filename)
+            shutil.rmtree(final_sim_path)
+    return exit_status
+
+
+def _launch_sim(args, copy, sim, sim_path):
+    """Copy files to the simulation directory and launch simulation."""
     # Determine the absolute path to the model file
-    model_path = os.path.abspath(args.model_filename)
+    model_path = os.path.abspath(sim.model_filename)
 
     # If necessary, copy the model file to the simulation directory
     if args.copy_model:
         if args.copy_model_filename:
-            shutil.copy(
-                model_path, os.path.join(sim_path, args.copy_model_filename))
+            copy(model_path, os.path.join(sim_path, args.copy_model_filename))
         else:
-            shutil.copy(model_path, sim_path)
+            copy(model_path, sim_path)
 
     # If necessary, determine the absolute path to the parameter file
-    if args.params_filename:
-        params_path = os.path.abspath(args.params_filename)
+    if sim.params_filename:
+        params_path = os.path.abspath(sim.params_filename)
     else:
         params_path = None
 
     # If necessary, copy the parameter file to the simulation directory
-    if args.copy_params:
+    if args.copy_params and params_path:
         if args.copy_params_filename:
-            shutil.copy(
-                params_path, os.path.join(sim_path, args.copy_params_filename))
+            copy(params_path,
+                 os.path.join(sim_path, args.copy_params_filename))
         else:
-            shutil.copy(params_path, sim_path)
+            copy(params_path, sim_path)
 
-    # If necessary, normalize the format of the executable
-    if args.executable:
-        executable = norm_executable(args.executable)
-    else:
-        executable = None
+    # If requested, load parameters once and pass them to the model through an
+    # environment variable instead of the parameter file
+    params = sim.get('params')
+    if args.params_env and params_path:
+        params = load_params(params_path)
+        params_path = None
 
-    # Go to the simulation directory
-    os.chdir(sim_path)
+    # Launch simulation in the simulation directory
+    return run_sim(
+        model_path, params_path, sim.sim_id if args.with_sim_id else None,
+        sim.data_dirname, sim.executable, sim.model_args, sim_path,
+        params=params, manifest_filename=args.manifest_filename,
+        registry_filename=args.registry_filename, timeout=args.timeout,
+        max_memory=args.max_memory, max_cpu_time=args.max_cpu_time,
+        stdout=args.log_filename, stderr=args.log_filename,
+        log_max_size=args.log_max_size, compress_logs=args.compress_log,
+        cpus=args.cpus, n_threads=args.n_threads, nice=args.nice,
+        ionice=args.ionice)
 
-    # Launch simulation
-    return run_sim(model_path, params_path, sim_id, args.data_dirname,
-                   executable, args.model_args)
+
+def resume_sim_id(sim_path):
+    """Determine simulation id from the name of its simulation directory."""
+    sim_dirname = os.path.basename(os.path.normpath(os.path.abspath(sim_path)))
+    if is_partial_dirname(sim_dirname):
+        sim_dirname = sim_dirname[len(TMP_DIR_PREFIX):
+                                  -len(PARTIAL_DIR_SUFFIX)]
+    if sim_dirname.startswith(TMP_DIR_PREFIX):
+        sim_dirname = sim_dirname[len(TMP_DIR_PREFIX):]
+    return sim_dirname
 
 
 if __name__ == '__main__':
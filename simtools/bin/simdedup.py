@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Simulation file deduplicator.
+
+Simulation file deduplicator is a console script that reduces disk and inode
+usage of simulation directories. It first finds all regular files in the
+specified directories, then computes in parallel the hashes of the contents of
+those files whose sizes are not unique, and finally replaces each group of
+identical files with hard links to a single read-only blob kept in a
+content-addressed store.
+"""
+
+from __future__ import print_function
+
+__all__ = ['main']
+
+import argparse
+import errno
+import os
+import sys
+
+from simtools.argparse import dir_w_type
+from simtools.store import STORE_DIRNAME, dedup_files, FileStore, find_files
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Merge identical files in simulation directories.")
+    parser.add_argument(
+        "-j", "--jobs", metavar="N",
+        dest='n_workers', type=int,
+        help="compute hashes of files in N parallel threads")
+    parser.add_argument(
+        "--min-size", metavar="BYTES",
+        dest='min_size', type=int, default=1,
+        help="skip files smaller than BYTES bytes; default: 1")
+    parser.add_argument(
+        "-S", "--store", metavar="STOREDIR",
+        dest='store_dirname',
+        help="keep blobs in STOREDIR; default: '{}' in the first DIR"
+             "".format(STORE_DIRNAME))
+    parser.add_argument(
+        "dirnames", metavar="DIR",
+        nargs='+', type=dir_w_type,
+        help="directory to search for identical files (for example the "
+             "master directory)")
+    args = parser.parse_args()
+    if args.n_workers is not None and args.n_workers <= 0:
+        parser.error("argument -j/--jobs: invalid value: expected positive "
+                     "number")
+    return args
+
+
+def main():
+    # Process command line arguments
+    args = parse_args()
+
+    # Open the content-addressed store
+    if args.store_dirname:
+        store_dirname = args.store_dirname
+    else:
+        store_dirname = os.path.join(args.dirnames[0], STORE_DIRNAME)
+    store = FileStore(store_dirname)
+
+    # Merge identical files, which is possible only if they are on the same
+    # file system as the store
+    try:
+        n_merged, n_bytes_saved = dedup_files(
+            find_files(args.dirnames, args.min_size), store, args.n_workers)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        sys.exit("{0}: error: file is not on the same file system as the "
+                 "store: '{1}' (use argument --store)".format(
+                     os.path.basename(sys.argv[0]), e.filename))
+    print("Merged {0} files, saving {1} bytes.".format(n_merged,
+                                                       n_bytes_saved))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Simulation lister.
+
+Simulation lister is a console script that reports the status of simulations
+recorded in a run registry without scanning simulation directories. By default,
+it prints the numbers of simulations in each status; optionally, it lists the
+simulations that failed, the slowest simulations, or all simulations in a
+specific status, in each case possibly restricted to simulations with specific
+values of parameters.
+"""
+
+from __future__ import print_function
+
+__all__ = ['main']
+
+import argparse
+import json
+import os
+import sys
+
+from simtools.registry import REGISTRY_FILENAME, RUN_STATUSES, Registry
+
+LIST_COLUMNS = ('sim_id', 'status', 'exit_status', 'wall_time', 'max_rss',
+                'sim_path')
+
+
+def param_type(param):
+    """Parse parameter name and value in the format 'NAME=VALUE'."""
+    name, sep, value = param.partition("=")
+    if not name or not sep:
+        raise argparse.ArgumentTypeError(
+            "invalid parameter: '{}'".format(param))
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return name, value
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Report status of simulations recorded in a run "
+                    "registry.")
+    registry_group = parser.add_mutually_exclusive_group()
+    registry_group.add_argument(
+        "-m", "--master-dir", metavar="MASTERDIR",
+        dest='sim_master_dirname',
+        help="use the run registry '{}' in MASTERDIR"
+             "".format(REGISTRY_FILENAME))
+    registry_group.add_argument(
+        "-r", "--registry-file", metavar="REGISTRYFILE",
+        dest='registry_filename',
+        help="use the run registry REGISTRYFILE")
+    parser.add_argument(
+        "-w", "--where", metavar="NAME=VALUE",
+        dest='params', type=param_type, action='append',
+        help="consider only simulations whose parameter NAME is equal to "
+             "VALUE (may be repeated)")
+    list_group = parser.add_mutually_exclusive_group()
+    list_group.add_argument(
+        "-s", "--status", metavar="STATUS",
+        dest='status', choices=RUN_STATUSES,
+        help="list simulations in STATUS ({})".format(
+            ", ".join("'{}'".format(status) for status in RUN_STATUSES)))
+    list_group.add_argument(
+        "-f", "--failed",
+        dest='failed', action='store_true',
+        help="list simulations that failed or could not be launched")
+    list_group.add_argument(
+        "--slowest", metavar="N",
+        dest='n_slowest', type=int,
+        help="list N slowest finished simulations")
+    parser.add_argument(
+        "--json",
+        dest='json', action='store_true',
+        help="print results in JSON format")
+    args = parser.parse_args()
+    if args.n_slowest is not None and args.n_slowest <= 0:
+        parser.error("argument --slowest: invalid value: expected positive "
+                     "number")
+    if not args.registry_filename:
+        args.registry_filename = os.path.join(
+            args.sim_master_dirname or os.curdir, REGISTRY_FILENAME)
+    if not os.path.isfile(args.registry_filename):
+        parser.error("run registry: no such file: '{}'".format(
+            args.registry_filename))
+    args.params = dict(args.params or [])
+    return args
+
+
+def main():
+    # Process command line arguments
+    args = parse_args()
+    registry = Registry(args.registry_filename, read_only=True)
+
+    # If no simulations are to be listed, print the numbers of simulations in
+    # each status
+    if not (args.status or args.failed or args.n_slowest):
+        counts = registry.count_runs(args.params)
+        if args.json:
+            print(json.dumps(counts, indent=4))
+        else:
+            for status in RUN_STATUSES:
+                print("{0:<8} {1}".format(status, counts[status]))
+            print("{0:<8} {1}".format("total", sum(counts.values())))
+        return 0
+
+    # Find simulations to be listed
+    if args.n_slowest:
+        runs = registry.find_runs(('done', 'failed'), args.params,
+                                  order_by='wall_time', descending=True,
+                                  limit=args.n_slowest)
+    elif args.failed:
+        runs = registry.find_runs(('failed', 'error'), args.params)
+    else:
+        runs = registry.find_runs(args.status, args.params)
+
+    # Print simulations
+    if args.json:
+        print(json.dumps(runs, indent=4))
+    else:
+        for run in runs:
+            print("\t".join("" if run[column] is None else str(run[column])
+                            for column in LIST_COLUMNS))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
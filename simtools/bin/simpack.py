@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Simulation packer.
+
+Simulation packer is a console script that reduces inode usage of simulation
+directories. It packs complete simulation directories, either all those in the
+master directory or those listed in a text file (or the standard input), into
+zip archives containing a fixed number of simulation directories each, along
+with an index of the simulation directories packed into each archive.
+Simulation directories that have already been packed are skipped, and so are,
+optionally, simulation directories whose run manifest does not record that the
+simulation has finished. Once an archive has been written, the simulation
+directories packed into it may be removed, provided that they have been checked
+to be finished. Files packed into the archives can be read directly, without
+extracting the archives.
+"""
+
+from __future__ import print_function
+
+__all__ = ['main']
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+
+from simtools.archive import (PACK_SIZE, ArchiveIndex,
+                              generate_archive_filename, pack_sim_dirs)
+from simtools.argparse import dir_r_type, dir_w_type, file_r_stdin_type
+from simtools.simrun import (MANIFEST_FILENAME, SHARD_SCHEMES,
+                             iter_sim_dirnames, list_sim_dirnames)
+
+# Names of shard directories (two hexadecimal digits of the hash or the date)
+SHARD_DIRNAME = re.compile(r"^(?:[0-9a-f]{2}|[0-9]{8})$")
+
+
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Pack simulation directories into archives.")
+    parser.add_argument(
+        "-m", "--master-dir", metavar="MASTERDIR",
+        dest='sim_master_dirname', type=dir_r_type,
+        help="parent directory of simulation directories")
+    parser.add_argument(
+        "--shard", metavar="SCHEME",
+        dest='shard', choices=SHARD_SCHEMES,
+        help="look up simulation directories in nested shard directories of "
+             "MASTERDIR created according to SCHEME ('hash' or 'date')")
+    parser.add_argument(
+        "-f", "--sim-dirs-file", metavar="SIMDIRFILE",
+        dest='sim_dirnames_filename', type=file_r_stdin_type,
+        help="pack simulation directories listed in SIMDIRFILE ('-' to read "
+             "them from the standard input) instead of all complete "
+             "simulation directories in MASTERDIR")
+    parser.add_argument(
+        "-o", "--archive-dir", metavar="ARCHIVEDIR",
+        dest='archive_dirname', type=dir_w_type,
+        help="save archives in ARCHIVEDIR; default: MASTERDIR")
+    parser.add_argument(
+        "-n", "--pack-size", metavar="N",
+        dest='pack_size', type=int, default=PACK_SIZE,
+        help="pack N simulation directories into each archive; default: "
+             "{}".format(PACK_SIZE))
+    parser.add_argument(
+        "--no-compress",
+        dest='compress', action='store_false', default=True,
+        help="store files in archives without compressing them")
+    manifest_group = parser.add_mutually_exclusive_group()
+    manifest_group.add_argument(
+        "--manifest",
+        dest='use_manifest', action='store_true',
+        help="pack only simulation directories whose run manifest '{}' "
+             "records that the simulation has finished".format(
+                 MANIFEST_FILENAME))
+    manifest_group.add_argument(
+        "--manifest-file", metavar="MANIFESTFILE",
+        dest='manifest_filename',
+        help="pack only simulation directories whose run manifest "
+             "MANIFESTFILE records that the simulation has finished")
+    parser.add_argument(
+        "--remove",
+        dest='remove', action='store_true',
+        help="remove simulation directories once they have been packed "
+             "(requires argument --manifest or --manifest-file)")
+    args = parser.parse_args()
+    if args.pack_size <= 0:
+        parser.error("argument -n/--pack-size: invalid value: expected "
+                     "positive number")
+    if args.use_manifest:
+        args.manifest_filename = MANIFEST_FILENAME
+    if args.remove and not args.manifest_filename:
+        parser.error("argument --remove: requires argument --manifest or "
+                     "--manifest-file")
+    return args
+
+
+def main():
+    # Process command line arguments
+    args = parse_args()
+    sim_master_dirname = args.sim_master_dirname or os.curdir
+    archive_dirname = args.archive_dirname or sim_master_dirname
+
+    # Determine names of simulation directories to be packed, skipping those
+    # that have already been packed
+    if args.sim_dirnames_filename:
+        sim_dirnames = iter_sim_dirnames(args.sim_dirnames_filename,
+                                         sim_master_dirname, shard=args.shard)
+    else:
+        sim_dirnames = list_sim_dirnames(sim_master_dirname, args.shard)
+
+        # Refuse to pack shard directories as if they were simulation
+        # directories
+        if not args.shard and any(SHARD_DIRNAME.match(sim_dirname)
+                                  for sim_dirname in sim_dirnames):
+            sys.exit("{0}: error: master directory appears to be sharded: "
+                     "'{1}' (use argument --shard)".format(
+                         os.path.basename(sys.argv[0]), sim_master_dirname))
+    archive_index = ArchiveIndex(archive_dirname)
+    sim_dirnames = [sim_dirname for sim_dirname in sim_dirnames
+                    if sim_dirname not in archive_index]
+
+    # If requested, skip simulation directories of simulations that have not
+    # finished (for example those that are still running)
+    if args.manifest_filename:
+        sim_dirnames = [
+            sim_dirname for sim_dirname in sim_dirnames
+            if is_finished(os.path.join(sim_master_dirname, sim_dirname),
+                           args.manifest_filename)]
+
+    # Pack simulation directories into archives of a fixed number of
+    # simulation directories each and, if requested, remove them once each
+    # archive has been written
+    n_archives = 0
+    for start in range(0, len(sim_dirnames), args.pack_size):
+        packed_dirnames = sim_dirnames[start:start + args.pack_size]
+        archive_filename = os.path.join(
+            archive_dirname, generate_archive_filename(archive_dirname))
+        pack_sim_dirs(archive_filename, packed_dirnames, sim_master_dirname,
+                      args.compress)
+        n_archives += 1
+        if args.remove:
+            for sim_dirname in packed_dirnames:
+                shutil.rmtree(os.path.join(sim_master_dirname, sim_dirname))
+    print("Packed {0} simulation directories into {1} archives.".format(
+        len(sim_dirnames), n_archives))
+
+
+def is_finished(sim_path, manifest_filename):
+    """Check if run manifest of a simulation records that it has finished."""
+    try:
+        with open(os.path.join(sim_path, manifest_filename)) as manifest_file:
+            run_info = json.load(manifest_file)
+    except (IOError, ValueError):
+        return False
+    return isinstance(run_info, dict) and bool(run_info.get('end_time'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""Checkpoint services.
+
+Checkpoint services provide the following functionality:
+
+- saving the state of a simulation to a compressed checkpoint file
+  atomically, so that an interrupted save never corrupts the latest
+  checkpoint;
+- loading the state of a simulation from the latest checkpoint, if any;
+- saving checkpoints periodically from the main loop of a model script, as
+  well as when the simulation is asked to stop by a signal (such as SIGTERM
+  sent on preemption), after which the simulation exits.
+"""
+
+import gzip
+import os
+import pickle
+import signal
+import sys
+import tempfile
+import time
+
+from simtools.base import Dict, replace_file
+
+CHECKPOINT_FILENAME = "checkpoint.pkl.gz"
+CHECKPOINT_INTERVAL = 600.0  # seconds
+CHECKPOINT_SIGNALS = ('SIGTERM', 'SIGUSR1')
+
+
+class Checkpoint(object):
+    """Checkpoint of the state of a simulation."""
+
+    def __init__(self, filename=CHECKPOINT_FILENAME,
+                 interval=CHECKPOINT_INTERVAL, signals=CHECKPOINT_SIGNALS,
+                 exit_on_signal=True):
+        # Validate checkpoint interval
+        if interval is not None and interval <= 0:
+            raise ValueError("'interval' is not positive.")
+
+        self.filename = filename
+        self.interval = interval
+        self.signals = signals
+        self.exit_on_signal = exit_on_signal
+        self.n_saves = 0
+        self._get_state = None
+        self._last_save_time = time.time()
+        self._signum = None
+        self._handlers_installed = False
+
+    def register(self, get_state):
+        """Register function returning the state of the simulation."""
+        if not callable(get_state):
+            raise TypeError("'get_state' is not callable.")
+        self._get_state = get_state
+        self._install_handlers()
+
+    def load(self):
+        """Load the state of the simulation from the latest checkpoint."""
+        if not os.path.isfile(self.filename):
+            return None
+        return load_checkpoint(self.filename)
+
+    def save(self, state=None):
+        """Save the state of the simulation to a checkpoint."""
+        if state is None:
+            if self._get_state is None:
+                raise ValueError("State of the simulation is not registered.")
+            state = self._get_state()
+        save_checkpoint(self.filename, state)
+        self._last_save_time = time.time()
+        self.n_saves += 1
+
+    def maybe_save(self, state=None):
+        """Save a checkpoint if it is due or has been requested by a signal."""
+        self._install_handlers()
+
+        # If a signal has requested a checkpoint, save it and, if requested,
+        # exit with the status of a process terminated by the signal
+        signum = self._signum
+        if signum is not None:
+            self._signum = None
+            self.save(state)
+            if self.exit_on_signal:
+                sys.exit(128 + signum)
+            return True
+
+        # Save a checkpoint if the checkpoint interval has elapsed
+        if (self.interval is not None
+                and time.time() - self._last_save_time >= self.interval):
+            self.save(state)
+            return True
+        return False
+
+    def _install_handlers(self):
+        """Install handlers of signals requesting a checkpoint, if needed."""
+        # Install the handlers only once the model registers its state or
+        # polls for checkpoints, so that a model that never saves checkpoints
+        # keeps the default handling of the signals. The handlers only record
+        # the signal so that the state is saved at a consistent point of the
+        # main loop (signal handlers can be installed only in the main thread)
+        if self._handlers_installed:
+            return
+        self._handlers_installed = True
+        for signal_name in self.signals or []:
+            signum = getattr(signal, signal_name, None)
+            if signum is None:
+                continue
+            try:
+                signal.signal(signum, self._handle_signal)
+            except ValueError:
+                pass
+
+    def _handle_signal(self, signum, frame):
+        """Record a signal requesting a checkpoint."""
+        self._signum = signum
+
+
+def load_checkpoint(filename):
+    """Load the state of a simulation from a checkpoint file."""
+    with gzip.open(filename, 'rb') as checkpoint_file:
+        state = pickle.load(checkpoint_file)
+    return Dict(state) if isinstance(state, dict) else state
+
+
+def save_checkpoint(filename, state, compress_level=6):
+    """Save the state of a simulation to a checkpoint file atomically."""
+    # Write the checkpoint to a temporary file in the same directory, flushing
+    # it to the disk, and then replace the previous checkpoint with a single
+    # rename
+    dirname = os.path.dirname(os.path.abspath(filename))
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=dirname, prefix="." + os.path.basename(filename), suffix=".tmp")
+    try:
+        with os.fdopen(tmp_fd, 'wb') as tmp_file:
+            with gzip.GzipFile(fileobj=tmp_file, mode='wb',
+                               compresslevel=compress_level) as gzip_file:
+                pickle.dump(state, gzip_file, pickle.HIGHEST_PROTOCOL)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        replace_file(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
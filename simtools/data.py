@@ -0,0 +1,573 @@
+# -*- coding: utf-8 -*-
+"""Data recording services.
+
+Data recording services provide the following functionality:
+
+- recording data generated by a model, one record per step, into typed chunks
+  of a fixed size instead of growing lists of Python objects;
+- flushing full chunks to a binary file, either in the NumPy format (`.npy`)
+  or as raw data described by a metadata file, so that memory usage does not
+  grow with the duration of a simulation;
+- recording the data type and the shape of the data along with the data;
+- recording only every specified number of steps or once per specified
+  interval of simulation time;
+- keeping only the latest records in a ring buffer of a fixed size;
+- writing full chunks in a background thread, so that recording data does not
+  wait for the file to be written;
+- computing running statistics of data (the mean, the variance, the minimum,
+  the maximum, and a histogram) incrementally and element-wise, without
+  recording the data;
+- loading recorded data as a NumPy array, possibly memory-mapped (if NumPy is
+  available), or otherwise as a flat typed array.
+"""
+
+import array
+import json
+import math
+import mmap
+import re
+import struct
+import sys
+import threading
+
+from simtools.base import Dict, flatten
+
+if sys.version_info[0] == 3:
+    import queue
+else:
+    import Queue as queue
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CHUNK_SIZE = 1 << 16  # records
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_SIZE = 128
+NPY_HEADER_ALIGNMENT = 64
+MAX_NPY_HEADER_LENGTH = 0xffff
+MAX_PENDING_CHUNKS = 4
+METADATA_SUFFIX = ".json"
+
+_NPY_DESCR = re.compile(r"'descr':\s*'([^']*)'")
+_NPY_SHAPE = re.compile(r"'shape':\s*\(([^)]*)\)")
+
+
+def _find_typecodes():
+    """Map data types to type codes of typed arrays supported here."""
+    typecodes = {}
+    for typecode in "bBhHiIlLqQfd":
+        try:
+            itemsize = array.array(typecode).itemsize
+        except ValueError:
+            continue
+        if typecode in "fd":
+            kind = 'f'
+        elif typecode.islower():
+            kind = 'i'
+        else:
+            kind = 'u'
+        typecodes.setdefault("{0}{1}".format(kind, itemsize), typecode)
+    return typecodes
+
+
+DTYPE_TYPECODES = _find_typecodes()
+
+
+def typed_array(values, dtype='f8'):
+    """Convert a NumPy array of values to a flat typed array."""
+    items = array.array(DTYPE_TYPECODES[dtype])
+    data = numpy.ascontiguousarray(values, dtype).tobytes()
+    if hasattr(items, 'frombytes'):
+        items.frombytes(data)
+    else:
+        items.fromstring(data)
+    return items
+
+
+class Recorder(object):
+    """Recorder of data generated by a model into a binary file."""
+
+    def __init__(self, filename, dtype='f8', shape=(),
+                 chunk_size=CHUNK_SIZE, every=None, interval=None,
+                 ring_size=None, background=False):
+        # Validate data type, shape of records, chunk size, and recording
+        # modes
+        if dtype not in DTYPE_TYPECODES:
+            raise ValueError("Data type '{}' is not supported.".format(dtype))
+        shape = tuple(int(n) for n in shape)
+        if any(n <= 0 for n in shape):
+            raise ValueError("'shape' contains values that are not positive.")
+        if chunk_size <= 0:
+            raise ValueError("'chunk_size' is not positive.")
+        if every is not None and every <= 0:
+            raise ValueError("'every' is not positive.")
+        if interval is not None and interval <= 0:
+            raise ValueError("'interval' is not positive.")
+        if every is not None and interval is not None:
+            raise ValueError("'every' and 'interval' are both specified.")
+        if ring_size is not None and ring_size <= 0:
+            raise ValueError("'ring_size' is not positive.")
+
+        self.filename = filename
+        self.dtype = dtype
+        self.shape = shape
+        self.chunk_size = chunk_size
+        self.every = every
+        self.interval = interval
+        self.ring_size = ring_size
+        self.n_records = 0
+        self._n_items = 1
+        for n in shape:
+            self._n_items *= n
+        self._chunk_length = chunk_size * self._n_items
+        self._npy = filename.lower().endswith(".npy")
+        self._n_steps = 0
+        self._next_time = None
+        self._new_chunk()
+
+        # In the ring buffer mode, keep at most twice as many records as the
+        # size of the ring buffer, so that the oldest records are dropped only
+        # once in a while
+        if ring_size is not None:
+            self._ring_length = ring_size * self._n_items
+            self._chunk_length = 2 * self._ring_length
+
+        # Determine the space reserved for the header of a NumPy file, so
+        # that the header fits in it for any number of records
+        if self._npy:
+            header_size = (len(NPY_MAGIC) + 2
+                           + len(self._npy_header(1 << 64)) + 1)
+            header_size = max(NPY_HEADER_SIZE, -(-header_size //
+                              NPY_HEADER_ALIGNMENT) * NPY_HEADER_ALIGNMENT)
+            if header_size - len(NPY_MAGIC) - 2 > MAX_NPY_HEADER_LENGTH:
+                raise ValueError("Header of NumPy file is too long.")
+            self._header_size = header_size
+
+        # Create the file, reserving space for the header of a NumPy file
+        self._file = open(filename, 'wb')
+        if self._npy:
+            self._file.write(b"\0" * self._header_size)
+        self._save_metadata()
+
+        # If requested, write full chunks in a background thread, so that
+        # recording data never waits for the file to be written unless too
+        # many chunks are pending
+        self._queue = None
+        self._thread = None
+        self._error = None
+        if background:
+            self._queue = queue.Queue(MAX_PENDING_CHUNKS)
+            self._thread = threading.Thread(target=self._write_chunks)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, record, time=None):
+        """Record data of a single step, unless it is skipped."""
+        # If requested, record only every specified number of steps or once
+        # per specified interval of simulation time
+        if self.every is not None:
+            self._n_steps += 1
+            if (self._n_steps - 1) % self.every:
+                return
+        elif self.interval is not None:
+            if time is None:
+                raise ValueError("'time' is not specified.")
+            if self._next_time is None:
+                self._next_time = time
+            if time < self._next_time:
+                return
+            self._next_time += self.interval * (
+                math.floor((time - self._next_time) / self.interval) + 1)
+
+        # Add the record to the current chunk and, once the chunk is full,
+        # pass it to be written or, in the ring buffer mode, drop the oldest
+        # records
+        self._add(record)
+        if len(self._chunk) >= self._chunk_length:
+            self._full_chunk()
+
+    def extend(self, records):
+        """Record data of multiple steps."""
+        # If possible, add records of a NumPy array to the current chunk in
+        # bulk rather than one by one
+        if (numpy is not None and isinstance(records, numpy.ndarray)
+                and self.every is None and self.interval is None):
+            if records.shape[1:] != self.shape:
+                raise ValueError("Shape of records is not {}.".format(
+                    self.shape))
+            for start in range(0, len(records), self.chunk_size):
+                self._chunk.extend(typed_array(
+                    records[start:start + self.chunk_size], self.dtype))
+                if len(self._chunk) >= self._chunk_length:
+                    self._full_chunk()
+            return
+        for record in records:
+            self.append(record)
+
+    def flush(self):
+        """Write recorded data to the file (except in the ring buffer mode)."""
+        if self.ring_size is None:
+            self._pass_chunk()
+            if self._queue is not None:
+                self._queue.join()
+        self._check_error()
+
+    def close(self):
+        """Write recorded data to the file and close it."""
+        if self._file.closed:
+            return
+        try:
+            # In the ring buffer mode, write only the latest records
+            if self.ring_size is not None:
+                del self._chunk[:-self._ring_length]
+            self._pass_chunk()
+        finally:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+            self._file.close()
+        self._check_error()
+
+    @property
+    def descr(self):
+        """Data type in the NumPy format, including the byte order."""
+        byte_order = "<" if sys.byteorder == 'little' else ">"
+        return byte_order + self.dtype
+
+    def _new_chunk(self):
+        """Start a new chunk of records."""
+        # Add records to the chunk with a bound method of the typed array, so
+        # that recording a step costs a single call into native code
+        self._chunk = array.array(DTYPE_TYPECODES[self.dtype])
+        if self.shape:
+            self._add = self._chunk.extend
+        else:
+            self._add = self._chunk.append
+
+    def _full_chunk(self):
+        """Pass the full chunk or, in the ring buffer mode, drop records."""
+        if self.ring_size is not None:
+            del self._chunk[:-self._ring_length]
+        else:
+            self._pass_chunk()
+
+    def _pass_chunk(self):
+        """Pass the current chunk to be written to the file."""
+        chunk = self._chunk
+        if len(chunk) % self._n_items:
+            raise ValueError("Last record is incomplete.")
+
+        # Write the chunk directly or hand it over to the background thread
+        # and start a new one
+        if self._queue is None:
+            self._write_chunk(chunk)
+            del chunk[:]
+        else:
+            self._check_error()
+            self._queue.put(chunk)
+            self._new_chunk()
+
+    def _write_chunk(self, chunk):
+        """Write a chunk of records to the file."""
+        chunk.tofile(self._file)
+        self.n_records += len(chunk) // self._n_items
+        self._save_metadata()
+        self._file.flush()
+
+    def _write_chunks(self):
+        """Write chunks of records passed to the background thread."""
+        while True:
+            chunk = self._queue.get()
+            try:
+                if chunk is None:
+                    return
+                if self._error is None:
+                    self._write_chunk(chunk)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _check_error(self):
+        """Raise an error that has occurred while writing in background."""
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _npy_header(self, n_records):
+        """Format the header of a NumPy file for the number of records."""
+        shape = (n_records,) + self.shape
+        return ("{{'descr': '{0}', 'fortran_order': False, "
+                "'shape': ({1}{2}), }}".format(
+                    self.descr, ", ".join(str(n) for n in shape),
+                    "," if len(shape) == 1 else ""))
+
+    def _save_metadata(self):
+        """Save the data type and the shape of recorded data."""
+        shape = (self.n_records,) + self.shape
+
+        # If the file is a NumPy file, update its header in place, padding it
+        # to the reserved size
+        if self._npy:
+            header = self._npy_header(self.n_records)
+            header_length = self._header_size - len(NPY_MAGIC) - 2
+            if len(header) + 1 > header_length:
+                raise ValueError("Header of NumPy file does not fit in the "
+                                 "reserved space.")
+            header = header.ljust(header_length - 1) + "\n"
+            position = self._file.tell()
+            self._file.seek(0)
+            self._file.write(NPY_MAGIC + struct.pack("<H", header_length)
+                             + header.encode('latin1'))
+            self._file.seek(position)
+
+        # Otherwise, save the data type and the shape to a metadata file
+        else:
+            with open(self.filename + METADATA_SUFFIX, 'w') as metadata_file:
+                json.dump({'dtype': self.descr, 'shape': list(shape)},
+                          metadata_file)
+
+
+class Aggregator(object):
+    """Aggregator of running statistics of data generated by a model."""
+
+    def __init__(self, filename=None, n_bins=None, bin_range=None, shape=(),
+                 every=None, interval=None):
+        # Validate histogram bins, shape of values, and aggregation modes
+        if n_bins is not None:
+            if n_bins <= 0:
+                raise ValueError("'n_bins' is not positive.")
+            if bin_range is None:
+                raise ValueError("'bin_range' is not specified.")
+            if bin_range[0] >= bin_range[1]:
+                raise ValueError("'bin_range' is empty.")
+        shape = tuple(int(n) for n in shape)
+        if any(n <= 0 for n in shape):
+            raise ValueError("'shape' contains values that are not positive.")
+        if every is not None and every <= 0:
+            raise ValueError("'every' is not positive.")
+        if interval is not None and interval <= 0:
+            raise ValueError("'interval' is not positive.")
+        if every is not None and interval is not None:
+            raise ValueError("'every' and 'interval' are both specified.")
+
+        self.filename = filename
+        self.n_bins = n_bins
+        self.bin_range = bin_range
+        self.shape = shape
+        self.every = every
+        self.interval = interval
+        self.count = 0
+        self._n_items = 1
+        for n in shape:
+            self._n_items *= n
+        self._n_steps = 0
+        self._next_time = None
+
+        # Keep statistics of each item of values in flat lists
+        self._means = [None] * self._n_items
+        self._mins = [None] * self._n_items
+        self._maxs = [None] * self._n_items
+        self._m2s = [0.0] * self._n_items
+        if n_bins is not None:
+            self._counts = [[0] * n_bins for n in range(self._n_items)]
+            self._n_under = [0] * self._n_items
+            self._n_over = [0] * self._n_items
+            self._bin_width = float(bin_range[1] - bin_range[0]) / n_bins
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, value, time=None):
+        """Update statistics with values of a single step, unless skipped."""
+        # If requested, aggregate only every specified number of steps or once
+        # per specified interval of simulation time
+        if self.every is not None:
+            self._n_steps += 1
+            if (self._n_steps - 1) % self.every:
+                return
+        elif self.interval is not None:
+            if time is None:
+                raise ValueError("'time' is not specified.")
+            if self._next_time is None:
+                self._next_time = time
+            if time < self._next_time:
+                return
+            self._next_time += self.interval * (
+                math.floor((time - self._next_time) / self.interval) + 1)
+
+        # Reduce values element-wise, item by item of the flattened values
+        if not self.shape:
+            items = [value]
+        elif numpy is not None and isinstance(value, numpy.ndarray):
+            items = value.ravel().tolist()
+        else:
+            items = flatten(value)
+        if len(items) != self._n_items:
+            raise ValueError("Shape of values is not {}.".format(self.shape))
+        self.count += 1
+        for n, item in enumerate(items):
+            self._update(n, item)
+
+    def extend(self, values):
+        """Update statistics with values of multiple steps."""
+        for value in values:
+            self.append(value)
+
+    @property
+    def mean(self):
+        """Mean of values."""
+        return self._shaped(self._means)
+
+    @property
+    def min(self):
+        """Minimum of values."""
+        return self._shaped(self._mins)
+
+    @property
+    def max(self):
+        """Maximum of values."""
+        return self._shaped(self._maxs)
+
+    @property
+    def variance(self):
+        """Variance of values (population variance)."""
+        return self._shaped([m2 / self.count if self.count else None
+                             for m2 in self._m2s])
+
+    @property
+    def std(self):
+        """Standard deviation of values."""
+        return self._shaped([math.sqrt(m2 / self.count) if self.count
+                             else None for m2 in self._m2s])
+
+    def summary(self):
+        """Summarize statistics of values."""
+        summary = Dict(count=self.count, mean=self.mean,
+                       variance=self.variance, std=self.std, min=self.min,
+                       max=self.max)
+        if self.n_bins is not None:
+            summary.histogram = Dict(
+                bin_edges=[self.bin_range[0] + n * self._bin_width
+                           for n in range(self.n_bins)] + [self.bin_range[1]],
+                counts=self._shaped([list(counts)
+                                     for counts in self._counts]),
+                n_under=self._shaped(self._n_under),
+                n_over=self._shaped(self._n_over))
+        return summary
+
+    def close(self):
+        """Save statistics of values to the file, if any."""
+        if self.filename is not None:
+            with open(self.filename, 'w') as stats_file:
+                json.dump(self.summary(), stats_file, indent=4,
+                          sort_keys=True)
+
+    def _update(self, n, value):
+        """Update statistics of an item of values with its value."""
+        # Update the mean and the sum of squared deviations from the mean
+        # incrementally (Welford's algorithm)
+        if self.count == 1:
+            self._means[n] = float(value)
+            self._mins[n] = self._maxs[n] = value
+        else:
+            delta = value - self._means[n]
+            self._means[n] += delta / self.count
+            self._m2s[n] += delta * (value - self._means[n])
+            if value < self._mins[n]:
+                self._mins[n] = value
+            elif value > self._maxs[n]:
+                self._maxs[n] = value
+
+        # If requested, update the histogram, counting values outside the
+        # range of bins separately (the upper bound belongs to the last bin)
+        if self.n_bins is not None:
+            if value < self.bin_range[0]:
+                self._n_under[n] += 1
+            elif value > self.bin_range[1]:
+                self._n_over[n] += 1
+            else:
+                k = int((value - self.bin_range[0]) / self._bin_width)
+                self._counts[n][min(k, self.n_bins - 1)] += 1
+
+    def _shaped(self, items):
+        """Arrange statistics of items in nested lists of the shape."""
+        if not self.shape:
+            return items[0]
+        for n in reversed(self.shape[1:]):
+            items = [items[k:k + n] for k in range(0, len(items), n)]
+        return items
+
+
+def load_data(filename, mmap_mode=False):
+    """Load recorded data from a file."""
+    # Determine the data type, the shape of data, and the position of data in
+    # the file
+    if filename.lower().endswith(".npy"):
+        if numpy is not None:
+            return numpy.load(filename, mmap_mode='r' if mmap_mode else None)
+        descr, shape, offset = _read_npy_header(filename)
+    else:
+        with open(filename + METADATA_SUFFIX) as metadata_file:
+            metadata = json.load(metadata_file)
+        descr = metadata['dtype']
+        shape = tuple(metadata['shape'])
+        offset = 0
+        if numpy is not None:
+            if mmap_mode and all(shape):
+                return numpy.memmap(filename, descr, 'r', shape=shape)
+            return numpy.fromfile(filename, descr).reshape(shape)
+
+    # If NumPy is not available, load data as a flat typed array or, if
+    # requested, as a flat view of the memory-mapped file
+    dtype = descr.lstrip("<>|=")
+    if dtype not in DTYPE_TYPECODES:
+        raise ValueError("Data type '{}' is not supported.".format(dtype))
+    if descr[0] in "<>" and descr[0] != ("<" if sys.byteorder == 'little'
+                                         else ">"):
+        raise ValueError("Byte order of data is not native.")
+    typecode = DTYPE_TYPECODES[dtype]
+    n_items = 1
+    for n in shape:
+        n_items *= n
+    with open(filename, 'rb') as data_file:
+        if mmap_mode:
+            if not n_items:
+                return memoryview(b"").cast(typecode)
+            data_map = mmap.mmap(data_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            return memoryview(data_map)[offset:].cast(typecode)[:n_items]
+        data_file.seek(offset)
+        data = array.array(typecode)
+        data.fromfile(data_file, n_items)
+        return data
+
+
+def _read_npy_header(filename):
+    """Read the data type, the shape, and the data offset of a NumPy file."""
+    with open(filename, 'rb') as npy_file:
+        magic = npy_file.read(len(NPY_MAGIC))
+        if magic[:6] != NPY_MAGIC[:6] or magic[6:7] != b"\x01":
+            raise ValueError("File format is not supported.")
+        header_length, = struct.unpack("<H", npy_file.read(2))
+        header = npy_file.read(header_length).decode('latin1')
+    match_descr = _NPY_DESCR.search(header)
+    match_shape = _NPY_SHAPE.search(header)
+    if match_descr is None or match_shape is None or "True" in header:
+        raise ValueError("File format is not supported.")
+    shape = tuple(int(n) for n in match_shape.group(1).split(",")
+                  if n.strip())
+    return (match_descr.group(1), shape,
+            len(NPY_MAGIC) + 2 + header_length)
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Ensemble services.
+
+Ensemble services provide the following functionality:
+
+- stacking parameters of an ensemble of simulations into arrays (NumPy arrays,
+  if NumPy is available), so that a model can integrate all members of the
+  ensemble at once with vectorized updates;
+- creating a simulation directory for each member of the ensemble;
+- recording data of all members of the ensemble with a single call per step,
+  either to one combined file or to a file in the simulation directory of each
+  member;
+- saving parameters of each member of the ensemble to its simulation
+  directory.
+"""
+
+import errno
+import numbers
+import os
+import tempfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from simtools.base import Dict, flatten, is_string, replace_file
+from simtools.data import load_data, METADATA_SUFFIX, Recorder, typed_array
+from simtools.params import Params
+from simtools.simrun import reserve_sim_dir
+
+
+def stack_params(paramsets, paramnames=None):
+    """Stack values of parameters of multiple parameter sets into arrays."""
+    paramsets = list(paramsets)
+    if not paramsets:
+        raise ValueError("'paramsets' is empty.")
+    if paramnames is None:
+        paramnames = list(paramsets[0])
+    elif is_string(paramnames):
+        raise TypeError("'paramnames' is a string.")
+
+    # Stack numerical parameters into NumPy arrays, if possible, and other
+    # parameters into lists
+    stacked_params = Dict()
+    for paramname in paramnames:
+        try:
+            paramvals = [paramset[paramname] for paramset in paramsets]
+        except KeyError:
+            raise ValueError("Parameter '{}' is not found in all parameter "
+                             "sets.".format(paramname))
+        if (numpy is not None
+                and all(isinstance(paramval, numbers.Number)
+                        and not isinstance(paramval, bool)
+                        for paramval in paramvals)):
+            paramvals = numpy.array(paramvals)
+        stacked_params[paramname] = paramvals
+    return stacked_params
+
+
+class Ensemble(object):
+    """Ensemble of simulations run at once with stacked parameters."""
+
+    def __init__(self, paramsets, sim_master_dirname=None, data_dirname=None,
+                 tmp=False, id_scheme='unique', shard=None):
+        self.paramsets = [Params(paramset) for paramset in paramsets]
+        if not self.paramsets:
+            raise ValueError("'paramsets' is empty.")
+        self.n_members = len(self.paramsets)
+        self.params = stack_params(self.paramsets)
+        self.sim_master_dirname = sim_master_dirname
+        self.data_dirname = data_dirname
+        self.tmp = tmp
+        self.id_scheme = id_scheme
+        self.shard = shard
+        self.sim_ids = None
+        self.sim_paths = None
+
+    def make_dirs(self):
+        """Create simulation directories of members of the ensemble."""
+        # Reserve a uniquely named simulation directory for each member and
+        # add its simulation id to its parameters
+        self.sim_ids = []
+        self.sim_paths = []
+        for paramset in self.paramsets:
+            sim_id, sim_path = reserve_sim_dir(
+                self.sim_master_dirname, self.data_dirname, self.tmp,
+                self.id_scheme, shard=self.shard)
+            paramset.sim_id = sim_id
+            self.sim_ids.append(sim_id)
+            self.sim_paths.append(sim_path)
+        return self.sim_paths
+
+    def recorder(self, filename, dtype='f8', shape=(), combined=False,
+                 **kwargs):
+        """Create recorder of data of all members of the ensemble."""
+        return EnsembleRecorder(self, filename, dtype, shape, combined,
+                                **kwargs)
+
+    def save_params(self, filename, paramnames=None, **kwargs):
+        """Save parameters of each member to its simulation directory."""
+        self._check_dirs()
+        for paramset, sim_path in zip(self.paramsets, self.sim_paths):
+            paramset.save(os.path.join(sim_path, filename), paramnames,
+                          **kwargs)
+
+    def member_filename(self, member, filename):
+        """Determine path to a data file of a member of the ensemble."""
+        self._check_dirs()
+        if self.data_dirname is not None:
+            return os.path.join(self.sim_paths[member], self.data_dirname,
+                                filename)
+        return os.path.join(self.sim_paths[member], filename)
+
+    def _check_dirs(self):
+        """Check if simulation directories of members have been created."""
+        if self.sim_paths is None:
+            raise ValueError("Simulation directories of members of the "
+                             "ensemble have not been created.")
+
+
+class EnsembleRecorder(object):
+    """Recorder of data of all members of an ensemble at once."""
+
+    def __init__(self, ensemble, filename, dtype='f8', shape=(),
+                 combined=False, **kwargs):
+        self.ensemble = ensemble
+        self.filename = filename
+        self.shape = tuple(shape)
+        self.combined = combined
+
+        # Record data of all members to a uniquely named temporary file in the
+        # master directory, so that it is never shared by ensembles run at
+        # once, which is either renamed to the combined file or split into
+        # files of members once the recorder is closed
+        sim_master_dirname = ensemble.sim_master_dirname or os.curdir
+        if combined:
+            try:
+                os.makedirs(sim_master_dirname)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        else:
+            ensemble._check_dirs()
+        self._combined_filename = os.path.join(sim_master_dirname, filename)
+        tmp_fd, combined_filename = tempfile.mkstemp(
+            suffix=os.path.splitext(filename)[1] if combined else ".ensemble",
+            prefix=".{}.".format(os.path.basename(filename)),
+            dir=os.path.dirname(self._combined_filename))
+        os.close(tmp_fd)
+        self._recorder = Recorder(combined_filename, dtype,
+                                  (ensemble.n_members,) + self.shape,
+                                  **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, values, time=None):
+        """Record data of all members of the ensemble at a single step."""
+        if numpy is not None:
+            values = typed_array(values, self._recorder.dtype)
+        elif self.shape:
+            values = flatten(values)
+        self._recorder.append(values, time)
+
+    def close(self):
+        """Write recorded data and, if necessary, split them by members."""
+        self._recorder.close()
+        if self.combined:
+            for suffix in ("", METADATA_SUFFIX):
+                if os.path.exists(self._recorder.filename + suffix):
+                    replace_file(self._recorder.filename + suffix,
+                             self._combined_filename + suffix)
+            return
+
+        # Save the data of each member to a file in its simulation directory
+        recorder = self._recorder
+        n_members = self.ensemble.n_members
+        record_length = 1
+        for n in self.shape:
+            record_length *= n
+        data = load_data(recorder.filename, mmap_mode=True)
+        if numpy is not None:
+            data = numpy.reshape(data, (recorder.n_records, n_members,
+                                        record_length))
+        for member in range(n_members):
+            # If possible, pass slices of data of the member to its recorder
+            # as NumPy arrays, so that they are written in bulk
+            if numpy is not None:
+                member_data = numpy.reshape(
+                    data[:, member, :], (recorder.n_records,) + self.shape)
+            else:
+                starts = [(record * n_members + member) * record_length
+                          for record in range(recorder.n_records)]
+                member_data = [data[start:start + record_length].tolist()
+                               if self.shape else data[start]
+                               for start in starts]
+            with Recorder(self.ensemble.member_filename(member,
+                                                        self.filename),
+                          recorder.dtype, self.shape) as member_recorder:
+                member_recorder.extend(member_data)
+        del data
+        os.remove(recorder.filename)
+        if os.path.exists(recorder.filename + METADATA_SUFFIX):
+            os.remove(recorder.filename + METADATA_SUFFIX)
+
@@ -16,7 +16,7 @@ The model demonstrates the following features supported by SimTools:
 - use of basic options (namely 'params_filename', 'save_data', and 'sim_id');
 - loading parameters from the parameter file;
 - employment of a simulation id;
-- saving data generated by the model during a simulation;
+- recording data generated by the model during a simulation to a binary file;
 - saving parameters;
 - saving metadata (namely platform information and software versions).
 
@@ -45,7 +45,7 @@ import simtools
 # Filenames
 params_filename = "param.json"
 platform_filename = "platform.json"
-pos_filename = "pos.txt"
+pos_filename = "pos.npy"
 versions_filename = "version.json"
 
 # Parameters to be saved
@@ -73,9 +73,10 @@ gravity_force = params.mass * params.gravity
 pos = params.anchor_pos - params.displacement
 vel = 0.0
 
-# If necessary, create a store for recording data
+# If necessary, create a recorder of data
 if options.save_data:
-    pos_data = [pos]
+    pos_recorder = simtools.Recorder(pos_filename)
+    pos_recorder.append(pos)
 
 # Run a simulation for the specified time
 n_sim_steps = int(round(params.sim_duration / params.sim_dt))
@@ -90,13 +91,12 @@ for _ in range(n_sim_steps):
 
     # If necessary, record data
     if options.save_data:
-        pos_data.append(pos)
+        pos_recorder.append(pos)
 
 # If necessary, save data
 if options.save_data:
-    # Save generated data
-    with open(pos_filename, 'w') as pos_file:
-        pos_file.write("\n".join("{:.6f}".format(pos) for pos in pos_data))
+    # Save the remaining generated data
+    pos_recorder.close()
 
     # Save parameters
     params.save(params_filename, saved_params, sort_keys=True)
@@ -0,0 +1,126 @@
+"""Ensemble of damped spring-mass systems.
+
+This script implements the model of a vertical spring-mass system in a
+gravitational field, which is subject to damping, for a whole ensemble of
+variants of the system at once.
+
+The system is described by means of a second-order ordinary differential
+equation based on Newton's second law of motion, where the restoring force of
+the spring is determined according to Hooke's law and damping is proportional
+to the velocity. The variants of the system are determined by a parameter
+sweep over values of the spring constant and the damping coefficient.
+Parameters of all variants are stacked into NumPy arrays and the equations of
+all variants are numerically integrated together using forward Euler method
+with vectorized updates, so that the whole ensemble is simulated in about the
+time of a handful of simulations of a single variant.
+
+The model demonstrates the following features supported by SimTools:
+
+- separation of the actual model (implemented as a model script) from its
+  parameters (stored in a parameter file);
+- use of basic options (namely 'params_filename' and 'save_data' as well as
+  custom options 'master_dir' and 'combined');
+- generating parameter sets of a parameter sweep;
+- running an ensemble of simulations at once with stacked parameters;
+- creating a simulation directory for each member of the ensemble;
+- recording data generated by the model during the simulations of all members
+  of the ensemble at once;
+- saving parameters of each member of the ensemble.
+
+A model ensemble can be launched as follows:
+
+    $ python model.py -p params.py -s -m results
+
+where 'results' is the master directory. As a result, a simulation directory
+with an automatically generated simulation id will be created in the master
+directory for each member of the ensemble, and data generated by the model
+during the simulation of the member along with its parameters will be saved in
+the simulation directory.
+
+Alternatively, data generated by the model during the simulations of all
+members of the ensemble can be saved to a single file in the master directory
+as follows:
+
+    $ python model.py -p params.py -s -m results -c
+
+The model requires NumPy.
+"""
+
+import argparse
+
+import numpy as np
+
+import simtools
+
+# Filenames
+params_filename = "param.json"
+pos_filename = "pos.npy"
+
+# Parameters to be saved
+saved_params = ['anchor_pos', 'damping_coef', 'displacement', 'gravity',
+                'mass', 'sim_dt', 'sim_duration', 'sim_id', 'spring_const']
+
+# Process command line arguments
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-m", "--master-dir", metavar="MASTERDIR",
+    dest='sim_master_dirname',
+    help="create simulation directories in MASTERDIR")
+parser.add_argument(
+    "-c", "--combined",
+    dest='combined', action='store_true',
+    help="save data of all members of the ensemble to a single file")
+options = simtools.parse_args(['params_filename', 'save_data'], parser=parser)
+
+# Load parameters and generate parameter sets of the parameter sweep
+assert options.params_filename is not None, "Parameter file is not specified."
+params = simtools.load_params(options.params_filename)
+sweep = params.pop('sweep')
+paramsets = simtools.sweep_params(params, sweep)
+
+# Stack parameters of all members of the ensemble into arrays
+ensemble = simtools.Ensemble(paramsets, options.sim_master_dirname)
+p = ensemble.params
+
+# Validate displacement
+assert np.all(p.displacement <= p.anchor_pos), \
+    "Mass initial displacement must not be greater than the anchor position."
+
+# Determine invariant quantities
+gravity_force = p.mass * p.gravity
+
+# Determine initial quantities
+pos = p.anchor_pos - p.displacement
+vel = np.zeros(ensemble.n_members)
+
+# If necessary, create simulation directories of members and a recorder of
+# data of all members
+if options.save_data:
+    if not options.combined:
+        ensemble.make_dirs()
+    pos_recorder = ensemble.recorder(pos_filename, combined=options.combined)
+    pos_recorder.append(pos)
+
+# Run simulations of all members for the specified time
+n_sim_steps = int(round(params.sim_duration / params.sim_dt))
+for _ in range(n_sim_steps):
+    # Update system states
+    spring_force = -p.spring_const * (pos - p.anchor_pos)
+    damping_force = p.damping_coef * vel
+    net_force = spring_force - damping_force - gravity_force
+    accel = net_force / p.mass
+    vel += accel * params.sim_dt
+    pos += vel * params.sim_dt
+
+    # If necessary, record data
+    if options.save_data:
+        pos_recorder.append(pos)
+
+# If necessary, save data
+if options.save_data:
+    # Save the remaining generated data
+    pos_recorder.close()
+
+    # Save parameters of each member
+    if not options.combined:
+        ensemble.save_params(params_filename, saved_params, sort_keys=True)
@@ -14,24 +14,26 @@ The model demonstrates the following features supported by SimTools:
 - separation of the actual model (implemented as a model script) from its
   parameters (stored in a parameter file);
 - use of various options (namely 'data_dirname', 'params_filename',
-  'save_data', 'sim_id' as well as a custom option 'verbose');
+  'save_data', 'sim_id' as well as custom options 'every' and 'verbose');
 - loading parameters from the parameter file;
 - employment of a simulation id;
-- saving data generated by the model during a simulation;
+- recording data generated by the model during a simulation to a binary file,
+  possibly only every specified number of steps, in a background thread;
+- computing running statistics of data generated by the model;
 - saving parameters;
 - saving metadata (namely platform information and software versions).
 
 A model simulation can be launched directly as follows:
 
-    $ python model.py -p params.py -i 12345 -s -d data -v
+    $ python model.py -p params.py -i 12345 -s -d data -v -k 10
 
 where '12345' is a manually specified simulation id and 'data' is the name of a
 subdirectory in the current directory, in which data generated by the model
 during the simulation will be saved and which must already be created. As a
 result, information on performed operations during the simulation will be
 displayed on the screen, parameters and metadata will be saved in the current
-directory, and data generated by the model will be saved in its subdirectory
-'data'.
+directory, and data generated by the model (recorded every 10 steps) along with
+their statistics will be saved in its subdirectory 'data'.
 
 Alternatively, a model simulation can be launched by invoking the simulation
 launcher provided by SimTools as follows:
@@ -58,7 +60,8 @@ import simtools
 # Filenames
 params_filename = "param.json"
 platform_filename = "platform.json"
-pos_filename = "pos.txt"
+pos_filename = "pos.npy"
+pos_stats_filename = "pos_stats.json"
 versions_filename = "version.json"
 
 # Parameters to be saved
@@ -71,6 +74,10 @@ parser.add_argument(
     "-v", "--verbose",
     dest='verbose', action='store_true',
     help="display information on performed operations")
+parser.add_argument(
+    "-k", "--every", metavar="K",
+    dest='every', type=int,
+    help="record data every K steps")
 options = simtools.parse_args(
     ['data_dirname', 'params_filename', 'save_data', 'sim_id'], parser=parser)
 
@@ -92,9 +99,16 @@ gravity_force = params.mass * params.gravity
 pos = params.anchor_pos - params.displacement
 vel = 0.0
 
-# If necessary, create a store for recording data
+# If necessary, create a recorder of data
 if options.save_data:
-    pos_data = [pos]
+    dirname = options.data_dirname if options.data_dirname is not None else ""
+    pos_recorder = simtools.Recorder(os.path.join(dirname, pos_filename),
+                                     every=options.every, background=True)
+    pos_recorder.append(pos)
+    pos_stats = simtools.Aggregator(
+        os.path.join(dirname, pos_stats_filename), n_bins=20,
+        bin_range=(0.0, params.anchor_pos))
+    pos_stats.append(pos)
 
 # Run a simulation for the specified time
 n_sim_steps = int(round(params.sim_duration / params.sim_dt))
@@ -113,7 +127,8 @@ for _ in range(n_sim_steps):
 
     # If necessary, record data
     if options.save_data:
-        pos_data.append(pos)
+        pos_recorder.append(pos)
+        pos_stats.append(pos)
 if options.verbose:
     end_time = datetime.datetime.now()
     print("Simulation stopped at {}.".format(end_time.strftime("%H:%M:%S.%f")))
@@ -124,12 +139,9 @@ if options.save_data:
     if options.verbose:
         print("Saving data...")
 
-    # Adjust directory name
-    dirname = options.data_dirname if options.data_dirname is not None else ""
-
-    # Save generated data
-    with open(os.path.join(dirname, pos_filename), 'w') as pos_file:
-        pos_file.write("\n".join("{:.6f}".format(pos) for pos in pos_data))
+    # Save the remaining generated data and their statistics
+    pos_recorder.close()
+    pos_stats.close()
 
     # Save parameters
     params.save(params_filename, saved_params, sort_keys=True)
@@ -5,19 +5,28 @@ Parameter services provide the following functionality:
 
 - loading parameters from a JSON file;
 - loading parameters from a Python file;
+- loading parameters passed by the launcher through an environment variable;
+- loading parameters from a file packed into an archive of simulation
+  directories, without extracting the archive;
 - saving parameters to a JSON file;
 - loading parameters from a file as a parameter set;
+- generating parameter sets of a sweep over values of parameters;
 - saving parameter sets to a CSV file;
 - saving parameter sets to a JSON file;
-- exporting parameters of multiple simulations to a file;
+- exporting parameters of multiple simulations to a file, streaming them from
+  parameter files one at a time;
 - loading parameter names from a text file.
 """
 
+import contextlib
 import csv
+import itertools
 import json
+import os
 import sys
 import types
 
+from simtools.archive import open_file
 from simtools.base import Dict, is_iterable, is_string
 from simtools.exceptions import FileError
 
@@ -26,12 +35,18 @@ if sys.version_info[0] == 3:
 else:
     import collections as collections_abc
 
+PARAMS_ENV_VAR = "SIMTOOLS_PARAMS"
+ENV_PARAMS_FILENAME = "env:" + PARAMS_ENV_VAR
+
 
 class Params(Dict):
     """Container storing parameters."""
 
     def load(self, filename):
         """Load parameters from a file."""
+        if filename == ENV_PARAMS_FILENAME:
+            self._load_env()
+            return
         filename_lower = filename.lower()
         if filename_lower.endswith(".json"):
             self._load_json(filename)
@@ -77,9 +92,21 @@ class Params(Dict):
         with open(filename, 'w') as params_file:
             json.dump(params, params_file, indent=indent, **kwargs)
 
+    def _load_env(self):
+        """Load parameters from an environment variable."""
+        try:
+            new_params = json.loads(os.environ[PARAMS_ENV_VAR])
+        except KeyError:
+            raise ValueError("Environment variable '{}' is not set.".format(
+                PARAMS_ENV_VAR))
+        except ValueError as e:
+            raise FileError(filename=ENV_PARAMS_FILENAME,
+                            error_msg=e.args[0])
+        self.update(new_params)
+
     def _load_json(self, filename):
         """Load parameters from a JSON file."""
-        with open(filename) as params_file:
+        with open_file(filename) as params_file:
             try:
                 new_params = json.load(params_file)
             except ValueError as e:
@@ -88,7 +115,7 @@ class Params(Dict):
 
     def _load_py(self, filename):
         """Load parameters from a Python file."""
-        with open(filename) as params_file:
+        with open_file(filename) as params_file:
             # Execute Python code from the file to populate local namespace
             new_params = {}
             try:
@@ -182,8 +209,7 @@ class ParamSets(collections_abc.MutableSequence):
     def _make_records(self, paramnames, record_paramnames, with_numbers,
                       explicit_none):
         """Create parameter records for saving to a file."""
-        params_records = []
-        for p, paramset in enumerate(self._paramsets):
+        for p, paramset in enumerate(self):
             # Populate parameter record corresponding to the parameter set
             params_record = {}
             for paramname, record_paramname in zip(paramnames,
@@ -207,9 +233,7 @@ class ParamSets(collections_abc.MutableSequence):
             if with_numbers:
                 params_record['#'] = p + 1
 
-            params_records.append(params_record)
-
-        return params_records
+            yield params_record
 
     def _save_csv(self, filename, paramnames, paramnames_map, with_numbers,
                   with_header=True, dialect='excel-tab'):
@@ -231,10 +255,10 @@ class ParamSets(collections_abc.MutableSequence):
 
         # Save parameter records to a CSV file
         if sys.version_info[0] == 3:
-            paramsets_file = open(filename, 'w', newline='')
+            replaced_file = _replaced_on_success(filename, 'w', newline='')
         else:
-            paramsets_file = open(filename, 'wb')
-        with paramsets_file:
+            replaced_file = _replaced_on_success(filename, 'wb')
+        with replaced_file as paramsets_file:
             csv_writer = csv.DictWriter(paramsets_file, fieldnames,
                                         extrasaction='ignore', dialect=dialect)
             if with_header:
@@ -261,12 +285,33 @@ class ParamSets(collections_abc.MutableSequence):
         params_records = self._make_records(paramnames, record_paramnames,
                                             with_numbers, explicit_none=False)
 
-        # Determine indentation
+        # Determine indentation and separator of parameter records, which are
+        # formatted in the same way as by 'json.dump()'
         indent = kwargs.pop('indent', DEFAULT_INDENT)
-
-        # Save parameter records to a JSON file
-        with open(filename, 'w') as paramsets_file:
-            json.dump(params_records, paramsets_file, indent=indent, **kwargs)
+        if indent is not None:
+            prefix = indent if is_string(indent) else " " * indent
+        if kwargs.get('separators') is not None:
+            record_separator = kwargs['separators'][0]
+        else:
+            record_separator = ", " if indent is None else ","
+
+        # Save parameter records to a JSON file one at a time, so that they do
+        # not have to be kept in memory
+        with _replaced_on_success(filename, 'w') as paramsets_file:
+            paramsets_file.write("[")
+            n_records = 0
+            for params_record in params_records:
+                if n_records:
+                    paramsets_file.write(record_separator)
+                record = json.dumps(params_record, indent=indent, **kwargs)
+                if indent is not None:
+                    record = "\n" + "\n".join(
+                        prefix + line for line in record.split("\n"))
+                paramsets_file.write(record)
+                n_records += 1
+            if indent is not None and n_records:
+                paramsets_file.write("\n")
+            paramsets_file.write("]")
 
     def _substitute_paramnames(self, paramnames, paramnames_map):
         """Substitute parameter names according to a mapping."""
@@ -292,6 +337,41 @@ class ParamSets(collections_abc.MutableSequence):
         return new_paramnames
 
 
+class _StreamedParamSets(ParamSets):
+    """Parameter sets loaded from files only while being iterated over."""
+
+    def __init__(self, params_paths):
+        super(_StreamedParamSets, self).__init__()
+        self._params_paths = params_paths
+
+    def __iter__(self):
+        """Load parameter sets from files one at a time."""
+        for params_path in self._params_paths:
+            yield load_params(params_path)
+
+
+@contextlib.contextmanager
+def _replaced_on_success(filename, mode='w', **kwargs):
+    """Write file under a temporary name and rename it once it is written."""
+    # Parameter records are created while the file is being written, so the
+    # file is written to a temporary file in the same directory, which
+    # replaces the file only once all records have been written (an invalid
+    # record leaves neither an incomplete file nor a removed existing one)
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    tmp_filename = os.path.join(dirname, ".{0}.{1}.tmp".format(basename,
+                                                              os.getpid()))
+    try:
+        with open(tmp_filename, mode, **kwargs) as tmp_file:
+            yield tmp_file
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    if hasattr(os, 'replace'):
+        os.replace(tmp_filename, filename)
+    else:
+        os.rename(tmp_filename, filename)
+
+
 def load_params(filename):
     """Load parameters from a file."""
     params = Params()
@@ -299,6 +379,35 @@ def load_params(filename):
     return params
 
 
+def sweep_params(params, sweep):
+    """Generate parameter sets of a sweep over values of parameters."""
+    # Validate values of swept parameters
+    for paramname, paramvals in sweep.items():
+        if not is_iterable(paramvals):
+            raise TypeError("Values of parameter '{}' are not "
+                            "iterable.".format(paramname))
+        if is_string(paramvals):
+            raise TypeError("Values of parameter '{}' are a "
+                            "string.".format(paramname))
+
+    # Generate a parameter set for each combination of values of swept
+    # parameters, varying the values of the last parameter (in alphabetical
+    # order) the fastest
+    paramnames = sorted(sweep)
+    paramsets = ParamSets()
+    for paramvals in itertools.product(*(sweep[paramname]
+                                         for paramname in paramnames)):
+        paramset = Params(params)
+        paramset.update(zip(paramnames, paramvals))
+        paramsets.append(paramset)
+    return paramsets
+
+
+def encode_params(params):
+    """Encode parameters to be passed through an environment variable."""
+    return json.dumps(params, separators=(",", ":"))
+
+
 def export_params(export_filename, params_paths, paramnames,
                   paramnames_map=None, with_numbers=False, **kwargs):
     """Export parameters of multiple simulations to a file."""
@@ -306,12 +415,9 @@ def export_params(export_filename, params_paths, paramnames,
     if not any(map(export_filename.lower().endswith, (".csv", ".json"))):
         raise ValueError("File format is not supported.")
 
-    # Load parameters from parameter files as parameter sets
-    paramsets = ParamSets()
-    for params_path in params_paths:
-        paramsets.load_params(params_path)
-
-    # Save parameter sets to the export file
+    # Save parameter sets to the export file, loading them from parameter
+    # files one at a time while they are being saved
+    paramsets = _StreamedParamSets(params_paths)
     paramsets.save(export_filename, paramnames, paramnames_map, with_numbers,
                    **kwargs)
 
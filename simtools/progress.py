@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Batch progress services.
+
+Batch progress services provide the following functionality:
+
+- tracking the numbers of queued, running, finished, and failed simulations of
+  a batch, along with their runtimes;
+- estimating the throughput of the batch, the mean and 95th percentile of the
+  runtime (the latter over a window of the latest runtimes), and the time
+  remaining until the batch finishes;
+- measuring the CPU and memory load of the computer;
+- periodically redrawing a status line and saving the status to a JSON file
+  from a background thread, so that launching simulations is never delayed.
+"""
+
+from __future__ import division
+
+import collections
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from simtools.base import Dict
+
+STATUS_INTERVAL = 1.0
+RUNTIME_WINDOW = 1000  # latest runtimes used to estimate the percentile
+
+
+class BatchProgress(object):
+    """Progress of a batch of simulations."""
+
+    def __init__(self, n_sims, stream=None, status_filename=None,
+                 interval=STATUS_INTERVAL):
+        # Validate redraw interval
+        if interval <= 0:
+            raise ValueError("'interval' is not positive.")
+
+        self.n_sims = n_sims
+        self.stream = stream
+        self.status_filename = status_filename
+        self.interval = interval
+        self._n_running = 0
+        self._n_done = 0
+        self._n_failed = 0
+        self._n_runtimes = 0
+        self._total_runtime = 0.0
+        self._runtimes = collections.deque(maxlen=RUNTIME_WINDOW)
+        self._start_time = time.time()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._line_length = 0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Start redrawing the status periodically in a background thread."""
+        self._start_time = time.time()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._redraw_periodically)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop redrawing the status and redraw it for the last time."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.redraw(final=True)
+
+    def start_sim(self):
+        """Record start of a simulation."""
+        with self._lock:
+            self._n_running += 1
+
+    def finish_sim(self, exit_status, runtime):
+        """Record finish of a simulation."""
+        with self._lock:
+            self._n_running -= 1
+            if exit_status == 0:
+                self._n_done += 1
+            else:
+                self._n_failed += 1
+            self._n_runtimes += 1
+            self._total_runtime += runtime
+            self._runtimes.append(runtime)
+
+    def status(self):
+        """Determine the current status of the batch."""
+        # Take a snapshot of counters, so that simulations are not delayed
+        # while the status is being determined
+        with self._lock:
+            n_running = self._n_running
+            n_done = self._n_done
+            n_failed = self._n_failed
+            n_runtimes = self._n_runtimes
+            total_runtime = self._total_runtime
+            runtimes = list(self._runtimes)
+        elapsed_time = time.time() - self._start_time
+        n_finished = n_done + n_failed
+        n_queued = max(self.n_sims - n_finished - n_running, 0)
+
+        # Estimate throughput, runtime statistics, and remaining time, keeping
+        # the cost bounded by estimating the percentile of the runtime only
+        # from a window of the latest runtimes
+        throughput = (60.0 * n_finished / elapsed_time
+                      if n_finished and elapsed_time > 0 else None)
+        if runtimes:
+            runtimes.sort()
+            mean_runtime = total_runtime / n_runtimes
+            p95_runtime = runtimes[
+                int(math.ceil(0.95 * len(runtimes))) - 1]
+        else:
+            mean_runtime = p95_runtime = None
+        eta = (60.0 * (n_queued + n_running) / throughput
+               if throughput else None)
+
+        cpu_load, memory_load = measure_load()
+        return Dict(
+            time=datetime.datetime.now().isoformat(), total=self.n_sims,
+            queued=n_queued, running=n_running, done=n_done,
+            failed=n_failed, elapsed_time=elapsed_time,
+            throughput=throughput, mean_runtime=mean_runtime,
+            p95_runtime=p95_runtime, eta=eta, cpu_load=cpu_load,
+            memory_load=memory_load)
+
+    def redraw(self, final=False):
+        """Redraw the status line and save the status to a file."""
+        status = self.status()
+
+        # If necessary, save the status to a JSON file, replacing the previous
+        # one atomically so that the file can be polled at any time
+        if self.status_filename:
+            tmp_fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.status_filename)),
+                suffix=".tmp")
+            with os.fdopen(tmp_fd, 'w') as tmp_file:
+                json.dump(status, tmp_file, indent=4)
+            os.rename(tmp_path, self.status_filename)
+
+        # If necessary, redraw the status line, overwriting the previous one if
+        # the stream is a terminal
+        if self.stream is not None:
+            line = format_status(status)
+            if _isatty(self.stream):
+                self.stream.write("\r{0:<{1}}".format(line, self._line_length))
+                self._line_length = len(line)
+                if final:
+                    self.stream.write("\n")
+            else:
+                self.stream.write(line + "\n")
+            self.stream.flush()
+
+    def _redraw_periodically(self):
+        """Redraw the status periodically until stopped."""
+        while not self._stop_event.wait(self.interval):
+            self.redraw()
+
+
+def format_status(status):
+    """Format the status of a batch of simulations as a single line."""
+    fields = ["{0}/{1} done".format(status.done, status.total),
+              "{} failed".format(status.failed),
+              "{} running".format(status.running),
+              "{} queued".format(status.queued)]
+    if status.throughput is not None:
+        fields.append("{:.1f} sims/min".format(status.throughput))
+    if status.mean_runtime is not None:
+        fields.append("mean {0} p95 {1}".format(
+            _format_duration(status.mean_runtime),
+            _format_duration(status.p95_runtime)))
+    if status.eta is not None:
+        fields.append("ETA {}".format(_format_duration(status.eta)))
+    if status.cpu_load is not None:
+        fields.append("CPU {:.0%}".format(status.cpu_load))
+    if status.memory_load is not None:
+        fields.append("mem {:.0%}".format(status.memory_load))
+    return " | ".join(fields)
+
+
+def measure_load():
+    """Measure the CPU and memory load of the computer, if possible."""
+    # Determine CPU load as the 1-minute load average per CPU
+    try:
+        cpu_load = os.getloadavg()[0] / multiprocessing.cpu_count()
+    except (AttributeError, NotImplementedError, OSError):
+        cpu_load = None
+
+    # Determine memory load as the fraction of memory that is not available
+    memory_load = None
+    try:
+        with open("/proc/meminfo") as meminfo_file:
+            meminfo = dict(line.split(":", 1) for line in meminfo_file
+                           if ":" in line)
+        total_memory = int(meminfo['MemTotal'].split()[0])
+        available_memory = int(meminfo['MemAvailable'].split()[0])
+        if total_memory > 0:
+            memory_load = 1.0 - available_memory / total_memory
+    except (IOError, OSError, KeyError, ValueError):
+        pass
+    return cpu_load, memory_load
+
+
+def _format_duration(seconds):
+    """Format duration in seconds as hours, minutes, and seconds."""
+    if seconds < 60.0:
+        return "{:.1f}s".format(seconds)
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "{0}:{1:02d}:{2:02d}".format(hours, minutes, seconds)
+
+
+def _isatty(stream):
+    """Check if a stream is connected to a terminal."""
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
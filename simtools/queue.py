@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+"""Shared-filesystem work queue.
+
+Shared-filesystem work queue provides the following functionality:
+
+- enqueuing simulations in a spool directory, possibly shared by several
+  computers;
+- claiming queued simulations through atomic leases, so that each simulation is
+  claimed by exactly one worker;
+- keeping leases alive with heartbeats and requeuing simulations whose leases
+  have expired;
+- running a worker that claims and launches queued simulations until the queue
+  is drained.
+
+The spool directory contains the following subdirectories:
+
+- `pending` - queued simulations, each described by a JSON file;
+- `running` - simulations leased by workers;
+- `done` - simulations that finished with exit status 0;
+- `failed` - simulations that finished with a nonzero exit status or could not
+  be launched;
+- `tmp` - files being written.
+
+A simulation is claimed by renaming its file from `pending` to `running`, which
+is atomic as long as both directories reside on the same file system, and the
+lease is kept alive by updating the modification time of the renamed file.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import functools
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+import traceback
+
+from simtools.base import Dict
+from simtools.simrun import (finalize_sim_dir, generate_sim_id,
+                             reserve_sim_dir, run_sim)
+
+SPOOL_DIRNAMES = ('tmp', 'pending', 'running', 'done', 'failed')
+LEASE_TIMEOUT = 60.0
+POLL_INTERVAL = 1.0
+CLOCK_FILENAME = ".clock"
+
+
+class SimQueue(object):
+    """Queue of simulations kept in a spool directory."""
+
+    def __init__(self, dirname, lease_timeout=LEASE_TIMEOUT):
+        if lease_timeout <= 0:
+            raise ValueError("'lease_timeout' is not positive.")
+        self.dirname = dirname
+        self.lease_timeout = lease_timeout
+        for spool_dirname in SPOOL_DIRNAMES:
+            _make_dir(os.path.join(dirname, spool_dirname))
+
+    def put(self, model_filename, params_filename=None, data_dirname=None,
+            executable=None, model_args=None, params=None):
+        """Enqueue simulation."""
+        # Validate parameters passed through an environment variable
+        if params is not None and params_filename is not None:
+            raise ValueError(
+                "Both 'params_filename' and 'params' are specified.")
+
+        # Describe simulation, converting paths to absolute ones so that they
+        # remain valid for workers running in other directories
+        job_id = generate_sim_id('ulid')
+        sim = Dict()
+        sim.job_id = job_id
+        sim.model_filename = os.path.abspath(model_filename)
+        sim.params_filename = (os.path.abspath(params_filename)
+                               if params_filename is not None else None)
+        sim.data_dirname = data_dirname
+        sim.executable = executable
+        sim.model_args = list(model_args) if model_args else None
+        sim.params = params
+        sim.enqueue_time = time.time()
+
+        # Atomically place the description of the simulation in the queue
+        self._write(os.path.join(self.dirname, 'pending', job_id + ".json"),
+                    sim)
+        return job_id
+
+    def claim(self, worker_id=None):
+        """Lease the oldest queued simulation."""
+        if worker_id is None:
+            worker_id = generate_worker_id()
+        pending_dirname = os.path.join(self.dirname, 'pending')
+        for filename in sorted(os.listdir(pending_dirname)):
+            if not filename.endswith(".json"):
+                continue
+            job_id = filename[:-len(".json")]
+            pending_path = os.path.join(pending_dirname, filename)
+            lease_path = os.path.join(
+                self.dirname, 'running', "{0}.{1}.json".format(
+                    job_id, generate_sim_id('ulid')))
+
+            # Refresh the modification time before renaming the file, so that
+            # the lease does not appear expired; if another worker has already
+            # renamed the file, try the next one
+            try:
+                os.utime(pending_path, None)
+                os.rename(pending_path, lease_path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+
+            with open(lease_path, 'r') as lease_file:
+                sim = Dict(json.load(lease_file))
+            sim.worker_id = worker_id
+            sim.lease_path = lease_path
+            return sim
+        return None
+
+    def heartbeat(self, sim):
+        """Keep the lease of a simulation alive."""
+        try:
+            os.utime(sim.lease_path, None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+        return True
+
+    def complete(self, sim, exit_status, **kwargs):
+        """Record the outcome of a leased simulation and release its lease."""
+        # Move the description of the simulation out of the lease; if the lease
+        # has expired and the simulation has been requeued meanwhile, discard
+        # the outcome
+        result_dirname = 'done' if exit_status == 0 else 'failed'
+        result_path = os.path.join(self.dirname, result_dirname,
+                                   sim.job_id + ".json")
+        try:
+            os.rename(sim.lease_path, result_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            return False
+
+        # Atomically replace the description of the simulation with one
+        # including its outcome
+        result = Dict(sim)
+        del result.lease_path
+        result.exit_status = exit_status
+        result.update(kwargs)
+        result.end_time = time.time()
+        self._write(result_path, result)
+        return True
+
+    def requeue_expired(self):
+        """Requeue simulations whose leases have expired."""
+        # Determine the current time according to the file system rather than
+        # the local clock, which may differ between computers
+        now = self._fs_time()
+        running_dirname = os.path.join(self.dirname, 'running')
+        n_requeued = 0
+        for filename in os.listdir(running_dirname):
+            if not filename.endswith(".json"):
+                continue
+            lease_path = os.path.join(running_dirname, filename)
+            try:
+                if os.stat(lease_path).st_mtime >= now - self.lease_timeout:
+                    continue
+                os.rename(lease_path, os.path.join(
+                    self.dirname, 'pending',
+                    filename.split(".")[0] + ".json"))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                continue
+            n_requeued += 1
+        return n_requeued
+
+    def counts(self):
+        """Count simulations in each state."""
+        counts = Dict()
+        for state in SPOOL_DIRNAMES[1:]:
+            counts[state] = len([
+                filename for filename
+                in os.listdir(os.path.join(self.dirname, state))
+                if filename.endswith(".json")])
+        return counts
+
+    def _fs_time(self):
+        """Determine the current time according to the file system."""
+        clock_path = os.path.join(self.dirname, 'tmp', CLOCK_FILENAME)
+        with open(clock_path, 'a'):
+            os.utime(clock_path, None)
+        return os.stat(clock_path).st_mtime
+
+    def _write(self, filename, sim):
+        """Atomically write the description of a simulation to a file."""
+        tmp_fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.join(self.dirname, 'tmp'), suffix=".json")
+        with os.fdopen(tmp_fd, 'w') as tmp_file:
+            json.dump(sim, tmp_file, indent=4)
+        os.rename(tmp_path, filename)
+
+
+def generate_worker_id():
+    """Generate worker id based on host name and process id."""
+    return "{0}_{1}".format(platform.node().split(".")[0] or "localhost",
+                            os.getpid())
+
+
+def run_worker(queue, sim_master_dirname=None, worker_id=None, tmp=False,
+               id_scheme='unique', wait=False, poll_interval=POLL_INTERVAL,
+               launch=None, partial=False, shard=None, registry_filename=None,
+               **kwargs):
+    """Claim and launch queued simulations until the queue is drained."""
+    if worker_id is None:
+        worker_id = generate_worker_id()
+    if launch is None:
+        launch = functools.partial(_run_sim,
+                                   registry_filename=registry_filename)
+    n_sims = 0
+    while True:
+        # Requeue simulations abandoned by other workers and lease the next
+        # simulation; if there is none, finish unless some other simulations
+        # may still be requeued or waiting for new simulations is requested
+        queue.requeue_expired()
+        sim = queue.claim(worker_id)
+        if sim is None:
+            if not wait and not queue.counts().running:
+                return n_sims
+            time.sleep(poll_interval)
+            continue
+
+        # Keep the lease alive while the simulation is running
+        stop_event = threading.Event()
+        heartbeat_thread = threading.Thread(
+            target=_keep_alive, args=(queue, sim, stop_event))
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+
+        # Create a uniquely named simulation directory (if requested, under its
+        # partial name until the simulation succeeds) and launch the
+        # simulation, recording a failure if it cannot be launched
+        outcome = Dict()
+        try:
+            sim.sim_id, sim.sim_path = reserve_sim_dir(
+                sim_master_dirname, sim.get('data_dirname'), tmp, id_scheme,
+                partial=partial, shard=shard)
+            outcome.sim_id = sim.sim_id
+            outcome.sim_path = os.path.abspath(sim.sim_path)
+            exit_status = launch(sim, **kwargs)
+            if partial and exit_status == 0:
+                outcome.sim_path = os.path.abspath(
+                    finalize_sim_dir(sim.sim_path, registry_filename,
+                                     kwargs.get('manifest_filename')))
+        except Exception:
+            exit_status = None
+            outcome.error = traceback.format_exc()
+        finally:
+            stop_event.set()
+            heartbeat_thread.join()
+        queue.complete(sim, exit_status, **outcome)
+        n_sims += 1
+
+
+def _keep_alive(queue, sim, stop_event):
+    """Update the lease of a simulation periodically until stopped."""
+    interval = queue.lease_timeout / 4.0
+    while not stop_event.wait(interval):
+        if not queue.heartbeat(sim):
+            break
+
+
+def _make_dir(dirname):
+    """Create directory unless it already exists."""
+    try:
+        os.makedirs(dirname)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _run_sim(sim, **kwargs):
+    """Launch queued simulation as a child process."""
+    return run_sim(sim.model_filename, sim.get('params_filename'),
+                   sim.get('sim_id'), sim.get('data_dirname'),
+                   sim.get('executable'), sim.get('model_args'),
+                   sim.get('sim_path'), params=sim.get('params'), **kwargs)
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Run registry.
+
+Run registry provides the following functionality:
+
+- recording launches of simulations, along with their parameters, in an SQLite
+  database shared by concurrent launchers;
+- recording the outcome and resource usage of finished simulations;
+- recording moves of simulation directories;
+- counting simulations by their status;
+- finding simulations by their status and parameters, for example the slowest
+  ones or the failed ones.
+
+The database is kept in write-ahead logging (WAL) mode, so that many launchers
+can record simulations at the same time while the database is being queried.
+The database can also be opened read-only, in which case it is only queried.
+"""
+
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+
+try:
+    from urllib.request import pathname2url
+except ImportError:
+    from urllib import pathname2url
+
+from simtools.base import Dict, is_string
+from simtools.params import load_params
+
+REGISTRY_FILENAME = ".simruns.db"
+RUN_STATUSES = ('running', 'done', 'failed', 'error')
+RUN_INFO_COLUMNS = ('start_time', 'end_time', 'exit_status', 'cause', 'signal',
+                    'wall_time', 'user_time', 'system_time', 'max_rss')
+RUN_COLUMNS = (('run_id', 'sim_id', 'sim_path', 'cmd', 'params_filename',
+                'attempt', 'host', 'pid', 'status', 'launch_time')
+               + RUN_INFO_COLUMNS + ('error', ))
+TIMEOUT = 30.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    sim_id TEXT,
+    sim_path TEXT,
+    cmd TEXT,
+    params_filename TEXT,
+    attempt INTEGER,
+    host TEXT,
+    pid INTEGER,
+    status TEXT NOT NULL,
+    launch_time TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    exit_status INTEGER,
+    cause TEXT,
+    signal INTEGER,
+    wall_time REAL,
+    user_time REAL,
+    system_time REAL,
+    max_rss INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_status ON runs (status);
+CREATE INDEX IF NOT EXISTS runs_sim_id ON runs (sim_id);
+CREATE TABLE IF NOT EXISTS run_params (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    value
+);
+CREATE INDEX IF NOT EXISTS run_params_name_value ON run_params (name, value);
+"""
+
+
+class Registry(object):
+    """Registry of simulation runs kept in an SQLite database."""
+
+    def __init__(self, filename, timeout=TIMEOUT, read_only=False):
+        self.filename = filename
+        self.timeout = timeout
+        self.read_only = read_only
+
+        # If necessary, create the database in WAL mode (unless it is only to
+        # be queried, in which case it is not written to)
+        if not read_only:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(_SCHEMA)
+
+    def add_run(self, sim_id=None, sim_path=None, cmd=None,
+                params_filename=None, attempt=None, params=None):
+        """Record launch of a simulation."""
+        # Load parameters of the simulation, if possible and if they have not
+        # been passed directly, so that simulations can be found by the values
+        # of their scalar parameters
+        if params is None:
+            params = {}
+        if params_filename and not params:
+            try:
+                params = load_params(params_filename)
+            except Exception:
+                pass
+        params = [(name, value) for name, value in sorted(params.items())
+                  if value is None or isinstance(value, (bool, int, float))
+                  or is_string(value)]
+
+        # Record the launch of the simulation
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (sim_id, sim_path, cmd, params_filename, "
+                "attempt, host, pid, status, launch_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, 'running', ?)",
+                (sim_id, os.path.abspath(sim_path or os.curdir),
+                 json.dumps(cmd) if cmd is not None else None,
+                 (os.path.abspath(params_filename)
+                  if params_filename else None),
+                 attempt, platform.node(), os.getpid(), _format_time()))
+            run_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO run_params (run_id, name, value) "
+                "VALUES (?, ?, ?)",
+                [(run_id, name, value) for name, value in params])
+        return run_id
+
+    def finish_run(self, run_id, run_info):
+        """Record outcome and resource usage of a finished simulation."""
+        status = 'done' if run_info.get('exit_status') == 0 else 'failed'
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE runs SET status = ?, {} WHERE run_id = ?".format(
+                    ", ".join("{} = ?".format(column)
+                              for column in RUN_INFO_COLUMNS)),
+                [status] + [run_info.get(column)
+                            for column in RUN_INFO_COLUMNS] + [run_id])
+
+    def fail_run(self, run_id, error):
+        """Record error that prevented a simulation from finishing."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE runs SET status = 'error', end_time = ?, error = ? "
+                "WHERE run_id = ?", (_format_time(), error, run_id))
+
+    def move_sim(self, sim_path, new_sim_path):
+        """Record move of a simulation directory."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE runs SET sim_path = ? WHERE sim_path = ?",
+                (os.path.abspath(new_sim_path), os.path.abspath(sim_path)))
+
+    def count_runs(self, params=None):
+        """Count simulations by their status."""
+        where, args = _make_where(params=params)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) FROM runs{} GROUP BY status".format(
+                    where), args).fetchall()
+        counts = Dict((status, 0) for status in RUN_STATUSES)
+        counts.update(rows)
+        return counts
+
+    def find_runs(self, status=None, params=None, order_by='run_id',
+                  descending=False, limit=None):
+        """Find simulations by their status and parameters."""
+        # Validate sort column
+        if order_by not in RUN_COLUMNS:
+            raise ValueError("Column '{}' is not supported.".format(order_by))
+
+        # Find simulations
+        where, args = _make_where(status, params)
+        query = "SELECT {0} FROM runs{1} ORDER BY {2}{3}".format(
+            ", ".join(RUN_COLUMNS), where, order_by,
+            " DESC" if descending else "")
+        if limit is not None:
+            query += " LIMIT ?"
+            args.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(query, args).fetchall()
+        runs = [Dict(zip(RUN_COLUMNS, row)) for row in rows]
+        for run in runs:
+            if run.cmd is not None:
+                run.cmd = json.loads(run.cmd)
+        return runs
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Connect to the database for a single transaction."""
+        # If possible, open the database in read-only mode if it is only to
+        # be queried
+        if self.read_only and sys.version_info >= (3, 4):
+            conn = sqlite3.connect(
+                "file:{}?mode=ro".format(
+                    pathname2url(os.path.abspath(self.filename))),
+                timeout=self.timeout, uri=True)
+        else:
+            conn = sqlite3.connect(self.filename, timeout=self.timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+
+def _format_time():
+    """Format the current time as local date and time."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _make_where(status=None, params=None):
+    """Assemble WHERE clause selecting simulations."""
+    conditions = []
+    args = []
+    if status is not None:
+        statuses = [status] if is_string(status) else list(status)
+        for s in statuses:
+            if s not in RUN_STATUSES:
+                raise ValueError("Run status '{}' is not supported.".format(s))
+        conditions.append("status IN ({})".format(
+            ", ".join("?" for _ in statuses)))
+        args += statuses
+    for name, value in sorted((params or {}).items()):
+        conditions.append("run_id IN (SELECT run_id FROM run_params "
+                          "WHERE name = ? AND value = ?)")
+        args += [name, value]
+    where = " WHERE " + " AND ".join(conditions) if conditions else ""
+    return where, args
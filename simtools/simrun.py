@@ -3,46 +3,204 @@
 
 Simulation launch services provide the following functionality:
 
-- generating simulation id based on local date and time;
+- generating simulation id based on local date and time, optionally with
+  higher resolution and a host and process component, or as a ULID;
 - generating simulation directory name;
-- loading names of simulation directories from a text file;
+- placing simulation directories in a sharded layout of the master directory,
+  in which they are fanned out into two levels of subdirectories named after
+  the hash of the simulation id or its date and hour;
+- reserving a uniquely named simulation directory;
+- creating simulation directory under a partial name and renaming it to its
+  final name once the simulation has succeeded;
+- listing names of complete simulation directories;
+- loading names of simulation directories from a text file, possibly
+  streaming them lazily from the standard input, expanding glob patterns, and
+  skipping duplicates;
 - creating directory structure for simulation;
+- copying files to simulation directory, possibly as links or clones;
+- moving simulation directory, possibly to a different file system, replacing
+  its placeholder atomically;
 - normalizing the format of executable;
-- launching simulation.
+- assembling command line for simulation;
+- passing parameters to simulation through an environment variable instead of
+  a parameter file;
+- launching simulation, collecting its resource usage and saving it to a run
+  manifest or recording it in a run registry;
+- limiting wall time, memory, and CPU time of simulation;
+- redirecting output of simulation to log files, optionally capping their size
+  and compressing them;
+- dividing CPUs into slots for parallel simulations, taking NUMA nodes into
+  account;
+- placing simulation on CPUs, setting its thread count and priorities;
+- launching simulation in-process;
+- launching simulations forked from a server with preloaded modules.
 """
 
+from __future__ import print_function
+
+import binascii
+import ctypes
+import datetime
+import errno
+import fnmatch
+import functools
+import gzip
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.pool
 import os
+import platform
+import re
+import runpy
 import shlex
+import shutil
+import signal
+import stat
 import subprocess
+import sys
+import threading
 import time
+import traceback
 
 from simtools.argparse import all_options as options
-from simtools.base import is_iterable, is_string
+from simtools.base import (check_modules, Dict, is_iterable, is_string,
+                           parse_cpu_list)
+from simtools.params import encode_params, PARAMS_ENV_VAR
+from simtools.registry import Registry
+from simtools.utils import save_manifest
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import resource
+except ImportError:
+    resource = None
 
 TMP_DIR_PREFIX = "_"
+PARTIAL_DIR_SUFFIX = ".partial"
+MANIFEST_FILENAME = "run.json"
+SIM_ID_SCHEMES = ('datetime', 'datetime_us', 'unique', 'ulid')
+SHARD_SCHEMES = ('hash', 'date')
+SHARD_DEPTH = 2  # levels of shard directories
+DATE_SIM_ID = re.compile(r"^(\d{8})_(\d{2})")
+GLOB_MAGIC_CHARS = re.compile(r"[*?[]")
+MAX_RESERVE_ATTEMPTS = 100
+ULID_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford's Base32
+COPY_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+WRITE_MODE = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+FICLONE = 0x40049409  # Linux ioctl request cloning a file
+KILL_DELAY = 5.0  # seconds between terminating and killing on timeout
+MAX_ENV_STRING_SIZE = 1 << 17  # bytes (limit of Linux on a single string)
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                   'MKL_NUM_THREADS')
+NUMA_NODES_DIRNAME = "/sys/devices/system/node"
+IOPRIO_SET_SYSCALLS = {'x86_64': 251, 'i386': 289, 'i686': 289,
+                       'aarch64': 30, 'armv7l': 314, 'ppc64le': 273,
+                       's390x': 282}  # Linux system call numbers
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+
+_last_ulid = [0, 0]  # timestamp and random bits of the last generated ULID
 
 
-def generate_sim_id():
+def generate_sim_id(scheme='datetime'):
     """Generate simulation id based on local date and time."""
-    t = time.localtime()
-    sim_id = "{0:04}{1:02}{2:02}_{3:02}{4:02}{5:02}".format(
-        t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+    if scheme == 'datetime':
+        t = time.localtime()
+        sim_id = "{0:04}{1:02}{2:02}_{3:02}{4:02}{5:02}".format(
+            t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+    elif scheme == 'datetime_us':
+        sim_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    elif scheme == 'unique':
+        host = re.sub(r"[^0-9A-Za-z-]", "-", platform.node().split(".")[0])
+        sim_id = "{0}_{1}_{2}".format(
+            datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f"),
+            host or "localhost", os.getpid())
+    elif scheme == 'ulid':
+        sim_id = _generate_ulid()
+    else:
+        raise ValueError(
+            "Simulation id scheme '{}' is not supported.".format(scheme))
     return sim_id
 
 
-def generate_sim_dirname(tmp=False, sim_id=None):
+def generate_sim_dirname(tmp=False, sim_id=None, shard=None):
     """Generate simulation directory name."""
     if not sim_id:
         sim_id = generate_sim_id()
-    return sim_id if not tmp else TMP_DIR_PREFIX + sim_id
+    sim_dirname = sim_id if not tmp else TMP_DIR_PREFIX + sim_id
+    if shard is not None:
+        sim_dirname = shard_sim_dirname(sim_dirname, shard)
+    return sim_dirname
+
+
+def shard_sim_dirname(sim_dirname, scheme='hash'):
+    """Place simulation directory name in a sharded layout."""
+    # Determine the key of the simulation directory, which is its name without
+    # the partial name decoration and the temporary prefix, so that all names
+    # of the same simulation directory are placed in the same shard
+    key = sim_dirname
+    if is_partial_dirname(key):
+        key = key[len(TMP_DIR_PREFIX):-len(PARTIAL_DIR_SUFFIX)]
+    if key.startswith(TMP_DIR_PREFIX):
+        key = key[len(TMP_DIR_PREFIX):]
+
+    # Determine the shard directories either from the hash of the key or from
+    # the date and hour at the beginning of the key
+    if scheme == 'hash':
+        digest = hashlib.md5(key.encode('utf-8')).hexdigest()
+        shard_dirnames = [digest[2 * level:2 * level + 2]
+                          for level in range(SHARD_DEPTH)]
+    elif scheme == 'date':
+        match = DATE_SIM_ID.match(key)
+        if match is None:
+            raise ValueError("Simulation directory name '{}' does not start "
+                             "with date and hour.".format(sim_dirname))
+        shard_dirnames = list(match.groups())
+    else:
+        raise ValueError(
+            "Shard scheme '{}' is not supported.".format(scheme))
+    return os.path.join(*(shard_dirnames + [sim_dirname]))
+
+
+def generate_partial_dirname(sim_dirname):
+    """Generate partial name of simulation directory."""
+    return TMP_DIR_PREFIX + sim_dirname + PARTIAL_DIR_SUFFIX
 
 
-def make_dirs(sim_dirname, sim_master_dirname=None, data_dirname=None):
+def is_partial_dirname(sim_dirname):
+    """Check if simulation directory name is a partial one."""
+    sim_dirname = os.path.basename(os.path.normpath(sim_dirname))
+    return (sim_dirname.startswith(TMP_DIR_PREFIX)
+            and sim_dirname.endswith(PARTIAL_DIR_SUFFIX)
+            and len(sim_dirname) > len(TMP_DIR_PREFIX + PARTIAL_DIR_SUFFIX))
+
+
+def make_dirs(sim_dirname, sim_master_dirname=None, data_dirname=None,
+              partial=False, shard=None):
     """Create directory structure for simulation."""
+    # If requested, place the simulation directory in a sharded layout
+    if shard is not None:
+        sim_dirname = shard_sim_dirname(sim_dirname, shard)
+
     if sim_master_dirname is not None:
         sim_path = os.path.join(sim_master_dirname, sim_dirname)
     else:
         sim_path = sim_dirname
+
+    # If requested, create simulation directory under its partial name,
+    # provided that the final one is not taken yet
+    if partial:
+        if os.path.lexists(sim_path):
+            raise OSError(errno.EEXIST, "Simulation directory already exists",
+                          sim_path)
+        sim_path = os.path.join(os.path.dirname(sim_path),
+                                generate_partial_dirname(
+                                    os.path.basename(sim_path)))
+
     os.makedirs(sim_path)  # raises an error if simulation directory already
                            # exists
     if data_dirname is not None:
@@ -50,9 +208,236 @@ def make_dirs(sim_dirname, sim_master_dirname=None, data_dirname=None):
     return sim_path
 
 
-def run_sim(model_filename, params_filename=None, sim_id=None,
-            data_dirname=None, executable=None, model_args=None):
-    """Launch simulation."""
+def finalize_sim_dir(sim_path, registry_filename=None,
+                     manifest_filename=None):
+    """Rename simulation directory from its partial name to its final one."""
+    # Determine the final name of the simulation directory
+    if not is_partial_dirname(sim_path):
+        raise ValueError("'{}' is not a partial name of simulation "
+                         "directory.".format(sim_path))
+    parent_dirname, partial_dirname = os.path.split(os.path.normpath(sim_path))
+    final_sim_path = os.path.join(
+        parent_dirname,
+        partial_dirname[len(TMP_DIR_PREFIX):-len(PARTIAL_DIR_SUFFIX)])
+
+    # Rename the simulation directory, unless the final name has been taken
+    # meanwhile (renaming a directory would silently replace an empty one)
+    if os.path.lexists(final_sim_path):
+        raise OSError(errno.EEXIST, "Simulation directory already exists",
+                      final_sim_path)
+    os.rename(sim_path, final_sim_path)
+
+    # If necessary, record the final name in the run manifest and the run
+    # registry
+    _record_sim_move(sim_path, final_sim_path, registry_filename,
+                     manifest_filename)
+    return final_sim_path
+
+
+def list_sim_dirnames(sim_master_dirname=None, shard=None):
+    """List names of complete simulation directories in a directory."""
+    if sim_master_dirname is None:
+        sim_master_dirname = os.curdir
+    if not os.path.isdir(sim_master_dirname):
+        raise OSError(errno.ENOENT, "No such directory", sim_master_dirname)
+
+    # If necessary, descend through shard directories, whose names are
+    # prepended to the names of simulation directories
+    dirnames = [""]
+    if shard is not None:
+        for _ in range(SHARD_DEPTH):
+            dirnames = [os.path.join(dirname, subdirname)
+                        for dirname in dirnames
+                        for subdirname in _list_subdirnames(
+                            os.path.join(sim_master_dirname, dirname))
+                        if not subdirname.startswith(".")]
+
+    # Skip hidden directories (such as the content-addressed store) and
+    # simulation directories under partial names, judging by names alone
+    return sorted(
+        os.path.join(dirname, name) for dirname in dirnames
+        for name in _list_subdirnames(os.path.join(sim_master_dirname,
+                                                   dirname))
+        if not name.startswith(".") and not is_partial_dirname(name))
+
+
+def reserve_sim_dir(sim_master_dirname=None, data_dirname=None, tmp=False,
+                    scheme='unique', max_attempts=MAX_RESERVE_ATTEMPTS,
+                    partial=False, shard=None):
+    """Create simulation directory with a newly generated unique name."""
+    # If necessary, create simulation master directory
+    if sim_master_dirname is not None:
+        try:
+            os.makedirs(sim_master_dirname)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+    # Atomically create simulation directory, generating a new simulation id
+    # whenever the directory already exists (if the same simulation id is
+    # generated again, make it unique by appending a counter)
+    prev_sim_id = None
+    n_repeats = 0
+    for _ in range(max_attempts):
+        sim_id = generate_sim_id(scheme)
+        if sim_id == prev_sim_id:
+            n_repeats += 1
+            unique_sim_id = "{0}_{1}".format(sim_id, n_repeats)
+        else:
+            n_repeats = 0
+            unique_sim_id = sim_id
+        prev_sim_id = sim_id
+        sim_dirname = generate_sim_dirname(tmp, unique_sim_id, shard)
+        if sim_master_dirname is not None:
+            sim_path = os.path.join(sim_master_dirname, sim_dirname)
+        else:
+            sim_path = sim_dirname
+
+        # If necessary, create shard directories, which may be created by
+        # several processes at the same time
+        if shard is not None:
+            try:
+                os.makedirs(os.path.dirname(sim_path))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        # If requested, create the simulation directory under its partial
+        # name, provided that the final one is not taken yet
+        if partial:
+            if os.path.lexists(sim_path):
+                continue
+            sim_path = os.path.join(os.path.dirname(sim_path),
+                                    generate_partial_dirname(
+                                        os.path.basename(sim_path)))
+        try:
+            os.mkdir(sim_path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            continue
+        if data_dirname is not None:
+            os.makedirs(os.path.join(sim_path, data_dirname))
+        return unique_sim_id, sim_path
+    raise OSError(errno.EEXIST, "Reserving simulation directory failed after "
+                  "{} attempts.".format(max_attempts))
+
+
+def cpu_slots(n_slots, cpus_per_slot=None):
+    """Divide available CPUs into slots for parallel simulations."""
+    # Determine available CPUs ordered by NUMA nodes so that consecutive CPUs
+    # belong to the same node whenever possible
+    if hasattr(os, 'sched_getaffinity'):
+        available_cpus = set(os.sched_getaffinity(0))
+    else:
+        available_cpus = set(range(multiprocessing.cpu_count()))
+    cpus = []
+    for node_cpus in _numa_nodes():
+        cpus += sorted(available_cpus.intersection(node_cpus))
+    cpus += sorted(available_cpus.difference(cpus))
+
+    # Assign consecutive CPUs to slots, reusing CPUs in a round-robin manner
+    # if there are not enough of them
+    if cpus_per_slot is None:
+        cpus_per_slot = max(len(cpus) // n_slots, 1)
+    return [[cpus[(s * cpus_per_slot + c) % len(cpus)]
+             for c in range(cpus_per_slot)] for s in range(n_slots)]
+
+
+def place_process(cpus=None, nice=None, ionice=None, pid=0):
+    """Place a process on CPUs and set its priorities."""
+    if cpus is not None:
+        if not hasattr(os, 'sched_setaffinity'):
+            raise OSError("CPU affinity is not supported on this platform.")
+        os.sched_setaffinity(pid, cpus)
+    if nice is not None:
+        if pid:
+            os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(
+                os.PRIO_PROCESS, pid) + nice)
+        else:
+            os.nice(nice)
+    if ionice is not None:
+        _set_ioprio(ionice, pid)
+
+
+def copy_file(src_filename, dst_filename, mode='copy'):
+    """Copy file, possibly as a link or a clone."""
+    # Validate copy mode
+    if mode not in COPY_MODES:
+        raise ValueError("Copy mode '{}' is not supported.".format(mode))
+
+    # If the destination is a directory, copy the file into it
+    if os.path.isdir(dst_filename):
+        dst_filename = os.path.join(dst_filename,
+                                    os.path.basename(src_filename))
+
+    # Copy the file according to the copy mode
+    if mode == 'hardlink':
+        # The link shares its inode, including permissions, with the original
+        # file, so the original file is linked only if it is already
+        # read-only, since making it read-only would change the original file
+        # and leaving it writable would let a simulation modify the original
+        # file; otherwise, as well as if the destination is on a different
+        # file system, a read-only copy is made instead
+        linked = False
+        if not os.stat(src_filename).st_mode & WRITE_MODE:
+            try:
+                os.link(src_filename, dst_filename)
+                linked = True
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+        if not linked:
+            shutil.copy(src_filename, dst_filename)
+            os.chmod(dst_filename, stat.S_IMODE(
+                os.stat(dst_filename).st_mode) & ~WRITE_MODE)
+    elif mode == 'reflink':
+        if not _clone_file(src_filename, dst_filename):
+            shutil.copy(src_filename, dst_filename)
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(src_filename), dst_filename)
+    else:
+        shutil.copy(src_filename, dst_filename)
+    return dst_filename
+
+
+def move_sim_dir(src_dirname, dst_dirname, n_workers=None,
+                 registry_filename=None, manifest_filename=None):
+    """Move simulation directory, replacing an empty placeholder, if any."""
+    # If the destination is an empty placeholder (possibly containing empty
+    # directories only), remove its contents so that the simulation directory
+    # can replace it
+    if os.path.isdir(dst_dirname):
+        _remove_empty_dirs(dst_dirname)
+
+    # Atomically rename the simulation directory; if the destination is on a
+    # different file system, copy the simulation directory in parallel to a
+    # temporary directory next to the destination first, and then atomically
+    # rename the temporary directory
+    try:
+        os.rename(src_dirname, dst_dirname)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        dst_parent_dirname, dst_basename = os.path.split(
+            os.path.normpath(dst_dirname))
+        tmp_dirname = os.path.join(
+            dst_parent_dirname, "{0}{1}.{2}".format(TMP_DIR_PREFIX,
+                                                    dst_basename, os.getpid()))
+        _copy_tree(src_dirname, tmp_dirname, n_workers)
+        os.rename(tmp_dirname, dst_dirname)
+        shutil.rmtree(src_dirname)
+
+    # If necessary, record the new location in the run manifest and the run
+    # registry
+    _record_sim_move(src_dirname, dst_dirname, registry_filename,
+                     manifest_filename)
+    return dst_dirname
+
+
+def make_sim_cmd(model_filename, params_filename=None, sim_id=None,
+                 data_dirname=None, executable=None, model_args=None):
+    """Assemble command line for simulation."""
     cmd = []
     if executable:
         if is_string(executable):
@@ -72,7 +457,348 @@ def run_sim(model_filename, params_filename=None, sim_id=None,
     cmd.append(options['save_data']['arg'][1])
     if model_args:
         cmd += model_args
-    return subprocess.call(cmd)
+    return cmd
+
+
+def run_sim(model_filename, params_filename=None, sim_id=None,
+            data_dirname=None, executable=None, model_args=None,
+            sim_path=None, manifest_filename=None, registry_filename=None,
+            params=None, **kwargs):
+    """Launch simulation."""
+    # Validate parameters passed through an environment variable
+    if params is not None and params_filename:
+        raise ValueError("Both 'params_filename' and 'params' are specified.")
+
+    # Determine absolute paths to the model file and the parameter file, since
+    # the simulation runs in the simulation directory
+    cmd = make_sim_cmd(os.path.abspath(model_filename),
+                       os.path.abspath(params_filename)
+                       if params_filename else None,
+                       sim_id, data_dirname, executable, model_args)
+
+    # If necessary, record the launch in a run registry, along with its outcome
+    # once the simulation finishes
+    if registry_filename:
+        registry = Registry(registry_filename)
+        run_id = registry.add_run(sim_id, sim_path, cmd, params_filename,
+                                  params=params)
+        try:
+            run_info = run_sim_cmd(cmd, sim_path, params=params, **kwargs)
+        except Exception:
+            registry.fail_run(run_id, traceback.format_exc())
+            raise
+        registry.finish_run(run_id, run_info)
+    else:
+        run_info = run_sim_cmd(cmd, sim_path, params=params, **kwargs)
+
+    # If necessary, save run information to a manifest in the simulation
+    # directory
+    if manifest_filename:
+        if sim_path is not None:
+            manifest_filename = os.path.join(sim_path, manifest_filename)
+        save_manifest(manifest_filename, run_info)
+
+    return run_info.exit_status
+
+
+def run_sim_cmd(cmd, sim_path=None, timeout=None, max_memory=None,
+                max_cpu_time=None, stdout=None, stderr=None,
+                log_max_size=None, compress_logs=False, cpus=None,
+                n_threads=None, nice=None, ionice=None, params=None):
+    """Launch simulation command and collect run information."""
+    # Determine resource limits of the child process
+    limits = []
+    if max_memory is not None:
+        limits.append(('RLIMIT_AS', max_memory, max_memory))
+    if max_cpu_time is not None:
+        # Exceeding the soft limit sends SIGXCPU, and exceeding the hard limit
+        # sends SIGKILL
+        limits.append(('RLIMIT_CPU', max_cpu_time, max_cpu_time + 1))
+    if limits and resource is None:
+        raise OSError("Resource limits are not supported on this platform.")
+
+    # Check if parameters passed through an environment variable fit in it,
+    # since a larger environment string would fail to be passed at all
+    if params is not None:
+        encoded_params = encode_params(params)
+        if (len(PARAMS_ENV_VAR) + len(encoded_params) + 2
+                > MAX_ENV_STRING_SIZE):
+            raise ValueError(
+                "Parameters are too large to be passed through environment "
+                "variable '{}' (use a parameter file instead).".format(
+                    PARAMS_ENV_VAR))
+
+    run_info = Dict()
+    run_info.cmd = list(cmd)
+    run_info.sim_path = os.path.abspath(sim_path or os.curdir)
+
+    # If necessary, open log files in the simulation directory, to which the
+    # standard output and standard error of the child process are redirected
+    # directly
+    log_paths = []
+    if stdout is not None:
+        log_paths.append(os.path.join(sim_path or os.curdir, stdout))
+    if stderr is not None and stderr != stdout:
+        log_paths.append(os.path.join(sim_path or os.curdir, stderr))
+    log_files = [open(log_path, 'wb') for log_path in log_paths]
+    stdout_file = log_files[0] if stdout is not None else None
+    if stderr is not None:
+        stderr_file = (subprocess.STDOUT if stderr == stdout
+                       else log_files[-1])
+    else:
+        stderr_file = None
+
+    # If necessary, limit the number of threads of the child process to match
+    # the number of its CPUs
+    if n_threads is None and cpus is not None:
+        n_threads = len(cpus)
+    env = _make_thread_env(n_threads) if n_threads is not None else None
+
+    # If necessary, pass parameters to the child process through an
+    # environment variable, so that no parameter file has to be written by the
+    # launcher and read by the model script; otherwise, do not let the child
+    # process inherit parameters passed to this process
+    if params is not None:
+        if env is None:
+            env = dict(os.environ)
+        env[PARAMS_ENV_VAR] = encoded_params
+    elif PARAMS_ENV_VAR in os.environ:
+        if env is None:
+            env = dict(os.environ)
+        del env[PARAMS_ENV_VAR]
+
+    # Launch simulation as a child process, if there is a timeout, in its own
+    # process group (a new session) so that the whole group can be killed.
+    # Running code in the child process before the simulation command is
+    # executed is not safe if the launcher has other threads (as in
+    # 'run_batch()'), so the child process is set up that way only where
+    # the platform offers no alternative
+    new_group = timeout is not None and hasattr(os, 'killpg')
+    popen_kwargs = {}
+    if new_group and sys.version_info >= (3, 2):
+        popen_kwargs['start_new_session'] = True
+        child_group = False
+    else:
+        child_group = new_group
+    if hasattr(resource, 'prlimit'):
+        child_limits = []
+    else:
+        child_limits, limits = limits, []
+    placement = (cpus, nice, ionice)
+    if hasattr(os, 'setpriority'):
+        child_placement = (None, None, None)
+    else:
+        child_placement, placement = placement, (None, None, None)
+    if child_group or child_limits or any(
+            x is not None for x in child_placement):
+        popen_kwargs['preexec_fn'] = functools.partial(
+            _prepare_child, child_group, child_limits, *child_placement)
+    start_time = time.time()
+    run_info.start_time = _format_time(start_time)
+    try:
+        process = subprocess.Popen(cmd, cwd=sim_path, env=env,
+                                   stdout=stdout_file, stderr=stderr_file,
+                                   **popen_kwargs)
+    finally:
+        for log_file in log_files:
+            log_file.close()
+
+    # If possible, limit resources of the child process, place it on CPUs,
+    # and set its priorities once it has been started, stopping it if that
+    # fails
+    try:
+        for limit_name, soft_limit, hard_limit in limits:
+            resource.prlimit(process.pid, getattr(resource, limit_name),
+                             (soft_limit, hard_limit))
+        if any(x is not None for x in placement):
+            place_process(*placement, pid=process.pid)
+    except Exception:
+        process.kill()
+        process.wait()
+        raise
+
+    # If necessary, start a timer that stops the child process on timeout
+    if timeout is not None:
+        finished = threading.Event()
+        timed_out = threading.Event()
+        timer = threading.Thread(
+            target=_expire,
+            args=(process, new_group, timeout, finished, timed_out))
+        timer.daemon = True
+        timer.start()
+
+    # Wait for the child process to finish, if possible retrieving its resource
+    # usage (which includes the usage by its descendants that it waited for,
+    # such as the model run by an interpreter specified as the executable)
+    if hasattr(os, 'wait4'):
+        _, status, rusage = os.wait4(process.pid, 0)
+        if os.WIFSIGNALED(status):
+            process.returncode = -os.WTERMSIG(status)
+        else:
+            process.returncode = os.WEXITSTATUS(status)
+    else:
+        process.wait()
+        rusage = None
+    end_time = time.time()
+    if timeout is not None:
+        finished.set()
+        timer.join()
+
+    # Collect run information
+    run_info.end_time = _format_time(end_time)
+    run_info.exit_status = process.returncode
+    if timeout is not None and timed_out.is_set():
+        run_info.cause = 'timeout'
+    elif process.returncode < 0:
+        run_info.cause = 'signal'
+        run_info.signal = -process.returncode
+    else:
+        run_info.cause = 'exit'
+    run_info.wall_time = end_time - start_time
+    if rusage is not None:
+        run_info.user_time = rusage.ru_utime
+        run_info.system_time = rusage.ru_stime
+        run_info.max_rss = rusage.ru_maxrss * (
+            1 if sys.platform == 'darwin' else 1024)  # bytes
+        run_info.in_blocks = rusage.ru_inblock
+        run_info.out_blocks = rusage.ru_oublock
+        run_info.vol_ctx_switches = rusage.ru_nvcsw
+        run_info.invol_ctx_switches = rusage.ru_nivcsw
+
+    # If necessary, cap the size of log files and compress them
+    if log_paths:
+        run_info.logs = [_finish_log(log_path, log_max_size, compress_logs)
+                         for log_path in log_paths]
+    return run_info
+
+
+def run_sim_inproc(model_filename, params_filename=None, sim_id=None,
+                   data_dirname=None, model_args=None, sim_path=None,
+                   params=None):
+    """Launch simulation in-process."""
+    # Determine absolute paths to the model file and the parameter file before
+    # possibly changing the current working directory
+    model_path = os.path.abspath(model_filename)
+    if params_filename:
+        params_filename = os.path.abspath(params_filename)
+
+    # Run the model script in a fresh '__main__' namespace as if it were
+    # invoked from the command line in the simulation directory
+    saved_argv = sys.argv
+    saved_path = list(sys.path)
+    saved_cwd = os.getcwd()
+    saved_params = os.environ.pop(PARAMS_ENV_VAR, None)
+    try:
+        if sim_path is not None:
+            os.chdir(sim_path)
+        if params is not None:
+            os.environ[PARAMS_ENV_VAR] = encode_params(params)
+        sys.argv = make_sim_cmd(model_path, params_filename, sim_id,
+                                data_dirname, model_args=model_args)
+        sys.path.insert(0, os.path.dirname(model_path))
+        try:
+            runpy.run_path(model_path, run_name='__main__')
+        except SystemExit as e:
+            status = _exit_status(e.code)
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        else:
+            status = 0
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        os.chdir(saved_cwd)
+        if saved_params is None:
+            os.environ.pop(PARAMS_ENV_VAR, None)
+        else:
+            os.environ[PARAMS_ENV_VAR] = saved_params
+    return status
+
+
+class ForkServer(object):
+    """Server forking simulations from a process with preloaded modules."""
+
+    _preload = []  # modules to be preloaded (the latest setting applies)
+    _started_preload = None  # modules preloaded by the running server
+
+    def __init__(self, preload=None):
+        # Check if forking simulations from a server is supported
+        if (not hasattr(multiprocessing, 'get_context')
+            or 'forkserver' not in multiprocessing.get_all_start_methods()):
+            raise OSError("Fork server is not supported on this platform.")
+
+        # Validate names of modules to be preloaded, checking that they can be
+        # imported (the server would otherwise ignore errors silently)
+        if preload is None:
+            preload = []
+        elif is_string(preload):
+            raise TypeError("'preload' is a string.")
+        preload = list(preload)
+        check_modules(preload)
+
+        # There is only one server per process, which imports the modules to
+        # be preloaded once, before forking the first simulation, and keeps
+        # running afterwards, so other modules cannot be preloaded once it has
+        # been started
+        if (ForkServer._started_preload is not None
+                and not set(preload) <= set(ForkServer._started_preload)):
+            raise ValueError("Fork server has already been started with "
+                             "modules {} preloaded.".format(
+                                 ForkServer._started_preload))
+        ForkServer._preload = preload
+        self._context = multiprocessing.get_context('forkserver')
+        self._context.set_forkserver_preload(preload)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Stop the server along with its preloaded modules."""
+        # The server is shared by the whole process, so it is started again
+        # (possibly with other modules preloaded) along with the next
+        # simulation forked from any server; simulations that have already
+        # been forked keep running
+        import multiprocessing.forkserver
+        stop = getattr(multiprocessing.forkserver._forkserver, '_stop', None)
+        if stop is not None:
+            stop()
+            ForkServer._started_preload = None
+
+    def start_sim(self, model_filename, params_filename=None, sim_id=None,
+                  data_dirname=None, model_args=None, sim_path=None,
+                  cpus=None, n_threads=None, nice=None, ionice=None,
+                  params=None):
+        """Start simulation forked from the server."""
+        # If necessary, record the modules preloaded by the server, which is
+        # started along with the first simulation
+        if ForkServer._started_preload is None:
+            ForkServer._started_preload = ForkServer._preload
+        process = self._context.Process(
+            target=_run_forked_sim,
+            args=(os.path.abspath(model_filename), params_filename, sim_id,
+                  data_dirname, model_args,
+                  os.path.abspath(sim_path) if sim_path is not None
+                  else os.getcwd(),
+                  cpus, n_threads, nice, ionice, params))
+        process.start()
+        return process
+
+    def run_sim(self, model_filename, params_filename=None, sim_id=None,
+                data_dirname=None, model_args=None, sim_path=None,
+                cpus=None, n_threads=None, nice=None, ionice=None,
+                params=None):
+        """Launch simulation forked from the server."""
+        process = self.start_sim(model_filename, params_filename, sim_id,
+                                 data_dirname, model_args, sim_path, cpus,
+                                 n_threads, nice, ionice, params)
+        process.join()
+        return process.exitcode
 
 
 def norm_executable(executable):
@@ -87,24 +813,335 @@ def norm_executable(executable):
     return executable
 
 
-def load_sim_dirnames(filename):
+def load_sim_dirnames(filename, shard=None):
     """Load names of simulation directories from a file."""
+    with open(filename) as sim_dirnames_file:
+        return list(_parse_sim_dirnames(sim_dirnames_file, shard))
+
+
+def iter_sim_dirnames(filename, sim_master_dirname=None, unique=True,
+                      shard=None):
+    """Iterate over names of simulation directories listed in a file."""
+    # Read names of simulation directories from the standard input if the
+    # filename is '-'
+    if filename == "-":
+        sim_dirnames_file = sys.stdin
+    else:
+        sim_dirnames_file = open(filename)
+
+    # Yield names of simulation directories as they are read, expanding glob
+    # patterns relative to the master directory and, if requested, skipping
+    # names that have already been yielded
+    try:
+        yielded_sim_dirnames = set()
+        for sim_dirname in _parse_sim_dirnames(sim_dirnames_file, shard):
+            if GLOB_MAGIC_CHARS.search(sim_dirname):
+                sim_dirnames = _glob_dirnames(sim_dirname, sim_master_dirname)
+            else:
+                sim_dirnames = [sim_dirname]
+            for sim_dirname in sim_dirnames:
+                if unique:
+                    if sim_dirname in yielded_sim_dirnames:
+                        continue
+                    yielded_sim_dirnames.add(sim_dirname)
+                yield sim_dirname
+    finally:
+        if sim_dirnames_file is not sys.stdin:
+            sim_dirnames_file.close()
+
+
+def _parse_sim_dirnames(lines, shard=None):
+    """Parse names of simulation directories from lines of text."""
     COMMENT_START_TOKEN = "#"
 
-    sim_dirnames = []
-    with open(filename) as sim_dirnames_file:
-        for line in sim_dirnames_file:
-            # Strip leading and trailing whitespace from the line
-            stripped_line = line.strip()
+    for line in lines:
+        # Strip leading and trailing whitespace from the line
+        stripped_line = line.strip()
+
+        # If the stripped line is empty or contains only a comment, skip it
+        if (not stripped_line
+            or stripped_line.startswith(COMMENT_START_TOKEN)):
+            continue
+
+        # Assume that the stripped line contains a directory path and
+        # normalize it according to the platform
+        sim_dirname = os.path.normpath(stripped_line.replace("\\", os.sep))
+
+        # If necessary, resolve a bare name of a simulation directory through
+        # the sharded layout (a glob pattern matches any shard directories)
+        if shard is not None and os.sep not in sim_dirname:
+            if GLOB_MAGIC_CHARS.search(sim_dirname):
+                sim_dirname = os.path.join(
+                    *(["*"] * SHARD_DEPTH + [sim_dirname]))
+            else:
+                sim_dirname = shard_sim_dirname(sim_dirname, shard)
+        yield sim_dirname
+
+
+def _glob_dirnames(pattern, root_dirname=None):
+    """Find names of directories matching a glob pattern."""
+    # Split the pattern into components, keeping the anchor of an absolute
+    # pattern as the initial directory
+    if os.path.isabs(pattern):
+        drive, pattern = os.path.splitdrive(pattern)
+        dirnames = [drive + os.sep]
+        pattern = pattern.lstrip(os.sep)
+    else:
+        dirnames = [""]
+
+    # Match each component in turn, listing only the directories that have
+    # matched the previous components, each of them once, and without
+    # querying the status of entries separately where possible (hidden
+    # directories and simulation directories under partial names match only
+    # components that explicitly refer to them)
+    for component in pattern.split(os.sep):
+        if not GLOB_MAGIC_CHARS.search(component):
+            dirnames = [os.path.join(dirname, component)
+                        for dirname in dirnames]
+            continue
+        matched_dirnames = []
+        for dirname in dirnames:
+            for subdirname in sorted(_list_subdirnames(
+                    os.path.join(root_dirname or os.curdir, dirname))):
+                if (fnmatch.fnmatch(subdirname, component)
+                    and (not subdirname.startswith(".")
+                         or component.startswith("."))
+                    and (not is_partial_dirname(subdirname)
+                         or is_partial_dirname(component))):
+                    matched_dirnames.append(os.path.join(dirname,
+                                                         subdirname))
+        dirnames = matched_dirnames
+    return dirnames
+
+
+def _list_subdirnames(dirname):
+    """List names of subdirectories of a directory."""
+    try:
+        # If possible, determine whether entries are directories from the
+        # directory listing itself
+        if hasattr(os, 'scandir'):
+            return [entry.name for entry in os.scandir(dirname)
+                    if entry.is_dir()]
+        return [name for name in os.listdir(dirname)
+                if os.path.isdir(os.path.join(dirname, name))]
+    except OSError as e:
+        if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+            raise
+        return []
+
+
+def _generate_ulid():
+    """Generate universally unique lexicographically sortable identifier."""
+    ULID_LENGTH = 26
+    N_RANDOM_BITS = 80
+
+    # Combine 48-bit timestamp in milliseconds with 80 random bits; within the
+    # same millisecond, increment the random bits of the previous identifier
+    # so that identifiers generated by the process are strictly increasing
+    timestamp = int(time.time() * 1000)
+    if timestamp <= _last_ulid[0]:
+        timestamp = _last_ulid[0]
+        randomness = _last_ulid[1] + 1
+    else:
+        randomness = int(binascii.hexlify(os.urandom(N_RANDOM_BITS // 8)), 16)
+    _last_ulid[:] = [timestamp, randomness]
+    value = (timestamp << N_RANDOM_BITS) | randomness
+
+    # Encode the combined value using Crockford's Base32
+    chars = []
+    for _ in range(ULID_LENGTH):
+        chars.append(ULID_ALPHABET[value & 0x1f])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def _clone_file(src_filename, dst_filename):
+    """Clone file sharing its data blocks, if supported."""
+    if fcntl is None:
+        return False
+    with open(src_filename, 'rb') as src_file:
+        with open(dst_filename, 'wb') as dst_file:
+            try:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            except (IOError, OSError):
+                cloned = False
+            else:
+                cloned = True
+    if cloned:
+        shutil.copymode(src_filename, dst_filename)
+    else:
+        os.remove(dst_filename)
+    return cloned
+
+
+def _copy_tree(src_dirname, dst_dirname, n_workers):
+    """Copy directory tree, copying files in parallel."""
+    # Recreate directories and symbolic links, collecting files to be copied
+    filenames = []
+    for root, dirnames, files in os.walk(src_dirname):
+        dst_root = os.path.normpath(os.path.join(
+            dst_dirname, os.path.relpath(root, src_dirname)))
+        os.mkdir(dst_root)
+        shutil.copystat(root, dst_root)
+        for name in dirnames + files:
+            src_path = os.path.join(root, name)
+            dst_path = os.path.join(dst_root, name)
+            if os.path.islink(src_path):
+                os.symlink(os.readlink(src_path), dst_path)
+            elif name in files:
+                filenames.append((src_path, dst_path))
+        dirnames[:] = [dirname for dirname in dirnames
+                       if not os.path.islink(os.path.join(root, dirname))]
+
+    # Copy files
+    pool = multiprocessing.pool.ThreadPool(n_workers)
+    try:
+        pool.map(lambda paths: shutil.copy2(*paths), filenames, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _record_sim_move(sim_path, new_sim_path, registry_filename=None,
+                     manifest_filename=None):
+    """Record new path to a simulation directory that has been moved."""
+    # If necessary, update the path in the run manifest, if it has been saved
+    if manifest_filename:
+        manifest_path = os.path.join(new_sim_path, manifest_filename)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest_file:
+                run_info = json.load(manifest_file)
+            run_info['sim_path'] = os.path.abspath(new_sim_path)
+            save_manifest(manifest_path, run_info)
+
+    # If necessary, update the path in the run registry
+    if registry_filename:
+        Registry(registry_filename).move_sim(sim_path, new_sim_path)
+
+
+def _remove_empty_dirs(dirname):
+    """Remove empty directories in a directory, failing if there are files."""
+    for root, dirnames, _ in os.walk(dirname, topdown=False):
+        for subdirname in dirnames:
+            os.rmdir(os.path.join(root, subdirname))
+
+
+def _prepare_child(new_group, limits, cpus, nice, ionice):
+    """Prepare child process before executing simulation command."""
+    if new_group:
+        os.setpgid(0, 0)
+    for limit_name, soft_limit, hard_limit in limits:
+        resource.setrlimit(getattr(resource, limit_name),
+                           (soft_limit, hard_limit))
+    place_process(cpus, nice, ionice)
+
+
+def _make_thread_env(n_threads):
+    """Create environment limiting the number of threads of OpenMP and BLAS."""
+    env = dict(os.environ)
+    for env_var in THREAD_ENV_VARS:
+        env[env_var] = str(n_threads)
+    return env
+
+
+def _numa_nodes():
+    """Retrieve lists of CPUs belonging to individual NUMA nodes."""
+    nodes = []
+    try:
+        node_dirnames = os.listdir(NUMA_NODES_DIRNAME)
+    except OSError:
+        return nodes
+    for node_dirname in sorted(node_dirnames):
+        if not re.match(r"^node\d+$", node_dirname):
+            continue
+        with open(os.path.join(NUMA_NODES_DIRNAME, node_dirname,
+                               "cpulist")) as cpulist_file:
+            nodes.append(parse_cpu_list(cpulist_file.read()))
+    return nodes
+
+
+def _set_ioprio(ionice, pid=0):
+    """Set I/O scheduling class and priority of a process."""
+    # Determine I/O scheduling class and priority
+    if is_iterable(ionice):
+        io_class, io_level = ionice
+    else:
+        io_class, io_level = ionice, 0
+
+    # Set I/O priority using the Linux system call
+    syscall_nr = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if not sys.platform.startswith('linux') or syscall_nr is None:
+        raise OSError("I/O priority is not supported on this platform.")
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(syscall_nr, IOPRIO_WHO_PROCESS, pid,
+                    (io_class << IOPRIO_CLASS_SHIFT) | io_level) != 0:
+        e = ctypes.get_errno()
+        raise OSError(e, os.strerror(e))
+
+
+def _expire(process, new_group, timeout, finished, timed_out):
+    """Stop child process (along with its group) on timeout."""
+    if finished.wait(timeout):
+        return
+    timed_out.set()
+    _signal_child(process, new_group, signal.SIGTERM)
+    if not finished.wait(KILL_DELAY):
+        _signal_child(process, new_group,
+                      getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+
+def _signal_child(process, new_group, signum):
+    """Send signal to child process or its process group."""
+    try:
+        if new_group:
+            os.killpg(process.pid, signum)
+        else:
+            process.send_signal(signum)
+    except OSError as e:
+        if e.errno != errno.ESRCH:
+            raise
+
+
+def _finish_log(log_path, log_max_size, compress_log):
+    """Cap the size of a finished log file and compress it."""
+    if log_max_size is not None and os.path.getsize(log_path) > log_max_size:
+        with open(log_path, 'r+b') as log_file:
+            log_file.truncate(log_max_size)
+    if compress_log:
+        with open(log_path, 'rb') as log_file:
+            with gzip.open(log_path + ".gz", 'wb') as compressed_log_file:
+                shutil.copyfileobj(log_file, compressed_log_file)
+        os.remove(log_path)
+        log_path += ".gz"
+    return os.path.abspath(log_path)
+
+
+def _format_time(t):
+    """Format time in seconds since the epoch as local date and time."""
+    return datetime.datetime.fromtimestamp(t).isoformat()
+
+
+def _exit_status(code):
+    """Determine exit status corresponding to the code of 'SystemExit'."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
 
-            # If the stripped line is empty or contains only a comment, skip it
-            if (not stripped_line
-                or stripped_line.startswith(COMMENT_START_TOKEN)):
-                continue
 
-            # Assume that the stripped line contains a directory path and
-            # normalize it according to the platform
-            sim_dirname = os.path.normpath(stripped_line.replace("\\", os.sep))
+def _run_forked_sim(model_filename, params_filename, sim_id, data_dirname,
+                    model_args, sim_path, cpus, n_threads, nice, ionice,
+                    params):
+    """Run simulation in a process forked from the server."""
+    # Place the process on CPUs and set its priorities, and limit the number of
+    # threads of modules that have not been preloaded by the server
+    if n_threads is None and cpus is not None:
+        n_threads = len(cpus)
+    if n_threads is not None:
+        os.environ.update(_make_thread_env(n_threads))
+    place_process(cpus, nice, ionice)
 
-            sim_dirnames.append(sim_dirname)
-    return sim_dirnames
+    sys.exit(run_sim_inproc(model_filename, params_filename, sim_id,
+                            data_dirname, model_args, sim_path, params))
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Content-addressed file store.
+
+Content-addressed file store provides the following functionality:
+
+- computing the hash of the contents of a file;
+- storing files as read-only blobs named after the hash of their contents;
+- placing stored files in simulation directories as hard links;
+- finding identical files and merging them into hard links to stored blobs.
+"""
+
+import collections
+import errno
+import hashlib
+import multiprocessing.pool
+import os
+import shutil
+import stat
+import tempfile
+
+STORE_DIRNAME = ".simstore"
+HASH_NAME = 'sha256'
+CHUNK_SIZE = 1 << 20
+WRITE_MODE = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+
+
+def hash_file(filename):
+    """Compute the hash of the contents of a file."""
+    file_hash = hashlib.new(HASH_NAME)
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+class FileStore(object):
+    """Store of files addressed by the hash of their contents."""
+
+    def __init__(self, dirname):
+        self.dirname = dirname
+        _make_dir(dirname)
+
+    def blob_path(self, digest):
+        """Determine the path to the blob with specific hash."""
+        return os.path.join(self.dirname, digest[:2], digest[2:])
+
+    def add(self, filename, digest=None):
+        """Add a copy of a file to the store."""
+        if digest is None:
+            digest = hash_file(filename)
+        blob_path = self.blob_path(digest)
+        if not os.path.isfile(blob_path):
+            self._put(blob_path, lambda tmp_path:
+                      shutil.copyfile(filename, tmp_path))
+        return blob_path
+
+    def place(self, filename, dst_filename):
+        """Place a file at its destination as a hard link to a stored blob."""
+        # If the destination is a directory, place the file into it
+        if os.path.isdir(dst_filename):
+            dst_filename = os.path.join(dst_filename,
+                                        os.path.basename(filename))
+
+        # Add the file to the store and link it to its destination, unless the
+        # blob has already reached the limit of hard links or the destination
+        # is on a different file system
+        blob_path = self.add(filename)
+        try:
+            os.link(blob_path, dst_filename)
+        except OSError as e:
+            if e.errno not in (errno.EMLINK, errno.EXDEV):
+                raise
+            shutil.copy(blob_path, dst_filename)
+        return dst_filename
+
+    def merge(self, filename, digest=None):
+        """Replace a file with a hard link to the stored blob."""
+        # If the file is not stored yet, make the file itself the blob
+        if digest is None:
+            digest = hash_file(filename)
+        blob_path = self.blob_path(digest)
+        if not os.path.isfile(blob_path):
+            try:
+                self._put(blob_path,
+                          lambda tmp_path: os.link(filename, tmp_path))
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                raise self._cross_device_error(filename)
+        if os.path.samefile(filename, blob_path):
+            return False
+
+        # If the permissions of the file (other than write permissions, which
+        # blobs never have) differ from those of the blob, keep the file, so
+        # that merging does not change them
+        if (stat.S_IMODE(os.stat(filename).st_mode) & ~WRITE_MODE
+                != stat.S_IMODE(os.stat(blob_path).st_mode)):
+            return False
+
+        # Atomically replace the file with a hard link to the blob, unless the
+        # blob has already reached the limit of hard links
+        tmp_path = _make_tmp_path(os.path.dirname(filename) or os.curdir)
+        try:
+            os.link(blob_path, tmp_path)
+        except OSError as e:
+            if e.errno == errno.EXDEV:
+                raise self._cross_device_error(filename)
+            if e.errno != errno.EMLINK:
+                raise
+            return False
+        os.rename(tmp_path, filename)
+        return True
+
+    def _cross_device_error(self, filename):
+        """Create error reporting a file on a different file system."""
+        return OSError(errno.EXDEV, "Store '{}' is on a different file "
+                       "system".format(self.dirname), filename)
+
+    def _put(self, blob_path, write):
+        """Atomically put a read-only blob in the store."""
+        blob_dirname = os.path.dirname(blob_path)
+        _make_dir(blob_dirname)
+        tmp_path = _make_tmp_path(blob_dirname)
+        write(tmp_path)
+        file_mode = stat.S_IMODE(os.stat(tmp_path).st_mode)
+        os.chmod(tmp_path, file_mode & ~WRITE_MODE)
+        os.rename(tmp_path, blob_path)
+
+
+def find_files(dirnames, min_size=1):
+    """Find regular files in directories, excluding stores."""
+    for dirname in dirnames:
+        for root, subdirnames, filenames in os.walk(dirname):
+            if STORE_DIRNAME in subdirnames:
+                subdirnames.remove(STORE_DIRNAME)
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                st = os.lstat(path)
+                if stat.S_ISREG(st.st_mode) and st.st_size >= min_size:
+                    yield path, st
+
+
+def dedup_files(files, store, n_workers=None):
+    """Find identical files and merge them into hard links to stored blobs."""
+    # Group files by size, skipping files that are hard links to the same
+    # contents, because only files of identical size can be identical
+    paths_by_size = collections.defaultdict(list)
+    inodes = set()
+    for path, st in files:
+        if (st.st_dev, st.st_ino) in inodes:
+            continue
+        inodes.add((st.st_dev, st.st_ino))
+        paths_by_size[st.st_size].append(path)
+    candidate_paths = [path for paths in paths_by_size.values()
+                       if len(paths) > 1 for path in paths]
+
+    # Compute hashes of candidate files in parallel and group files by hash
+    pool = multiprocessing.pool.ThreadPool(n_workers)
+    try:
+        digests = pool.map(hash_file, candidate_paths, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+    paths_by_digest = collections.defaultdict(list)
+    for path, digest in zip(candidate_paths, digests):
+        paths_by_digest[digest].append(path)
+
+    # Merge identical files
+    n_merged = 0
+    n_bytes_saved = 0
+    for digest, paths in paths_by_digest.items():
+        if len(paths) < 2:
+            continue
+        for path in paths:
+            size = os.path.getsize(path)
+            if store.merge(path, digest):
+                n_merged += 1
+                n_bytes_saved += size
+    return n_merged, n_bytes_saved
+
+
+def _make_dir(dirname):
+    """Create directory unless it already exists."""
+    try:
+        os.makedirs(dirname)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _make_tmp_path(dirname):
+    """Determine a unique path to a temporary file in a directory."""
+    tmp_fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix=".tmp")
+    os.close(tmp_fd)
+    os.remove(tmp_path)
+    return tmp_path
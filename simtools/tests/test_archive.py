@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of simulation archive services."""
+
+import errno
+import os
+import zipfile
+
+import pytest
+
+from simtools.archive import (ArchiveIndex, generate_archive_filename,
+                              is_file, list_archives,
+                              list_packed_sim_dirnames, open_file,
+                              pack_sim_dirs, PACK_INDEX_NAME,
+                              split_archive_path)
+from simtools.params import load_params
+
+
+@pytest.fixture
+def master_dir(tmpdir):
+    master_dir = tmpdir.mkdir("master")
+    for sim_dirname in ("20001030_070809", "20001030_080910"):
+        sim_dir = master_dir.mkdir(sim_dirname)
+        sim_dir.join("params.json").write('{"sim_id": "' + sim_dirname + '"}')
+        sim_dir.mkdir("data").join("x.txt").write("x")
+    master_dir.ensure_dir("20001030", "09", "20001030_091011").join(
+        "params.py").write("sim_id = '20001030_091011'\n")
+    return master_dir
+
+
+def test_pack_sim_dirs(master_dir):
+    archive_filename = str(master_dir.join("pack_000001.zip"))
+    sim_dirnames = ["20001030_070809", "20001030_080910",
+                    os.path.join("20001030", "09", "20001030_091011")]
+
+    packed_dirnames = pack_sim_dirs(archive_filename, sim_dirnames,
+                                    str(master_dir))
+    assert packed_dirnames == ["20001030_070809", "20001030_080910",
+                               "20001030/09/20001030_091011"]
+    assert list_packed_sim_dirnames(archive_filename) == packed_dirnames
+    with zipfile.ZipFile(archive_filename) as archive:
+        names = archive.namelist()
+    assert "20001030_070809/params.json" in names
+    assert "20001030_080910/data/x.txt" in names
+    assert "20001030/09/20001030_091011/params.py" in names
+    assert names[-1] == PACK_INDEX_NAME
+    assert [path.basename for path in master_dir.listdir(
+        lambda path: path.ext == ".zip" or path.ext == ".tmp")] == [
+            "pack_000001.zip"]
+
+    # Existing archives are not overwritten
+    with pytest.raises(OSError):
+        pack_sim_dirs(archive_filename, sim_dirnames[:1], str(master_dir))
+
+    # Nonexistent simulation directories are not packed and no archive is
+    # left behind
+    with pytest.raises(OSError) as excinfo:
+        pack_sim_dirs(str(master_dir.join("pack_000002.zip")),
+                      ["20001030_070809", "x"], str(master_dir))
+    assert excinfo.value.errno == errno.ENOENT
+    assert list_archives(str(master_dir)) == ["pack_000001.zip"]
+
+
+def test_generate_archive_filename(tmpdir):
+    assert generate_archive_filename(str(tmpdir)) == "pack_000001.zip"
+    tmpdir.join("pack_000007.zip").write("")
+    tmpdir.join("other.zip").write("")
+    tmpdir.mkdir("pack_000009.zip")
+    assert list_archives(str(tmpdir)) == ["other.zip", "pack_000007.zip"]
+    assert generate_archive_filename(str(tmpdir)) == "pack_000008.zip"
+
+
+def test_read_packed_files(master_dir):
+    archive_filename = str(master_dir.join("pack_000001.zip"))
+    pack_sim_dirs(archive_filename, ["20001030_070809"], str(master_dir))
+    master_dir.join("20001030_070809").remove()
+
+    params_path = os.path.join(archive_filename, "20001030_070809",
+                               "params.json")
+    assert split_archive_path(params_path) == (
+        archive_filename, "20001030_070809/params.json")
+    assert split_archive_path(str(master_dir.join("20001030_080910"))) is None
+    assert is_file(params_path)
+    assert not is_file(os.path.join(archive_filename, "20001030_070809"))
+    assert not is_file(os.path.join(archive_filename, "x.json"))
+    with open_file(params_path) as params_file:
+        assert params_file.read() == '{"sim_id": "20001030_070809"}'
+    with pytest.raises(IOError):
+        open_file(os.path.join(archive_filename, "x.json"))
+
+    # Parameters are loaded from packed parameter files
+    assert load_params(params_path) == {'sim_id': "20001030_070809"}
+
+
+def test_archive_index(master_dir):
+    sim_dirname = os.path.join("20001030", "09", "20001030_091011")
+    pack_sim_dirs(str(master_dir.join("pack_000001.zip")),
+                  ["20001030_070809"], str(master_dir))
+    pack_sim_dirs(str(master_dir.join("pack_000002.zip")),
+                  ["20001030_080910", sim_dirname], str(master_dir))
+
+    archive_index = ArchiveIndex(str(master_dir))
+    assert len(archive_index) == 3
+    assert sim_dirname in archive_index
+    assert "x" not in archive_index
+    assert archive_index.find("20001030_070809") == str(
+        master_dir.join("pack_000001.zip"))
+    assert archive_index.find("x") is None
+    params_path = archive_index.locate(sim_dirname, "params.py")
+    assert params_path == os.path.join(str(master_dir.join("pack_000002.zip")),
+                                       sim_dirname, "params.py")
+    assert load_params(params_path) == {'sim_id': "20001030_091011"}
+    assert archive_index.locate("x", "params.py") is None
@@ -7,7 +7,9 @@ import sys
 
 import pytest
 
-from simtools.argparse import parse_args, parse_known_args
+from simtools.argparse import (cpu_list_type, ionice_type, parse_args,
+                               parse_known_args, size_type)
+from simtools.params import ENV_PARAMS_FILENAME, PARAMS_ENV_VAR
 
 
 @pytest.mark.parametrize('argv', [
@@ -435,6 +437,28 @@ def test_parse_known_args_unsupported_option(monkeypatch, allowed_options):
         options, extra_args = parse_known_args(allowed_options)
 
 
+def test_parse_known_args_env_params(monkeypatch, tmpdir):
+    allowed_options = ['params_filename']
+    monkeypatch.setenv(PARAMS_ENV_VAR, '{"p1": 1}')
+
+    # Parameters passed through an environment variable
+    monkeypatch.setattr(sys, 'argv', ["model.py"])
+    options, extra_args = parse_known_args(allowed_options)
+    assert options.params_filename == ENV_PARAMS_FILENAME
+
+    # Parameter file takes precedence
+    params_file = tmpdir.join("params.py")
+    params_file.write("")
+    monkeypatch.setattr(sys, 'argv', ["model.py", "-p", str(params_file)])
+    options, extra_args = parse_known_args(allowed_options)
+    assert options.params_filename == str(params_file)
+
+    # Parameter file option not allowed
+    monkeypatch.setattr(sys, 'argv', ["model.py"])
+    options, extra_args = parse_known_args(['sim_id'])
+    assert 'params_filename' not in options
+
+
 def test_parse_known_args_extra_args(monkeypatch):
     allowed_options = ['sim_id', 'data_dirname', 'save_data']
 
@@ -600,3 +624,45 @@ def test_parse_known_args_parser(monkeypatch):
         assert options.y
     assert options.v == True
     assert extra_args == ["-x", "1.5", "-y", "0"]
+
+
+@pytest.mark.parametrize('size, n_bytes', [
+    ("1", 1),
+    ("512k", 512 * 1024),
+    ("2M", 2 * 1024 ** 2),
+    ("3G", 3 * 1024 ** 3)])
+def test_size_type(size, n_bytes):
+    assert size_type(size) == n_bytes
+
+
+@pytest.mark.parametrize('size', ["", "0", "-1K", "1.5G", "1X", "G"])
+def test_size_type_invalid(size):
+    with pytest.raises(argparse.ArgumentTypeError):
+        size_type(size)
+
+
+@pytest.mark.parametrize('cpu_list, cpus', [
+    ("0", [0]),
+    ("0-3", [0, 1, 2, 3]),
+    ("0-1,8,10-11", [0, 1, 8, 10, 11])])
+def test_cpu_list_type(cpu_list, cpus):
+    assert cpu_list_type(cpu_list) == cpus
+
+
+@pytest.mark.parametrize('cpu_list', ["", "a", "1-a", "3-1", "-1"])
+def test_cpu_list_type_invalid(cpu_list):
+    with pytest.raises(argparse.ArgumentTypeError):
+        cpu_list_type(cpu_list)
+
+
+@pytest.mark.parametrize('ionice, ionice_tuple', [
+    ("3", (3, 0)),
+    ("2:7", (2, 7))])
+def test_ionice_type(ionice, ionice_tuple):
+    assert ionice_type(ionice) == ionice_tuple
+
+
+@pytest.mark.parametrize('ionice', ["", "0", "4", "2:8", "2:a", "a"])
+def test_ionice_type_invalid(ionice):
+    with pytest.raises(argparse.ArgumentTypeError):
+        ionice_type(ionice)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of asynchronous simulation launch services."""
+
+import sys
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 5),
+                                reason="requires Python 3.5 or later")
+
+if sys.version_info >= (3, 5):
+    import asyncio
+
+    from simtools.asyncrun import run_sim_async
+
+
+@pytest.fixture
+def model_file(tmpdir):
+    model_file = tmpdir.join("model.py")
+    model_file.write(
+"""import sys
+import time
+
+print("out " + " ".join(sys.argv[1:]))
+sys.stdout.flush()
+sys.stderr.write("err\\n")
+if sys.argv[-1] != "--save":
+    time.sleep(float(sys.argv[-1]))
+sys.exit(2)
+""")
+    return model_file
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_run_sim_async(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+
+    # Separate log files
+    status = run(run_sim_async(
+        str(model_file), sim_id="12345", executable=sys.executable,
+        sim_path=str(sim_dir), stdout_filename="out.log",
+        stderr_filename="err.log"))
+    assert status == 2
+    assert sim_dir.join("out.log").read() == "out --simid 12345 --save\n"
+    assert sim_dir.join("err.log").read() == "err\n"
+
+    # Common log file
+    status = run(run_sim_async(
+        str(model_file), executable=sys.executable, sim_path=str(sim_dir),
+        stdout_filename="sim.log", stderr_filename="sim.log"))
+    assert status == 2
+    assert sim_dir.join("sim.log").read() == "out --save\nerr\n"
+
+
+def test_run_sim_async_relative_paths(monkeypatch, tmpdir, model_file):
+    tmpdir.join("params.py").write("")
+    sim_dir = tmpdir.mkdir("sim")
+    monkeypatch.chdir(tmpdir)
+
+    # Paths to the model file and the parameter file are relative to the
+    # current working directory rather than to the simulation directory
+    status = run(run_sim_async(
+        "model.py", "params.py", executable=sys.executable, sim_path="sim",
+        stdout_filename="out.log"))
+    assert status == 2
+    assert sim_dir.join("out.log").read() == (
+        "out --params {} --save\n".format(tmpdir.join("params.py")))
+
+
+def test_run_sim_async_concurrent(tmpdir, model_file):
+    sim_dirs = [tmpdir.mkdir("sim{}".format(s)) for s in range(4)]
+
+    async def run_sims():
+        return await asyncio.gather(*[run_sim_async(
+            str(model_file), executable=sys.executable,
+            model_args=["0.5"], sim_path=str(sim_dir),
+            stdout_filename="out.log") for sim_dir in sim_dirs])
+
+    start_time = time.time()
+    statuses = run(run_sims())
+    assert time.time() - start_time < 2.0
+    assert statuses == [2, 2, 2, 2]
+    for sim_dir in sim_dirs:
+        assert sim_dir.join("out.log").read() == "out --save 0.5\n"
+
+
+def test_run_sim_async_cancel(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+
+    async def run_sim():
+        task = asyncio.ensure_future(run_sim_async(
+            str(model_file), executable=sys.executable, model_args=["60"],
+            sim_path=str(sim_dir), stdout_filename="out.log"))
+        await asyncio.sleep(0.5)
+        task.cancel()
+        await task
+
+    start_time = time.time()
+    with pytest.raises(asyncio.CancelledError):
+        run(run_sim())
+    assert time.time() - start_time < 10.0
@@ -3,7 +3,8 @@
 
 import pytest
 
-from simtools.base import Dict, is_iterable, is_string
+from simtools.base import (Dict, flatten, is_iterable, is_string,
+                           parse_cpu_list, replace_file)
 
 
 def test_is_iterable():
@@ -54,6 +55,13 @@ def test_is_string():
     assert is_string(obj) == False
 
 
+def test_flatten():
+    assert flatten(1) == [1]
+    assert flatten("abc") == ["abc"]
+    assert flatten([1, [2, 3], [[4], []]]) == [1, 2, 3, 4]
+    assert flatten([]) == []
+
+
 def test_dict_attr_access():
     d = Dict()
 
@@ -76,3 +84,24 @@ def test_dict_attr_deletion():
         d['a']
     with pytest.raises(AttributeError):
         d.a
+
+
+def test_parse_cpu_list():
+    assert parse_cpu_list("0") == [0]
+    assert parse_cpu_list("0-2,5") == [0, 1, 2, 5]
+    assert parse_cpu_list("4-5,1\n") == [4, 5, 1]
+    assert parse_cpu_list("") == []
+
+    with pytest.raises(ValueError):
+        parse_cpu_list("a")
+
+
+def test_replace_file(tmpdir):
+    src_file = tmpdir.join("src.txt")
+    src_file.write("new")
+    dst_file = tmpdir.join("dst.txt")
+    dst_file.write("old")
+
+    replace_file(str(src_file), str(dst_file))
+    assert dst_file.read() == "new"
+    assert not src_file.check()
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of batch launch services."""
+
+import json
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+import simtools
+
+from simtools.base import Dict
+from simtools.registry import Registry
+from simtools.batch import (classify_failure, make_sim_dirs, plan_batch,
+                            run_batch, SimPool)
+
+
+@pytest.fixture
+def model_file(monkeypatch, tmpdir):
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(
+        os.path.dirname(os.path.abspath(simtools.__file__))))
+    model_file = tmpdir.join("model.py")
+    model_file.write(
+"""import sys
+
+import simtools
+
+options, extra_args = simtools.parse_known_args(['save_data', 'sim_id'])
+with open("sim_id.txt", 'w') as sim_id_file:
+    sim_id_file.write(options.sim_id)
+sys.exit(int(extra_args[0]) if extra_args else 0)
+""")
+    return model_file
+
+
+@pytest.fixture
+def sims(tmpdir, model_file):
+    sims = []
+    for s in range(4):
+        sim_dir = tmpdir.mkdir("sim{}".format(s))
+        sims.append({
+            'model_filename': str(model_file),
+            'sim_id': str(s),
+            'executable': sys.executable,
+            'model_args': [str(s % 2)],
+            'sim_path': str(sim_dir)
+            })
+    return sims
+
+
+def test_sim_pool(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+
+    with SimPool(2, preload=['json']) as pool:
+        status = pool.run_sim(str(model_file), sim_id="12345",
+                              model_args=["2"], sim_path=str(sim_dir))
+    assert status == 2
+    assert sim_dir.join("sim_id.txt").read() == "12345"
+
+
+def test_sim_pool_worker_died(tmpdir):
+    crash_model_file = tmpdir.join("crash_model.py")
+    crash_model_file.write("import os\nos._exit(3)\n")
+    sim_dir = tmpdir.mkdir("sim")
+
+    # Simulations running in a worker process that dies fail instead of
+    # waiting for their results forever, and the worker process is replaced
+    with SimPool(1) as pool:
+        with pytest.raises(RuntimeError):
+            pool.run_sim(str(crash_model_file), sim_path=str(sim_dir))
+        with pytest.raises(RuntimeError):
+            pool.run_sims([{'model_filename': str(crash_model_file),
+                            'sim_path': str(sim_dir)}])
+        status = pool.run_sim(str(tmpdir.join("missing.py")),
+                              sim_path=str(sim_dir))
+    assert status == 1
+
+    # In a batch, such simulations fail to be launched
+    statuses = run_batch([{'model_filename': str(crash_model_file),
+                           'sim_path': str(sim_dir)}], n_workers=1,
+                         mode='pool')
+    assert statuses == [None]
+
+
+def test_sim_pool_preload_string():
+    with pytest.raises(TypeError):
+        SimPool(preload='json')
+
+
+@pytest.mark.parametrize('mode', ['subprocess', 'pool', 'forkserver'])
+def test_run_batch(tmpdir, sims, mode):
+    statuses = run_batch(sims, n_workers=2, mode=mode)
+    assert statuses == [0, 1, 0, 1]
+    for s in range(4):
+        assert tmpdir.join("sim{}".format(s), "sim_id.txt").read() == str(s)
+
+
+@pytest.mark.parametrize('mode', ['subprocess', 'pool', 'forkserver'])
+def test_run_batch_params(tmpdir, model_file, mode):
+    model_file.write(
+"""import sys
+
+import simtools
+
+options = simtools.parse_args(['params_filename', 'save_data'])
+params = simtools.load_params(options.params_filename)
+sys.exit(params.exit_status)
+""")
+    sims = [{'model_filename': str(model_file), 'executable': sys.executable,
+             'params': {'exit_status': s % 2},
+             'sim_path': str(tmpdir.mkdir("sim{}".format(s)))}
+            for s in range(4)]
+
+    statuses = run_batch(sims, n_workers=2, mode=mode)
+    assert statuses == [0, 1, 0, 1]
+
+    # Both parameter file and parameters
+    sims[0]['params_filename'] = str(model_file)
+    with pytest.raises(ValueError):
+        run_batch(sims, mode=mode)
+
+
+@pytest.mark.parametrize('mode', ['subprocess', 'pool', 'forkserver'])
+def test_run_batch_relative_paths(monkeypatch, tmpdir, model_file, mode):
+    model_file.write(
+"""import sys
+
+import simtools
+
+options = simtools.parse_args(['params_filename', 'save_data'])
+params = simtools.load_params(options.params_filename)
+sys.exit(params.exit_status)
+""")
+    tmpdir.join("params.py").write("exit_status = 3\n")
+    tmpdir.mkdir("sim")
+    monkeypatch.chdir(tmpdir)
+
+    # Paths to the model file and the parameter file are relative to the
+    # current working directory rather than to the simulation directory
+    statuses = run_batch([{'model_filename': "model.py",
+                           'params_filename': "params.py",
+                           'executable': sys.executable,
+                           'sim_path': "sim"}], n_workers=1, mode=mode)
+    assert statuses == [3]
+
+
+def test_run_batch_forkserver_closed(sims):
+    statuses = run_batch(sims, n_workers=2, mode='forkserver',
+                         preload=['json'])
+    assert statuses == [0, 1, 0, 1]
+
+    # The server is stopped once the batch finishes
+    assert multiprocessing.forkserver._forkserver._forkserver_pid is None
+
+
+def test_run_batch_mode(sims):
+    with pytest.raises(ValueError):
+        run_batch(sims, mode='unknown')
+
+
+@pytest.mark.parametrize('mode', ['subprocess', 'pool', 'forkserver'])
+def test_run_batch_pin_cpus(tmpdir, sims, mode):
+    statuses = run_batch(sims, n_workers=2, mode=mode, pin_cpus=True,
+                         n_threads=1)
+    assert statuses == [0, 1, 0, 1]
+
+
+@pytest.fixture
+def flaky_sim(tmpdir):
+    # The model is killed by a signal the first time it is run and succeeds
+    # afterwards
+    model_file = tmpdir.join("flaky.py")
+    model_file.write(
+"""import os
+import signal
+
+counter_filename = {!r}
+n_runs = len(open(counter_filename).read()) if os.path.exists(
+    counter_filename) else 0
+open(counter_filename, 'a').write('x')
+open('out.txt', 'w').write(str(n_runs))
+if n_runs == 0:
+    os.kill(os.getpid(), signal.SIGKILL)
+""".format(str(tmpdir.join("counter.txt"))))
+    sim_dir = tmpdir.mkdir("sim")
+    return {
+        'model_filename': str(model_file),
+        'executable': sys.executable,
+        'sim_path': str(sim_dir)
+        }
+
+
+@pytest.mark.parametrize('run_info, failure', [
+    (Dict(exit_status=0, cause='exit'), None),
+    (Dict(exit_status=3, cause='exit'), 'exit'),
+    (Dict(exit_status=-9, cause='signal', signal=9), 'signal'),
+    (Dict(exit_status=-15, cause='timeout'), 'timeout'),
+    (Dict(exit_status=-9), 'signal'),
+    (Dict(exit_status=None, error="Traceback"), 'launch')])
+def test_classify_failure(run_info, failure):
+    assert classify_failure(run_info) == failure
+
+
+def test_run_batch_retry(tmpdir, flaky_sim):
+    statuses = run_batch([flaky_sim], n_workers=1, max_attempts=3,
+                         backoff=0.01, manifest_filename="run.json")
+    assert statuses == [0]
+    assert tmpdir.join("counter.txt").read() == "xx"
+    with open(str(tmpdir.join("sim", "run.json"))) as manifest_file:
+        manifest = json.load(manifest_file)
+    assert manifest['exit_status'] == 0
+    assert [attempt['failure'] for attempt in manifest['attempts']] == [
+        'signal', None]
+    assert manifest['attempts'][0]['signal'] == 9
+
+
+def test_run_batch_registry(tmpdir, sims, flaky_sim):
+    registry_filename = str(tmpdir.join("runs.db"))
+
+    run_batch(sims, n_workers=2, registry_filename=registry_filename)
+    run_batch([flaky_sim], n_workers=1, max_attempts=2, backoff=0.01,
+              registry_filename=registry_filename)
+    registry = Registry(registry_filename)
+    assert registry.count_runs() == {'running': 0, 'done': 3, 'failed': 3,
+                                     'error': 0}
+    assert [run.attempt for run in registry.find_runs()] == [1] * 5 + [2]
+
+
+def test_run_batch_status_file(tmpdir, sims):
+    status_filename = str(tmpdir.join("status.json"))
+
+    run_batch(sims, n_workers=2, status_filename=status_filename,
+              status_interval=0.01)
+    with open(status_filename) as status_file:
+        status = json.load(status_file)
+    assert status['total'] == 4
+    assert (status['queued'], status['running'], status['done'],
+            status['failed']) == (0, 0, 2, 2)
+    assert status['mean_runtime'] > 0
+
+
+def test_run_batch_retry_fresh_dir(tmpdir, flaky_sim):
+    statuses = run_batch([flaky_sim], n_workers=1, max_attempts=2,
+                         backoff=0.01, fresh_dir=True)
+    assert statuses == [0]
+    assert tmpdir.join("sim.attempt1", "out.txt").read() == "0"
+    assert tmpdir.join("sim", "out.txt").read() == "1"
+
+
+def test_run_batch_no_retry(tmpdir, sims, flaky_sim):
+    # Nonzero exit status is not retried by default
+    statuses = run_batch(sims, n_workers=2, max_attempts=3, backoff=0.01,
+                         manifest_filename="run.json")
+    assert statuses == [0, 1, 0, 1]
+    with open(str(tmpdir.join("sim1", "run.json"))) as manifest_file:
+        assert len(json.load(manifest_file)['attempts']) == 1
+
+    # Failures of classes that are not to be retried are not retried
+    statuses = run_batch([flaky_sim], n_workers=1, max_attempts=3,
+                         backoff=0.01, retry_on=['exit'])
+    assert statuses == [-9]
+
+
+def test_run_batch_retry_launch_error(tmpdir):
+    sim_dir = tmpdir.mkdir("sim")
+    sim = {'model_filename': str(tmpdir.join("model.py")),
+           'executable': str(tmpdir.join("missing")),
+           'sim_path': str(sim_dir)}
+    missing_sim = dict(sim, sim_path=str(tmpdir.join("missing")))
+
+    # Simulations that cannot be launched have no exit status, even if their
+    # simulation directories do not exist, and do not stop the batch
+    statuses = run_batch([sim, missing_sim], n_workers=1, max_attempts=2,
+                         backoff=0.01, fresh_dir=True,
+                         manifest_filename="run.json")
+    assert statuses == [None, None]
+    with open(str(sim_dir.join("run.json"))) as manifest_file:
+        manifest = json.load(manifest_file)
+    assert [attempt['failure'] for attempt in manifest['attempts']] == [
+        'launch', 'launch']
+
+
+def test_run_batch_retry_invalid(sims):
+    with pytest.raises(ValueError):
+        run_batch(sims, max_attempts=0)
+    with pytest.raises(ValueError):
+        run_batch(sims, retry_on=['unknown'])
+    with pytest.raises(TypeError):
+        run_batch(sims, retry_on='exit')
+    with pytest.raises(TypeError):
+        run_batch(sims, mode='pool', timeout=10)
+
+
+def test_run_batch_dry_run(tmpdir, sims):
+    plan = run_batch(sims, dry_run=True)
+    assert [sim.cmd for sim in plan] == [
+        [sys.executable, sims[s]['model_filename'], "--simid", str(s),
+         "--save", str(s % 2)] for s in range(4)]
+    for s in range(4):
+        assert not tmpdir.join("sim{}".format(s), "sim_id.txt").check()
+
+
+def test_plan_batch(tmpdir, model_file):
+    master_dir = tmpdir.join("master")
+    sims = [{'model_filename': str(model_file), 'data_dirname': "data"}
+            for _ in range(3)]
+    sims.append({'model_filename': str(model_file), 'sim_id': "x"})
+
+    plan = plan_batch(sims, str(master_dir), id_scheme='datetime')
+    sim_ids = [sim.sim_id for sim in plan]
+    assert len(set(sim_ids)) == 4
+    assert sim_ids[3] == "x"
+    assert [sim.sim_path for sim in plan] == [
+        str(master_dir.join(sim_id)) for sim_id in sim_ids]
+    assert plan[0].cmd == [str(model_file), "--simid", sim_ids[0],
+                           "--data-dir", "data", "--save"]
+    assert not master_dir.check()
+
+    # Simulation directories are created in parallel
+    make_sim_dirs(plan, n_workers=2)
+    assert sorted(path.basename for path in master_dir.listdir()) == sorted(
+        sim_ids)
+    assert master_dir.join(sim_ids[0], "data").check(dir=1)
+
+    # Existing simulation directories collide with the plan
+    with pytest.raises(OSError):
+        plan_batch(sims[3:], str(master_dir))
+
+
+def test_plan_batch_shard(tmpdir, model_file):
+    master_dir = tmpdir.join("master")
+    sims = [{'model_filename': str(model_file), 'sim_id': sim_id}
+            for sim_id in ("20001030_070809", "20001030_080910")]
+
+    plan = plan_batch(sims, str(master_dir), shard='date')
+    assert [sim.sim_path for sim in plan] == [
+        str(master_dir.join("20001030", "07", "20001030_070809")),
+        str(master_dir.join("20001030", "08", "20001030_080910"))]
+
+    # Shard directories are created along with simulation directories
+    make_sim_dirs(plan)
+    assert all(os.path.isdir(sim.sim_path) for sim in plan)
+    with pytest.raises(OSError):
+        plan_batch(sims[:1], str(master_dir), shard='date')
+
+
+def test_plan_batch_duplicates(tmpdir, model_file):
+    sims = [{'model_filename': str(model_file),
+             'sim_path': str(tmpdir.join("sim"))} for _ in range(2)]
+
+    with pytest.raises(OSError):
+        plan_batch(sims)
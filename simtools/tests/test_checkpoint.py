@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of checkpoint services."""
+
+import errno
+import gzip
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+import simtools
+from simtools.checkpoint import Checkpoint, load_checkpoint, save_checkpoint
+
+
+def test_save_load_checkpoint(tmpdir):
+    checkpoint_file = tmpdir.join("checkpoint.pkl.gz")
+    state = {'step': 10, 'x': [1.0, 2.0], 'rng_state': (3, (1, 2), None)}
+
+    save_checkpoint(str(checkpoint_file), state)
+    with gzip.open(str(checkpoint_file), 'rb') as f:
+        assert f.read(1)
+    loaded_state = load_checkpoint(str(checkpoint_file))
+    assert loaded_state == state
+    assert loaded_state.step == 10
+
+    # The previous checkpoint is replaced, without leaving temporary files
+    save_checkpoint(str(checkpoint_file), {'step': 20})
+    assert load_checkpoint(str(checkpoint_file)) == {'step': 20}
+    assert tmpdir.listdir() == [checkpoint_file]
+
+
+def test_save_checkpoint_existing_target(tmpdir, monkeypatch):
+    checkpoint_file = tmpdir.join("checkpoint.pkl.gz")
+
+    # Renaming onto an existing file fails on Windows, so the previous
+    # checkpoint must be replaced without os.rename()
+    def rename(src, dst):
+        if os.path.exists(dst):
+            raise OSError(errno.EEXIST, "File exists", dst)
+        os_rename(src, dst)
+
+    os_rename = os.rename
+    monkeypatch.setattr(os, 'rename', rename)
+    save_checkpoint(str(checkpoint_file), {'step': 10})
+    save_checkpoint(str(checkpoint_file), {'step': 20})
+    assert load_checkpoint(str(checkpoint_file)) == {'step': 20}
+    assert tmpdir.listdir() == [checkpoint_file]
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGUSR1'),
+                    reason="requires POSIX signals")
+def test_checkpoint_signal_handlers(tmpdir):
+    handler = signal.getsignal(signal.SIGUSR1)
+    try:
+        # Signal handlers are installed only once the state is registered
+        checkpoint = Checkpoint(str(tmpdir.join("checkpoint.pkl.gz")),
+                                signals=('SIGUSR1',))
+        assert signal.getsignal(signal.SIGUSR1) == handler
+        checkpoint.register(lambda: {'step': 0})
+        assert (signal.getsignal(signal.SIGUSR1)
+                == checkpoint._handle_signal)
+
+        # Or once the model polls for checkpoints
+        checkpoint = Checkpoint(str(tmpdir.join("checkpoint.pkl.gz")),
+                                signals=('SIGUSR1',))
+        checkpoint.maybe_save({'step': 0})
+        assert (signal.getsignal(signal.SIGUSR1)
+                == checkpoint._handle_signal)
+    finally:
+        signal.signal(signal.SIGUSR1, handler)
+
+
+def test_checkpoint_interval(tmpdir, monkeypatch):
+    checkpoint = Checkpoint(str(tmpdir.join("checkpoint.pkl.gz")),
+                            interval=10.0, signals=None)
+    assert checkpoint.load() is None
+    step = [0]
+    checkpoint.register(lambda: {'step': step[0]})
+
+    # A checkpoint is saved only once the interval has elapsed
+    t = time.time()
+    monkeypatch.setattr(time, 'time', lambda: t + 5.0)
+    assert not checkpoint.maybe_save()
+    step[0] = 1
+    monkeypatch.setattr(time, 'time', lambda: t + 11.0)
+    assert checkpoint.maybe_save()
+    assert checkpoint.n_saves == 1
+    assert checkpoint.load().step == 1
+    monkeypatch.setattr(time, 'time', lambda: t + 12.0)
+    assert not checkpoint.maybe_save()
+
+    # Explicit state takes precedence over the registered one
+    checkpoint.save({'step': 2})
+    assert checkpoint.load().step == 2
+
+
+def test_checkpoint_invalid(tmpdir):
+    with pytest.raises(ValueError):
+        Checkpoint(interval=0, signals=None)
+    checkpoint = Checkpoint(str(tmpdir.join("checkpoint.pkl.gz")),
+                            signals=None)
+    with pytest.raises(TypeError):
+        checkpoint.register({'step': 0})
+    with pytest.raises(ValueError):
+        checkpoint.save()
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGTERM') or os.name == 'nt',
+                    reason="requires POSIX signals")
+def test_checkpoint_signal(tmpdir, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(
+        os.path.dirname(os.path.abspath(simtools.__file__))))
+    model_file = tmpdir.join("model.py")
+    model_file.write(
+"""import sys
+import time
+
+from simtools.checkpoint import Checkpoint
+
+checkpoint = Checkpoint(interval=None)
+state = checkpoint.load() or {'step': 0}
+step = state['step']
+checkpoint.register(lambda: {'step': step})
+sys.stdout.write("started\\n")
+sys.stdout.flush()
+n_steps = 0
+while step < int(sys.argv[1]):
+    step += 1
+    n_steps += 1
+    time.sleep(0.01)
+    checkpoint.maybe_save()
+with open("n_steps.txt", 'w') as n_steps_file:
+    n_steps_file.write(str(n_steps))
+""")
+
+    # The simulation saves a checkpoint and exits when terminated
+    process = subprocess.Popen([sys.executable, str(model_file), "100000"],
+                               cwd=str(tmpdir), stdout=subprocess.PIPE)
+    process.stdout.readline()
+    time.sleep(0.1)
+    process.send_signal(signal.SIGTERM)
+    process.communicate()
+    assert process.returncode == 128 + signal.SIGTERM
+    step = load_checkpoint(str(tmpdir.join("checkpoint.pkl.gz"))).step
+    assert step > 0
+
+    # The relaunched simulation continues from the checkpoint
+    process = subprocess.Popen([sys.executable, str(model_file),
+                                str(step + 5)], cwd=str(tmpdir),
+                               stdout=subprocess.PIPE)
+    process.communicate()
+    assert process.returncode == 0
+    assert tmpdir.join("n_steps.txt").read() == "5"
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of data recording services."""
+
+import array
+import json
+import struct
+import sys
+
+import pytest
+
+from simtools import data
+from simtools.data import Aggregator, load_data, NPY_HEADER_SIZE, Recorder
+
+
+@pytest.fixture(params=[False, True], ids=['no_numpy', 'numpy'])
+def numpy(request, monkeypatch):
+    if request.param:
+        return pytest.importorskip('numpy')
+    monkeypatch.setattr(data, 'numpy', None)
+    return None
+
+
+def test_recorder_npy(tmpdir):
+    data_file = tmpdir.join("pos.npy")
+
+    with Recorder(str(data_file), chunk_size=4) as recorder:
+        recorder.append(0.5)
+        recorder.extend([1.5, 2.5, 3.5, 4.5])
+
+        # Full chunks are written to the file as soon as they are recorded
+        assert recorder.n_records == 4
+        assert data_file.size() == NPY_HEADER_SIZE + 4 * 8
+    assert recorder.n_records == 5
+    contents = data_file.read_binary()
+    assert len(contents) == NPY_HEADER_SIZE + 5 * 8
+    assert contents[:6] == b"\x93NUMPY"
+    header = contents[10:NPY_HEADER_SIZE].decode('latin1')
+    assert "'shape': (5,)" in header
+    assert "'descr': '{}f8'".format(
+        "<" if sys.byteorder == 'little' else ">") in header
+    assert header.endswith("\n")
+    assert struct.unpack("5d", contents[NPY_HEADER_SIZE:]) == (
+        0.5, 1.5, 2.5, 3.5, 4.5)
+
+
+def test_recorder_npy_long_header(tmpdir, numpy):
+    data_filename = str(tmpdir.join("pos.npy"))
+    shape = (1,) * 20
+
+    # Space reserved for the header grows with the number of dimensions
+    with Recorder(data_filename, 'f8', shape) as recorder:
+        recorder.append([0.5])
+        recorder.append([1.5])
+    contents = open(data_filename, 'rb').read()
+    assert len(contents) > NPY_HEADER_SIZE + 2 * 8
+    assert (len(contents) - 2 * 8) % 64 == 0
+    loaded_data = load_data(data_filename)
+    if numpy is not None:
+        assert loaded_data.shape == (2,) + shape
+        loaded_data = loaded_data.ravel()
+    assert loaded_data.tolist() == [0.5, 1.5]
+
+
+def test_recorder_raw(tmpdir):
+    data_file = tmpdir.join("pos.bin")
+
+    with Recorder(str(data_file), 'i4', (2, 3)) as recorder:
+        # Header is not written to raw files, but metadata are saved to a
+        # separate file from the start
+        assert json.loads(tmpdir.join("pos.bin.json").read())['shape'] == [
+            0, 2, 3]
+        recorder.append(range(6))
+        recorder.append(range(6, 12))
+    assert json.loads(tmpdir.join("pos.bin.json").read())['shape'] == [
+        2, 2, 3]
+    assert data_file.size() == 12 * 4
+
+    # Incomplete records are not written
+    with pytest.raises(ValueError):
+        with Recorder(str(data_file), 'i4', (2, 3)) as recorder:
+            recorder.append(range(5))
+
+
+@pytest.mark.parametrize('ring_size', [None, 3])
+def test_recorder_extend_numpy(tmpdir, ring_size):
+    numpy = pytest.importorskip('numpy')
+    data_filename = str(tmpdir.join("pos.npy"))
+    records = numpy.arange(14, dtype='i4').reshape((7, 2))
+
+    # Records of a NumPy array are added in bulk, filling multiple chunks
+    with Recorder(data_filename, 'i4', (2,), chunk_size=2,
+                  ring_size=ring_size) as recorder:
+        recorder.append([-2, -1])
+        recorder.extend(records)
+        with pytest.raises(ValueError):
+            recorder.extend(records.reshape((2, 7)))
+    expected_records = [[-2, -1]] + records.tolist()
+    if ring_size is not None:
+        expected_records = expected_records[-ring_size:]
+    assert load_data(data_filename).tolist() == expected_records
+
+
+def test_recorder_invalid(tmpdir):
+    filename = str(tmpdir.join("pos.npy"))
+
+    with pytest.raises(ValueError):
+        Recorder(filename, 'x8')
+    with pytest.raises(ValueError):
+        Recorder(filename, shape=(0,))
+    with pytest.raises(ValueError):
+        Recorder(filename, chunk_size=0)
+    with pytest.raises(ValueError):
+        Recorder(filename, every=2, interval=0.5)
+    with pytest.raises(ValueError):
+        Recorder(filename, ring_size=0)
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_recorder_every(tmpdir, background):
+    filename = str(tmpdir.join("pos.npy"))
+
+    with Recorder(filename, chunk_size=2, every=3,
+                  background=background) as recorder:
+        recorder.extend(range(10))
+        recorder.flush()
+        assert recorder.n_records == 4
+    assert load_data(filename).tolist() == [0, 3, 6, 9]
+
+
+def test_recorder_interval(tmpdir):
+    filename = str(tmpdir.join("pos.npy"))
+
+    with Recorder(filename, interval=0.5) as recorder:
+        for step in range(11):
+            recorder.append(step, time=1.0 + 0.2 * step)
+        with pytest.raises(ValueError):
+            recorder.append(11)
+    assert load_data(filename).tolist() == [0, 3, 5, 8, 10]
+
+
+@pytest.mark.parametrize('n_records, expected_records', [
+    (3, [0, 1, 2]),
+    (9, [4, 5, 6, 7, 8]),
+    (12, [7, 8, 9, 10, 11])])
+def test_recorder_ring(tmpdir, numpy, n_records, expected_records):
+    filename = str(tmpdir.join("pos.bin"))
+
+    # Only the latest records are written when the recorder is closed
+    with Recorder(filename, 'i8', (2,), ring_size=5) as recorder:
+        for n in range(n_records):
+            recorder.append([n, -n])
+        recorder.flush()
+        assert recorder.n_records == 0
+    if numpy is not None:
+        assert load_data(filename).tolist() == [
+            [n, -n] for n in expected_records]
+    else:
+        assert load_data(filename).tolist() == [
+            value for n in expected_records for value in (n, -n)]
+
+
+def test_recorder_background(tmpdir, monkeypatch):
+    filename = str(tmpdir.join("pos.npy"))
+
+    with Recorder(filename, chunk_size=3, background=True) as recorder:
+        recorder.extend(range(10))
+        recorder.flush()
+        assert recorder.n_records == 10
+        recorder.extend(range(10, 20))
+    assert recorder.n_records == 20
+    assert load_data(filename).tolist() == list(range(20))
+
+    # Errors that occur while writing in background are raised when the
+    # recorder is flushed or closed
+    recorder = Recorder(filename, chunk_size=2, background=True)
+
+    def fail(chunk):
+        raise IOError("No space left on device")
+
+    monkeypatch.setattr(recorder, '_write_chunk', fail)
+    recorder.extend(range(4))
+    with pytest.raises(IOError):
+        recorder.flush()
+    with pytest.raises(IOError):
+        recorder.close()
+
+
+def test_aggregator(tmpdir):
+    stats_file = tmpdir.join("stats.json")
+    values = [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0, -1.0, 10.0]
+
+    with Aggregator(str(stats_file), n_bins=4,
+                    bin_range=(0, 8)) as aggregator:
+        aggregator.extend(values)
+    summary = aggregator.summary()
+    assert summary.count == 10
+    assert summary.mean == pytest.approx(4.9)
+    assert summary.variance == pytest.approx(
+        sum((value - 4.9) ** 2 for value in values) / 10)
+    assert summary.std == pytest.approx(summary.variance ** 0.5)
+    assert summary.min == -1.0
+    assert summary.max == 10.0
+    assert summary.histogram.bin_edges == [0, 2, 4, 6, 8]
+    assert summary.histogram.counts == [0, 1, 5, 1]
+    assert summary.histogram.n_under == 1
+    assert summary.histogram.n_over == 2
+    assert json.loads(stats_file.read()) == summary
+
+    # Statistics of no values are undefined
+    assert Aggregator().summary() == {'count': 0, 'mean': None,
+                                      'variance': None, 'std': None,
+                                      'min': None, 'max': None}
+    with pytest.raises(ValueError):
+        Aggregator(n_bins=4)
+    with pytest.raises(ValueError):
+        Aggregator(n_bins=4, bin_range=(1, 1))
+
+
+def test_aggregator_array_values(tmpdir, numpy):
+    stats_file = tmpdir.join("stats.json")
+    values = [[[0.0, 1.0], [2.0, 3.0], [4.0, 5.0]],
+              [[2.0, 3.0], [4.0, 5.0], [6.0, 7.0]]]
+
+    with Aggregator(str(stats_file), n_bins=2, bin_range=(0, 4),
+                    shape=(3, 2)) as aggregator:
+        if numpy is not None:
+            aggregator.extend(numpy.array(values))
+        else:
+            aggregator.extend(values)
+    summary = aggregator.summary()
+    assert summary.count == 2
+    assert summary.mean == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    assert summary.variance == [[1.0, 1.0], [1.0, 1.0], [1.0, 1.0]]
+    assert summary.std == [[1.0, 1.0], [1.0, 1.0], [1.0, 1.0]]
+    assert summary.min == values[0]
+    assert summary.max == values[1]
+    assert summary.histogram.counts == [[[1, 1], [1, 1]], [[0, 2], [0, 1]],
+                                        [[0, 1], [0, 0]]]
+    assert summary.histogram.n_under == [[0, 0], [0, 0], [0, 0]]
+    assert summary.histogram.n_over == [[0, 0], [0, 1], [1, 2]]
+    assert json.loads(stats_file.read()) == summary
+
+    with pytest.raises(ValueError):
+        aggregator.append([1.0, 2.0])
+    with pytest.raises(ValueError):
+        Aggregator(shape=(0,))
+
+
+def test_aggregator_every_interval():
+    aggregator = Aggregator(every=3)
+    aggregator.extend(range(10))
+    assert aggregator.count == 4
+    assert aggregator.mean == pytest.approx(4.5)
+
+    aggregator = Aggregator(interval=1.0)
+    for n in range(10):
+        aggregator.append(n, time=0.4 * n)
+    assert aggregator.count == 4
+    assert aggregator.max == 8
+    with pytest.raises(ValueError):
+        aggregator.append(10)
+    with pytest.raises(ValueError):
+        Aggregator(every=1, interval=1.0)
+
+
+@pytest.mark.parametrize('filename', ["pos.npy", "pos.bin"])
+@pytest.mark.parametrize('mmap_mode', [False, True])
+def test_load_data(tmpdir, numpy, filename, mmap_mode):
+    data_filename = str(tmpdir.join(filename))
+    with Recorder(data_filename, 'f8', (2,), chunk_size=2) as recorder:
+        for n in range(3):
+            recorder.append([n, n + 0.5])
+
+    loaded_data = load_data(data_filename, mmap_mode)
+    if numpy is not None:
+        assert loaded_data.shape == (3, 2)
+        assert loaded_data.tolist() == [[0, 0.5], [1, 1.5], [2, 2.5]]
+    else:
+        if mmap_mode and sys.version_info[0] < 3:
+            pytest.skip("memory views cannot be cast in Python 2")
+        assert loaded_data.tolist() == [0, 0.5, 1, 1.5, 2, 2.5]
+        if not mmap_mode:
+            assert isinstance(loaded_data, array.array)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of ensemble services."""
+
+import os
+
+import pytest
+
+from simtools import ensemble
+from simtools.data import load_data
+from simtools.ensemble import Ensemble, stack_params
+from simtools.params import load_params, Params, sweep_params
+
+
+@pytest.fixture(params=[False, True], ids=['no_numpy', 'numpy'])
+def numpy(request, monkeypatch):
+    if request.param:
+        numpy = pytest.importorskip('numpy')
+        monkeypatch.setattr(ensemble, 'numpy', numpy)
+        return numpy
+    monkeypatch.setattr(ensemble, 'numpy', None)
+    monkeypatch.setattr('simtools.data.numpy', None)
+    return None
+
+
+@pytest.fixture
+def paramsets():
+    return sweep_params(Params(mass=0.3, label="spring"),
+                        {'spring_const': [1.0, 2.0], 'damping_coef': [0.5]})
+
+
+def test_stack_params(numpy, paramsets):
+    stacked_params = stack_params(paramsets)
+    assert sorted(stacked_params) == ['damping_coef', 'label', 'mass',
+                                      'spring_const']
+    assert list(stacked_params.spring_const) == [1.0, 2.0]
+    assert list(stacked_params.mass) == [0.3, 0.3]
+    assert stacked_params.label == ["spring", "spring"]
+    if numpy is not None:
+        assert isinstance(stacked_params.spring_const, numpy.ndarray)
+
+    assert list(stack_params(paramsets, ['mass'])) == ['mass']
+    with pytest.raises(ValueError):
+        stack_params(paramsets, ['x'])
+    with pytest.raises(ValueError):
+        stack_params([])
+
+
+def test_ensemble(tmpdir, numpy, paramsets):
+    master_dir = tmpdir.join("master")
+    sim_ensemble = Ensemble(paramsets, str(master_dir), data_dirname="data")
+    assert sim_ensemble.n_members == 2
+    with pytest.raises(ValueError):
+        sim_ensemble.recorder("pos.npy")
+
+    # Each member gets its own simulation directory and simulation id
+    sim_paths = sim_ensemble.make_dirs()
+    assert len(set(sim_paths)) == 2
+    assert all(os.path.isdir(os.path.join(sim_path, "data"))
+               for sim_path in sim_paths)
+    sim_ensemble.save_params("param.json", sort_keys=True)
+    for sim_id, sim_path, spring_const in zip(sim_ensemble.sim_ids,
+                                              sim_paths, [1.0, 2.0]):
+        params = load_params(os.path.join(sim_path, "param.json"))
+        assert params.sim_id == sim_id
+        assert params.spring_const == spring_const
+
+    # Data of all members are recorded at once and split by members
+    with sim_ensemble.recorder("pos.npy") as pos_recorder:
+        for step in range(3):
+            pos_recorder.append([step, -step])
+    with sim_ensemble.recorder("vel.bin", shape=(2,)) as vel_recorder:
+        for step in range(3):
+            vel_recorder.append([[step, 0.5], [-step, -0.5]])
+    assert sorted(os.listdir(str(master_dir))) == sorted(
+        os.path.basename(sim_path) for sim_path in sim_paths)
+    member_dirname = os.path.join(sim_paths[1], "data")
+    assert load_data(os.path.join(member_dirname, "pos.npy")).tolist() == [
+        0, -1, -2]
+    vel_data = load_data(os.path.join(member_dirname, "vel.bin")).tolist()
+    if numpy is not None:
+        assert vel_data == [[0, -0.5], [-1, -0.5], [-2, -0.5]]
+    else:
+        assert vel_data == [0, -0.5, -1, -0.5, -2, -0.5]
+
+    # Data of all members are recorded to a combined file
+    with sim_ensemble.recorder("pos.npy", combined=True,
+                               every=2) as pos_recorder:
+        for step in range(3):
+            pos_recorder.append([step, -step])
+    assert load_data(str(master_dir.join("pos.npy"))).tolist() == (
+        [[0, 0], [2, -2]] if numpy is not None else [0, 0, 2, -2])
+
+    # Ensembles recording data at once do not share temporary files
+    other_ensemble = Ensemble(paramsets, str(master_dir))
+    other_ensemble.make_dirs()
+    with sim_ensemble.recorder("pos.npy") as pos_recorder:
+        with other_ensemble.recorder("pos.npy") as other_pos_recorder:
+            for step in range(3):
+                pos_recorder.append([step, -step])
+                other_pos_recorder.append([-step, step])
+    assert load_data(os.path.join(member_dirname, "pos.npy")).tolist() == [
+        0, -1, -2]
+    assert load_data(other_ensemble.member_filename(
+        1, "pos.npy")).tolist() == [0, 1, 2]
+    assert not [filename for filename in os.listdir(str(master_dir))
+                if filename.startswith(".")]
@@ -9,7 +9,9 @@ import os
 import pytest
 
 from simtools.exceptions import FileError
-from simtools.params import export_params, load_paramnames, ParamSets, Params
+from simtools.params import (ENV_PARAMS_FILENAME, export_params,
+                             load_paramnames, PARAMS_ENV_VAR, ParamSets,
+                             Params, sweep_params)
 
 
 @pytest.fixture
@@ -194,6 +196,24 @@ def test_params_load_no_ext(tmpdir):
         p.load(str(params_file))
 
 
+def test_params_load_env(monkeypatch):
+    # Correct
+    monkeypatch.setenv(PARAMS_ENV_VAR, '{"p1": 1, "p2": [2.5, "abc"]}')
+    p = Params()
+    p.load(ENV_PARAMS_FILENAME)
+    assert p == {'p1': 1, 'p2': [2.5, "abc"]}
+
+    # Invalid parameters
+    monkeypatch.setenv(PARAMS_ENV_VAR, '{"p1": 1,')
+    with pytest.raises(FileError):
+        Params().load(ENV_PARAMS_FILENAME)
+
+    # Environment variable not set
+    monkeypatch.delenv(PARAMS_ENV_VAR)
+    with pytest.raises(ValueError):
+        Params().load(ENV_PARAMS_FILENAME)
+
+
 def test_params_save(tmpdir, params):
     params_file = tmpdir.join("params.json")
 
@@ -404,6 +424,24 @@ p4 = None
         paramsets[2]
 
 
+def test_sweep_params():
+    params = Params(p1=1, p2=2.5, p3="abc")
+
+    paramsets = sweep_params(params, {'p2': [0.5, 1.5], 'p1': (1, 2, 3)})
+    assert isinstance(paramsets, ParamSets)
+    assert [(paramset.p1, paramset.p2) for paramset in paramsets] == [
+        (1, 0.5), (1, 1.5), (2, 0.5), (2, 1.5), (3, 0.5), (3, 1.5)]
+    assert all(paramset.p3 == "abc" for paramset in paramsets)
+    assert params.p2 == 2.5
+
+    assert len(sweep_params(params, {})) == 1
+    assert len(sweep_params(params, {'p1': []})) == 0
+    with pytest.raises(TypeError):
+        sweep_params(params, {'p1': 1})
+    with pytest.raises(TypeError):
+        sweep_params(params, {'p3': "abc"})
+
+
 def test_paramsets_save_csv(tmpdir):
     # Default (with header and without record numbers)
     paramsets_file = tmpdir.join("paramsets_default.csv")
@@ -1096,6 +1134,40 @@ p5 = 10
     assert n_lines_none == 1
 
 
+def test_export_params_stream(tmpdir):
+    params_paths = []
+    for p in range(3):
+        params_file = tmpdir.join("params{}.json".format(p))
+        params_file.write('{{"p1": {}}}'.format(p))
+        params_paths.append(str(params_file))
+    loaded_paths = []
+
+    def generate_params_paths():
+        for params_path in params_paths:
+            loaded_paths.append(params_path)
+            yield params_path
+
+    # Parameter files are loaded one at a time while records are saved
+    export_file = tmpdir.join("params_export.json")
+    export_params(str(export_file), generate_params_paths(), ['p1'])
+    assert loaded_paths == params_paths
+    assert json.load(export_file) == [{'p1': 0}, {'p1': 1}, {'p1': 2}]
+
+    # An incomplete export file is not left behind, and an existing export
+    # file is left intact
+    tmpdir.join("params3.json").write('{"p2": 3}')
+    params_paths.append(str(tmpdir.join("params3.json")))
+    tmpdir.join("params_export_error.json").write("[]")
+    for export_filename in ("params_export_error.csv",
+                            "params_export_error.json"):
+        with pytest.raises(ValueError):
+            export_params(str(tmpdir.join(export_filename)), params_paths,
+                          ['p1'])
+    assert not tmpdir.join("params_export_error.csv").check()
+    assert tmpdir.join("params_export_error.json").read() == "[]"
+    assert not [path for path in tmpdir.listdir() if path.ext == ".tmp"]
+
+
 def test_export_params_json_upper(tmpdir):
     export_file = tmpdir.join("PARAMS_EXPORT_UPPER.JSON")
     p0 = Params({'p1': 1, 'p2': 2.5, 'p3': "abc"})
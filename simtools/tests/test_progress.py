@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of batch progress services."""
+
+import io
+import json
+
+import pytest
+
+from simtools.base import Dict
+from simtools.progress import BatchProgress, format_status, RUNTIME_WINDOW
+
+
+def test_batch_progress_status():
+    progress = BatchProgress(25)
+    status = progress.status()
+    assert (status.queued, status.running, status.done, status.failed) == (
+        25, 0, 0, 0)
+    assert status.throughput is None
+    assert status.eta is None
+
+    for _ in range(22):
+        progress.start_sim()
+    for runtime in range(1, 21):
+        progress.finish_sim(runtime % 2, float(runtime))
+    status = progress.status()
+    assert (status.queued, status.running, status.done, status.failed) == (
+        3, 2, 10, 10)
+    assert status.mean_runtime == pytest.approx(10.5)
+    assert status.p95_runtime == 19.0
+    assert status.throughput > 0
+    assert status.eta > 0
+
+
+def test_batch_progress_runtime_window():
+    progress = BatchProgress(2 * RUNTIME_WINDOW)
+    for runtime in range(2 * RUNTIME_WINDOW):
+        progress.start_sim()
+        progress.finish_sim(0, float(runtime))
+
+    # The mean runtime is exact, whereas the percentile is estimated from the
+    # latest runtimes only
+    status = progress.status()
+    assert status.mean_runtime == pytest.approx(RUNTIME_WINDOW - 0.5)
+    assert status.p95_runtime == RUNTIME_WINDOW + 0.95 * RUNTIME_WINDOW - 1
+    assert len(progress._runtimes) == RUNTIME_WINDOW
+
+
+def test_batch_progress_redraw(tmpdir):
+    stream = io.StringIO()
+    status_filename = str(tmpdir.join("status.json"))
+
+    with BatchProgress(2, stream, status_filename, interval=60.0) as progress:
+        progress.start_sim()
+        progress.finish_sim(0, 0.5)
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 1
+    assert lines[0].startswith("1/2 done | 0 failed | 0 running | 1 queued")
+    with open(status_filename) as status_file:
+        status = json.load(status_file)
+    assert status['done'] == 1
+    assert status['queued'] == 1
+    assert tmpdir.listdir() == [tmpdir.join("status.json")]
+
+
+def test_batch_progress_invalid_interval():
+    with pytest.raises(ValueError):
+        BatchProgress(1, interval=0)
+
+
+def test_format_status():
+    status = Dict(total=3, queued=0, running=1, done=1, failed=1,
+                  throughput=2.0, mean_runtime=30.0, p95_runtime=3725.0,
+                  eta=90.0, cpu_load=0.5, memory_load=None)
+    assert format_status(status) == (
+        "1/3 done | 1 failed | 1 running | 0 queued | 2.0 sims/min | "
+        "mean 30.0s p95 1:02:05 | ETA 0:01:30 | CPU 50%")
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of shared-filesystem work queue."""
+
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+from simtools.queue import run_worker, SimQueue
+
+
+@pytest.fixture
+def model_file(tmpdir):
+    model_file = tmpdir.join("model.py")
+    model_file.write(
+        "import sys\n"
+        "open('args.txt', 'w').write(' '.join(sys.argv[1:]))\n"
+        "sys.exit(int(sys.argv[-1]))\n")
+    return model_file
+
+
+def _work(spool_dirname, sim_master_dirname):
+    run_worker(SimQueue(spool_dirname), sim_master_dirname,
+               poll_interval=0.1)
+
+
+def test_sim_queue_claim_complete(tmpdir, model_file):
+    queue = SimQueue(str(tmpdir.join("spool")))
+    job_ids = [queue.put(str(model_file), model_args=[str(i)])
+               for i in range(3)]
+    assert job_ids == sorted(job_ids)
+    assert queue.counts() == {'pending': 3, 'running': 0, 'done': 0,
+                              'failed': 0}
+
+    # Simulations are claimed in the order in which they were enqueued
+    sims = [queue.claim("worker") for _ in range(3)]
+    assert [sim.job_id for sim in sims] == job_ids
+    assert sims[0].model_filename == str(model_file)
+    assert sims[0].model_args == ["0"]
+    assert sims[0].worker_id == "worker"
+    assert queue.claim("worker") is None
+    assert queue.counts().running == 3
+
+    # The outcome is recorded according to the exit status
+    assert queue.complete(sims[0], 0, sim_id="a")
+    assert queue.complete(sims[1], 1)
+    assert queue.counts() == {'pending': 0, 'running': 1, 'done': 1,
+                              'failed': 1}
+    with open(str(tmpdir.join("spool", "done", job_ids[0] + ".json"))) as f:
+        result = json.load(f)
+    assert result['exit_status'] == 0
+    assert result['sim_id'] == "a"
+    assert 'lease_path' not in result
+
+
+def test_sim_queue_requeue_expired(tmpdir, model_file):
+    queue = SimQueue(str(tmpdir.join("spool")), lease_timeout=10.0)
+    job_id = queue.put(str(model_file))
+    sim = queue.claim()
+
+    # A lease that is kept alive does not expire
+    assert queue.heartbeat(sim)
+    assert queue.requeue_expired() == 0
+
+    # An expired lease is requeued and cannot be completed by its former owner
+    past = time.time() - 60.0
+    os.utime(sim.lease_path, (past, past))
+    assert queue.requeue_expired() == 1
+    assert not queue.heartbeat(sim)
+    assert not queue.complete(sim, 0)
+    new_sim = queue.claim()
+    assert new_sim.job_id == job_id
+    assert queue.complete(new_sim, 0)
+    assert queue.counts().done == 1
+
+
+def test_sim_queue_invalid_lease_timeout(tmpdir):
+    with pytest.raises(ValueError):
+        SimQueue(str(tmpdir.join("spool")), lease_timeout=0)
+
+
+def test_run_worker(tmpdir, model_file):
+    queue = SimQueue(str(tmpdir.join("spool")))
+    queue.put(str(model_file), data_dirname="data",
+              executable=[sys.executable], model_args=["0"])
+    queue.put(str(model_file), executable=[sys.executable], model_args=["1"])
+    queue.put(str(tmpdir.join("missing.py")), executable=[sys.executable],
+              model_args=["0"])
+
+    assert run_worker(queue, str(tmpdir.join("master"))) == 3
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 1,
+                              'failed': 2}
+    sim_dirs = tmpdir.join("master").listdir()
+    assert len(sim_dirs) == 3
+    assert any(sim_dir.join("data").check(dir=1) for sim_dir in sim_dirs)
+
+
+def test_run_workers(tmpdir, model_file):
+    spool_dirname = str(tmpdir.join("spool"))
+    master_dirname = str(tmpdir.join("master"))
+    queue = SimQueue(spool_dirname)
+    n_sims = 12
+    for _ in range(n_sims):
+        queue.put(str(model_file), executable=[sys.executable],
+                  model_args=["0"])
+
+    # Each simulation is launched exactly once by one of the workers
+    workers = [multiprocessing.Process(target=_work,
+                                       args=(spool_dirname, master_dirname))
+               for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert queue.counts().done == n_sims
+    assert len(tmpdir.join("master").listdir()) == n_sims
+
+
+def test_run_worker_partial(tmpdir, model_file):
+    queue = SimQueue(str(tmpdir.join("spool")))
+    queue.put(str(model_file), executable=[sys.executable], model_args=["0"])
+    queue.put(str(model_file), executable=[sys.executable], model_args=["1"])
+
+    assert run_worker(queue, str(tmpdir.join("master")), partial=True) == 2
+    sim_dirnames = sorted(path.basename
+                          for path in tmpdir.join("master").listdir())
+    assert len(sim_dirnames) == 2
+    assert not sim_dirnames[0].endswith(".partial")
+    assert sim_dirnames[1].startswith("_")
+    assert sim_dirnames[1].endswith(".partial")
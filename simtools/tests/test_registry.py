@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of run registry."""
+
+import sqlite3
+import sys
+
+import pytest
+
+from simtools.base import Dict
+from simtools.registry import Registry
+
+
+@pytest.fixture
+def registry(tmpdir):
+    return Registry(str(tmpdir.join("runs.db")))
+
+
+def test_registry_wal(tmpdir, registry):
+    conn = sqlite3.connect(str(tmpdir.join("runs.db")))
+    try:
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    finally:
+        conn.close()
+    assert journal_mode == "wal"
+
+
+def test_registry_runs(tmpdir, registry):
+    params_files = []
+    for a in range(3):
+        params_file = tmpdir.join("params{}.py".format(a))
+        params_file.write("a = {}\nb = 'x'\nc = [1, 2]\n".format(a))
+        params_files.append(str(params_file))
+
+    run_ids = [registry.add_run(str(a), str(tmpdir.join(str(a))),
+                                ["model.py", "--save"], params_files[a])
+               for a in range(3)]
+    assert registry.count_runs() == {'running': 3, 'done': 0, 'failed': 0,
+                                     'error': 0}
+
+    registry.finish_run(run_ids[0], Dict(exit_status=0, cause='exit',
+                                         wall_time=2.0, max_rss=1024))
+    registry.finish_run(run_ids[1], Dict(exit_status=-9, cause='signal',
+                                         signal=9, wall_time=5.0))
+    registry.fail_run(run_ids[2], "Traceback")
+    assert registry.count_runs() == {'running': 0, 'done': 1, 'failed': 1,
+                                     'error': 1}
+
+    # Finding simulations by status
+    runs = registry.find_runs('done')
+    assert len(runs) == 1
+    assert runs[0].sim_id == "0"
+    assert runs[0].cmd == ["model.py", "--save"]
+    assert runs[0].max_rss == 1024
+    runs = registry.find_runs(('failed', 'error'))
+    assert [run.sim_id for run in runs] == ["1", "2"]
+    assert runs[0].signal == 9
+    assert runs[1].error == "Traceback"
+
+    # Finding the slowest simulations
+    runs = registry.find_runs(order_by='wall_time', descending=True, limit=1)
+    assert [run.sim_id for run in runs] == ["1"]
+
+    # Finding simulations by parameters (only scalar parameters are recorded)
+    assert [run.sim_id for run in registry.find_runs(params={'a': 1})] == [
+        "1"]
+    assert len(registry.find_runs(params={'b': "x"})) == 3
+    assert registry.find_runs(params={'a': 1, 'b': "y"}) == []
+    assert registry.find_runs(params={'c': "[1, 2]"}) == []
+    assert registry.count_runs({'a': 0}).done == 1
+
+
+def test_registry_move_sim(tmpdir, registry):
+    sim_path = str(tmpdir.join("_1.partial"))
+    final_sim_path = str(tmpdir.join("1"))
+    registry.add_run("1", sim_path)
+    registry.add_run("2", str(tmpdir.join("2")))
+
+    registry.move_sim(sim_path, final_sim_path)
+    assert [run.sim_path for run in registry.find_runs()] == [
+        final_sim_path, str(tmpdir.join("2"))]
+
+
+def test_registry_read_only(tmpdir, registry):
+    registry.add_run("1")
+
+    # A read-only registry is only queried
+    read_only_registry = Registry(str(tmpdir.join("runs.db")),
+                                  read_only=True)
+    assert read_only_registry.count_runs().running == 1
+    if sys.version_info >= (3, 4):
+        with pytest.raises(sqlite3.OperationalError):
+            read_only_registry.add_run("2")
+        with pytest.raises(sqlite3.OperationalError):
+            Registry(str(tmpdir.join("missing.db")),
+                     read_only=True).count_runs()
+        assert not tmpdir.join("missing.db").check()
+
+
+def test_registry_invalid(registry):
+    with pytest.raises(ValueError):
+        registry.find_runs('unknown')
+    with pytest.raises(ValueError):
+        registry.find_runs(order_by='unknown')
@@ -1,13 +1,35 @@
 # -*- coding: utf-8 -*-
 """Unit tests of simulation launch services."""
 
+import errno
+import gzip
+import io
+import json
+import multiprocessing
 import os
+import re
+import stat
+import subprocess
+import sys
 import time
 
 import pytest
 
-from simtools.simrun import (generate_sim_id, generate_sim_dirname,
-                             load_sim_dirnames, make_dirs, norm_executable)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import simtools
+from simtools.params import PARAMS_ENV_VAR
+from simtools.registry import Registry
+from simtools.simrun import (copy_file, cpu_slots, finalize_sim_dir,
+                             ForkServer, generate_sim_id, generate_sim_dirname,
+                             is_partial_dirname, iter_sim_dirnames,
+                             list_sim_dirnames, load_sim_dirnames, make_dirs,
+                             make_sim_cmd, move_sim_dir, norm_executable,
+                             reserve_sim_dir, run_sim, run_sim_cmd,
+                             run_sim_inproc, shard_sim_dirname)
 
 
 @pytest.fixture
@@ -21,6 +43,22 @@ def test_generate_sim_id(local_time):
     assert sim_id == "20001030_070809"
 
 
+@pytest.mark.parametrize('scheme, pattern', [
+    ('datetime_us', r"^\d{8}_\d{6}_\d{6}$"),
+    ('unique', r"^\d{8}_\d{6}_\d{6}_[0-9A-Za-z-]+_\d+$"),
+    ('ulid', r"^[0-9A-HJKMNP-TV-Z]{26}$")])
+def test_generate_sim_id_scheme(scheme, pattern):
+    sim_ids = [generate_sim_id(scheme) for _ in range(3)]
+    for sim_id in sim_ids:
+        assert re.match(pattern, sim_id)
+    assert sim_ids == sorted(sim_ids)
+
+
+def test_generate_sim_id_scheme_unknown():
+    with pytest.raises(ValueError):
+        generate_sim_id('unknown')
+
+
 def test_generate_sim_dirname(local_time):
     # Default
     sim_dirname = generate_sim_dirname()
@@ -77,6 +115,167 @@ def test_make_dirs_exist(tmpdir):
             sim_path = make_dirs(sim_dirname, data_dirname=data_dirname)
 
 
+def test_reserve_sim_dir(tmpdir, local_time):
+    with tmpdir.as_cwd():
+        # Unique simulation ids
+        sim_master_dirname = "simulations1"
+        sim_ids = set()
+        for _ in range(10):
+            sim_id, sim_path = reserve_sim_dir(sim_master_dirname,
+                                               data_dirname="data")
+            assert sim_path == os.path.join(sim_master_dirname, sim_id)
+            assert os.path.isdir(os.path.join(sim_path, "data"))
+            sim_ids.add(sim_id)
+        assert len(sim_ids) == 10
+
+        # Colliding simulation ids
+        sim_master_dirname = "simulations2"
+        sim_ids = [reserve_sim_dir(sim_master_dirname, scheme='datetime')[0]
+                   for _ in range(3)]
+        assert sim_ids == ["20001030_070809", "20001030_070809_1",
+                           "20001030_070809_2"]
+
+        # Temporary directory
+        sim_id, sim_path = reserve_sim_dir(tmp=True, scheme='datetime')
+        assert sim_id == "20001030_070809"
+        assert sim_path == "_20001030_070809"
+
+        # Too many collisions
+        with pytest.raises(OSError):
+            reserve_sim_dir(sim_master_dirname, scheme='datetime',
+                            max_attempts=2)
+
+
+def test_make_dirs_partial(tmpdir):
+    sim_dirname = "20001030_070809"
+
+    with tmpdir.as_cwd():
+        sim_path = make_dirs(sim_dirname, "simulations", "data", partial=True)
+        assert sim_path == os.path.join("simulations",
+                                        "_20001030_070809.partial")
+        assert os.path.isdir(os.path.join(sim_path, "data"))
+        assert is_partial_dirname(sim_path)
+
+        # The partial simulation directory is renamed to its final name, which
+        # is recorded in the run registry
+        registry = Registry("runs.db")
+        registry.add_run(sim_path=sim_path)
+        final_sim_path = finalize_sim_dir(sim_path, "runs.db")
+        assert final_sim_path == os.path.join("simulations", sim_dirname)
+        assert os.path.isdir(os.path.join(final_sim_path, "data"))
+        assert not os.path.exists(sim_path)
+        assert registry.find_runs()[0].sim_path == os.path.abspath(
+            final_sim_path)
+
+        # The final name must not be taken
+        with pytest.raises(OSError):
+            make_dirs(sim_dirname, "simulations", partial=True)
+        sim_path = make_dirs("x", "simulations", partial=True)
+        os.mkdir(os.path.join("simulations", "x"))
+        with pytest.raises(OSError):
+            finalize_sim_dir(sim_path)
+
+        # Only partial names can be finalized
+        with pytest.raises(ValueError):
+            finalize_sim_dir(final_sim_path)
+
+
+@pytest.mark.parametrize('sim_dirname, partial', [
+    ("_20001030_070809.partial", True),
+    ("sims/_abc.partial", True),
+    ("_.partial", False),
+    ("20001030_070809", False),
+    ("_20001030_070809", False),
+    ("20001030_070809.partial", False)])
+def test_is_partial_dirname(sim_dirname, partial):
+    assert is_partial_dirname(sim_dirname) == partial
+
+
+def test_reserve_sim_dir_partial(tmpdir, local_time):
+    with tmpdir.as_cwd():
+        os.mkdir("20001030_070809")
+
+        # Names whose final form is taken are skipped
+        sim_id, sim_path = reserve_sim_dir(scheme='datetime', partial=True)
+        assert sim_id == "20001030_070809_1"
+        assert sim_path == "_20001030_070809_1.partial"
+        assert os.path.isdir(sim_path)
+
+
+def test_list_sim_dirnames(tmpdir):
+    for dirname in ("b", "a", "_c", "_d.partial", ".simstore"):
+        tmpdir.mkdir(dirname)
+    tmpdir.join("e.txt").write("")
+
+    assert list_sim_dirnames(str(tmpdir)) == ["_c", "a", "b"]
+    with tmpdir.as_cwd():
+        assert list_sim_dirnames() == ["_c", "a", "b"]
+
+
+def test_shard_sim_dirname():
+    # Names are placed in two levels of shard directories derived from their
+    # hash, the same for all names of the same simulation directory
+    sim_path = shard_sim_dirname("20001030_070809")
+    shard_path, sim_dirname = os.path.split(sim_path)
+    assert sim_dirname == "20001030_070809"
+    assert re.match(r"^[0-9a-f]{2}$", os.path.dirname(shard_path))
+    assert re.match(r"^[0-9a-f]{2}$", os.path.basename(shard_path))
+    assert shard_sim_dirname("20001030_070809", 'hash') == sim_path
+    for dirname in ("_20001030_070809", "_20001030_070809.partial"):
+        assert shard_sim_dirname(dirname) == os.path.join(shard_path,
+                                                          dirname)
+
+    # Names are placed in shard directories of their date and hour
+    assert shard_sim_dirname("20001030_070809", 'date') == os.path.join(
+        "20001030", "07", "20001030_070809")
+    assert shard_sim_dirname("_20001030_070809.partial", 'date') == \
+        os.path.join("20001030", "07", "_20001030_070809.partial")
+    with pytest.raises(ValueError):
+        shard_sim_dirname("sim_20001030", 'date')
+    with pytest.raises(ValueError):
+        shard_sim_dirname("20001030_070809", 'xyz')
+
+
+def test_make_dirs_shard(tmpdir, local_time):
+    with tmpdir.as_cwd():
+        sim_path = make_dirs("20001030_070809", "simulations", "data",
+                             partial=True, shard='date')
+        assert sim_path == os.path.join("simulations", "20001030", "07",
+                                        "_20001030_070809.partial")
+        assert os.path.isdir(os.path.join(sim_path, "data"))
+        final_sim_path = finalize_sim_dir(sim_path)
+        assert final_sim_path == os.path.join("simulations", "20001030",
+                                              "07", "20001030_070809")
+
+        # Reserved names are checked and created in their shard directories
+        sim_id, sim_path = reserve_sim_dir("simulations", scheme='datetime',
+                                           shard='date')
+        assert sim_id == "20001030_070809_1"
+        assert sim_path == os.path.join("simulations", "20001030", "07",
+                                        "20001030_070809_1")
+        assert os.path.isdir(sim_path)
+        sim_id, sim_path = reserve_sim_dir("simulations", scheme='datetime',
+                                           shard='hash')
+        assert sim_id == "20001030_070809"
+        assert sim_path == os.path.join(
+            "simulations", shard_sim_dirname("20001030_070809"))
+        assert os.path.isdir(sim_path)
+
+
+def test_list_sim_dirnames_shard(tmpdir):
+    for dirname in ("20001030/07/b", "20001030/07/a", "20001030/08/_c",
+                    "20001031/07/_d.partial", ".simstore/ab/e"):
+        tmpdir.ensure_dir(*dirname.split("/"))
+
+    assert list_sim_dirnames(str(tmpdir), shard='date') == [
+        os.path.join("20001030", "07", "a"),
+        os.path.join("20001030", "07", "b"),
+        os.path.join("20001030", "08", "_c")]
+    assert list_sim_dirnames(str(tmpdir)) == ["20001030", "20001031"]
+    with pytest.raises(OSError):
+        list_sim_dirnames(str(tmpdir.join("nonexistent")))
+
+
 @pytest.mark.parametrize('executable, normal_executable', [
     ("/myexec", ["/myexec"]),
     ("/myexec -x", ["/myexec", "-x"])])
@@ -107,6 +306,471 @@ def test_norm_executable_rel_exist(tmpdir, executable, normal_executable):
         assert normalized_executable == normal_executable
 
 
+@pytest.mark.parametrize('mode', ['copy', 'hardlink', 'reflink', 'symlink'])
+def test_copy_file(tmpdir, mode):
+    src_file = tmpdir.join("model.py")
+    src_file.write("x = 1")
+    sim_dir = tmpdir.mkdir("sim")
+
+    # Copy to a directory
+    dst_filename = copy_file(str(src_file), str(sim_dir), mode)
+    assert dst_filename == str(sim_dir.join("model.py"))
+    assert sim_dir.join("model.py").read() == "x = 1"
+
+    # Copy to a file
+    dst_filename = copy_file(str(src_file), str(sim_dir.join("model2.py")),
+                             mode)
+    assert sim_dir.join("model2.py").read() == "x = 1"
+
+    # Properties specific to the copy mode
+    if mode == 'hardlink':
+        # Copies are read-only, but the original file is linked only if it is
+        # read-only itself
+        assert not os.path.samefile(str(src_file), dst_filename)
+        assert not os.stat(dst_filename).st_mode & stat.S_IWUSR
+        assert os.stat(str(src_file)).st_mode & stat.S_IWUSR
+        src_file.chmod(0o444)
+        dst_filename = copy_file(str(src_file),
+                                 str(sim_dir.join("model3.py")), mode)
+        assert os.path.samefile(str(src_file), dst_filename)
+        assert not os.stat(dst_filename).st_mode & stat.S_IWUSR
+    elif mode == 'symlink':
+        assert os.path.islink(dst_filename)
+    else:
+        assert not os.path.samefile(str(src_file), dst_filename)
+
+
+def test_copy_file_mode(tmpdir):
+    src_file = tmpdir.join("model.py")
+    src_file.write("")
+
+    with pytest.raises(ValueError):
+        copy_file(str(src_file), str(tmpdir.join("model2.py")), 'unknown')
+
+
+@pytest.fixture
+def model_file(monkeypatch, tmpdir):
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(
+        os.path.dirname(os.path.abspath(simtools.__file__))))
+    model_file = tmpdir.join("model.py")
+    model_file.write(
+"""import os
+import sys
+
+import simtools
+
+options, extra_args = simtools.parse_known_args(['params_filename',
+                                                 'save_data', 'sim_id'])
+with open("argv.txt", 'w') as argv_file:
+    argv_file.write(" ".join(sys.argv[1:]))
+if __name__ != '__main__':
+    sys.exit("not run as '__main__'")
+if extra_args:
+    sys.exit(int(extra_args[0]))
+""")
+    return model_file
+
+
+def test_make_sim_cmd():
+    # Model file only
+    cmd = make_sim_cmd("model.py")
+    assert cmd == ["model.py", "--save"]
+
+    # All arguments
+    cmd = make_sim_cmd("model.py", "params.py", "12345", "data",
+                       ["python", "-u"], ["-v"])
+    assert cmd == ["python", "-u", "model.py", "--params", "params.py",
+                   "--simid", "12345", "--data-dir", "data", "--save", "-v"]
+
+    # Executable as a string
+    cmd = make_sim_cmd("model.py", executable="python")
+    assert cmd == ["python", "model.py", "--save"]
+
+    # Executable neither a string nor iterable
+    with pytest.raises(TypeError):
+        make_sim_cmd("model.py", executable=1)
+
+
+def test_run_sim(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+
+    status = run_sim(str(model_file), sim_id="12345",
+                     executable=sys.executable, model_args=["3"],
+                     sim_path=str(sim_dir))
+    assert status == 3
+    assert sim_dir.join("argv.txt").read() == "--simid 12345 --save 3"
+
+
+def test_run_sim_manifest(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+
+    status = run_sim(str(model_file), executable=sys.executable,
+                     model_args=["3"], sim_path=str(sim_dir),
+                     manifest_filename="run.json")
+    assert status == 3
+    manifest = json.load(sim_dir.join("run.json"))
+    assert manifest['cmd'] == [sys.executable, str(model_file), "--save", "3"]
+    assert manifest['sim_path'] == str(sim_dir)
+    assert manifest['exit_status'] == 3
+    assert manifest['wall_time'] >= 0.0
+    if hasattr(os, 'wait4'):
+        for key in ('user_time', 'system_time', 'max_rss', 'in_blocks',
+                    'out_blocks', 'vol_ctx_switches', 'invol_ctx_switches'):
+            assert manifest[key] >= 0
+
+
+def test_run_sim_registry(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+    registry_filename = str(tmpdir.join("runs.db"))
+
+    exit_status = run_sim(str(model_file), sim_id="12345",
+                          executable=sys.executable, sim_path=str(sim_dir),
+                          registry_filename=registry_filename)
+    assert exit_status == 0
+    runs = Registry(registry_filename).find_runs()
+    assert len(runs) == 1
+    assert runs[0].sim_id == "12345"
+    assert runs[0].sim_path == str(sim_dir)
+    assert runs[0].status == 'done'
+    assert runs[0].wall_time > 0
+
+    # A simulation that cannot be launched is recorded as well
+    with pytest.raises(OSError):
+        run_sim(str(model_file), executable=str(tmpdir.join("missing")),
+                sim_path=str(sim_dir), registry_filename=registry_filename)
+    assert Registry(registry_filename).count_runs().error == 1
+
+
+def test_run_sim_cmd(tmpdir):
+    # Exit status
+    run_info = run_sim_cmd([sys.executable, "-c", "import sys; sys.exit(4)"],
+                           str(tmpdir))
+    assert run_info.exit_status == 4
+    assert run_info.sim_path == str(tmpdir)
+
+    # Signal
+    if hasattr(os, 'kill'):
+        run_info = run_sim_cmd(
+            [sys.executable, "-c", "import os; os.kill(os.getpid(), 9)"])
+        assert run_info.exit_status == -9
+
+
+def test_run_sim_cmd_timeout(tmpdir):
+    # Child process along with its own child process
+    cmd = [sys.executable, "-c",
+           "import subprocess, sys, time; "
+           "subprocess.Popen([sys.executable, '-c', "
+           "'import time; time.sleep(60)']); "
+           "time.sleep(60)"]
+    start_time = time.time()
+    run_info = run_sim_cmd(cmd, str(tmpdir), timeout=0.5)
+    assert time.time() - start_time < 5.0
+    assert run_info.cause == 'timeout'
+    assert run_info.exit_status < 0
+
+    # No timeout
+    run_info = run_sim_cmd([sys.executable, "-c", "pass"], timeout=60.0)
+    assert run_info.cause == 'exit'
+    assert run_info.exit_status == 0
+
+
+@pytest.mark.skipif(not hasattr(os, 'wait4'), reason="requires POSIX")
+def test_run_sim_cmd_limits(tmpdir):
+    # Memory limit
+    cmd = [sys.executable, "-c", "x = bytearray(1 << 30)"]
+    run_info = run_sim_cmd(cmd, str(tmpdir), max_memory=1 << 28)
+    assert run_info.exit_status == 1
+
+    # CPU time limit
+    cmd = [sys.executable, "-c", "while True: pass"]
+    run_info = run_sim_cmd(cmd, str(tmpdir), max_cpu_time=1, timeout=30.0)
+    assert run_info.cause == 'signal'
+    assert run_info.user_time + run_info.system_time < 5.0
+
+
+@pytest.mark.skipif(not hasattr(resource, 'prlimit'),
+                    reason="requires resource.prlimit()")
+def test_run_sim_cmd_no_preexec(monkeypatch, tmpdir):
+    popen = subprocess.Popen
+
+    def check_popen(*args, **kwargs):
+        assert 'preexec_fn' not in kwargs
+        return popen(*args, **kwargs)
+
+    # The child process is started in a new session and its resources are
+    # limited without running code in it before the command is executed
+    monkeypatch.setattr(subprocess, 'Popen', check_popen)
+    cmd = [sys.executable, "-c",
+           "import os, resource, sys; "
+           "sys.exit(os.getsid(0) == os.getpid() and "
+           "resource.getrlimit(resource.RLIMIT_AS) == (1 << 30, 1 << 30) "
+           "and 3)"]
+    run_info = run_sim_cmd(cmd, str(tmpdir), timeout=60.0,
+                           max_memory=1 << 30)
+    assert run_info.exit_status == 3
+
+
+def test_run_sim_cmd_logs(tmpdir):
+    cmd = [sys.executable, "-c",
+           "import sys; sys.stdout.write('out' * 100); sys.stdout.flush(); "
+           "sys.stderr.write('err')"]
+
+    # Separate log files
+    run_info = run_sim_cmd(cmd, str(tmpdir), stdout="out.log",
+                           stderr="err.log")
+    assert tmpdir.join("out.log").read() == "out" * 100
+    assert tmpdir.join("err.log").read() == "err"
+    assert run_info.logs == [str(tmpdir.join("out.log")),
+                             str(tmpdir.join("err.log"))]
+
+    # Common log file
+    run_sim_cmd(cmd, str(tmpdir), stdout="sim.log", stderr="sim.log")
+    assert tmpdir.join("sim.log").read() == "out" * 100 + "err"
+
+    # Capped and compressed log file
+    run_info = run_sim_cmd(cmd, str(tmpdir), stdout="capped.log",
+                           log_max_size=6, compress_logs=True)
+    assert not tmpdir.join("capped.log").check()
+    assert run_info.logs == [str(tmpdir.join("capped.log.gz"))]
+    with gzip.open(run_info.logs[0], 'rb') as log_file:
+        assert log_file.read() == b"outout"
+
+
+@pytest.fixture
+def staged_dir(tmpdir):
+    stage_dir = tmpdir.mkdir("stage").mkdir("sim")
+    stage_dir.join("out.txt").write("abc")
+    stage_dir.mkdir("data").join("x.dat").write("x")
+    stage_dir.join("link").mksymlinkto("out.txt")
+    return stage_dir
+
+
+def test_move_sim_dir(tmpdir, staged_dir):
+    # An empty placeholder (with an empty data directory) is replaced
+    placeholder = tmpdir.mkdir("master").mkdir("sim")
+    placeholder.mkdir("data")
+
+    move_sim_dir(str(staged_dir), str(placeholder))
+    assert not staged_dir.check()
+    assert placeholder.join("out.txt").read() == "abc"
+    assert placeholder.join("data", "x.dat").read() == "x"
+
+    # The new location is recorded in the run manifest and the run registry
+    moved_dir = tmpdir.join("moved")
+    registry_filename = str(tmpdir.join("runs.db"))
+    Registry(registry_filename).add_run(sim_path=str(placeholder))
+    simtools.save_manifest(str(placeholder.join("run.json")),
+                           {'sim_path': str(placeholder), 'exit_status': 0})
+    move_sim_dir(str(placeholder), str(moved_dir),
+                 registry_filename=registry_filename,
+                 manifest_filename="run.json")
+    assert json.loads(moved_dir.join("run.json").read()) == {
+        'sim_path': str(moved_dir), 'exit_status': 0}
+    assert Registry(registry_filename).find_runs()[0].sim_path == str(
+        moved_dir)
+    moved_dir.move(placeholder)
+
+    # A placeholder that is not empty is not replaced
+    other_dir = tmpdir.mkdir("other")
+    other_dir.join("out.txt").write("def")
+    with pytest.raises(OSError):
+        move_sim_dir(str(other_dir), str(placeholder))
+
+
+def test_move_sim_dir_cross_device(monkeypatch, tmpdir, staged_dir):
+    # Renaming the simulation directory fails as it would between different
+    # file systems
+    rename = os.rename
+
+    def cross_device_rename(src, dst):
+        if os.path.normpath(src) == str(staged_dir):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        rename(src, dst)
+
+    monkeypatch.setattr(os, 'rename', cross_device_rename)
+    placeholder = tmpdir.mkdir("master").mkdir("sim")
+
+    move_sim_dir(str(staged_dir), str(placeholder), n_workers=2)
+    assert not staged_dir.check()
+    assert placeholder.join("out.txt").read() == "abc"
+    assert placeholder.join("data", "x.dat").read() == "x"
+    assert placeholder.join("link").readlink() == "out.txt"
+    assert tmpdir.join("master").listdir() == [placeholder]
+
+
+def test_cpu_slots():
+    # As many slots as CPUs
+    n_cpus = multiprocessing.cpu_count()
+    if hasattr(os, 'sched_getaffinity'):
+        n_cpus = len(os.sched_getaffinity(0))
+    slots = cpu_slots(n_cpus)
+    assert len(slots) == n_cpus
+    assert all(len(slot) == 1 for slot in slots)
+    assert len(set(slot[0] for slot in slots)) == n_cpus
+
+    # More slots than CPUs
+    slots = cpu_slots(2 * n_cpus)
+    assert len(slots) == 2 * n_cpus
+    assert slots[:n_cpus] == slots[n_cpus:]
+
+    # Several CPUs per slot
+    slots = cpu_slots(2, cpus_per_slot=3)
+    assert [len(slot) for slot in slots] == [3, 3]
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'),
+                    reason="requires CPU affinity support")
+def test_run_sim_cmd_placement(monkeypatch, tmpdir):
+    popen = subprocess.Popen
+
+    def check_popen(*args, **kwargs):
+        assert 'preexec_fn' not in kwargs
+        return popen(*args, **kwargs)
+
+    # The child process is placed on CPUs and its priority is set without
+    # running code in it before the command is executed
+    monkeypatch.setattr(subprocess, 'Popen', check_popen)
+    cpu = sorted(os.sched_getaffinity(0))[0]
+    cmd = [sys.executable, "-c",
+           "import os; "
+           "print(sorted(os.sched_getaffinity(0)), os.nice(0), "
+           "os.environ['OMP_NUM_THREADS'], os.environ['MKL_NUM_THREADS'])"]
+
+    run_sim_cmd(cmd, str(tmpdir), stdout="out.log", cpus=[cpu],
+                nice=2)
+    assert tmpdir.join("out.log").read().split() == [
+        "[{}]".format(cpu), str(os.nice(0) + 2), "1", "1"]
+
+    run_sim_cmd(cmd, str(tmpdir), stdout="out.log", cpus=[cpu],
+                n_threads=4)
+    assert tmpdir.join("out.log").read().split()[-2:] == ["4", "4"]
+
+
+def test_run_sim_inproc(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+    argv = list(sys.argv)
+    cwd = os.getcwd()
+
+    # Successful simulation
+    status = run_sim_inproc(str(model_file), sim_id="12345",
+                            sim_path=str(sim_dir))
+    assert status == 0
+    assert sim_dir.join("argv.txt").read() == "--simid 12345 --save"
+    assert sys.argv == argv
+    assert os.getcwd() == cwd
+
+    # Failed simulation
+    status = run_sim_inproc(str(model_file), model_args=["3"],
+                            sim_path=str(sim_dir))
+    assert status == 3
+    assert sim_dir.join("argv.txt").read() == "--save 3"
+    assert sys.argv == argv
+    assert os.getcwd() == cwd
+
+
+def test_run_sim_params(tmpdir, monkeypatch):
+    monkeypatch.setenv('PYTHONPATH', os.path.dirname(
+        os.path.dirname(os.path.abspath(simtools.__file__))))
+    monkeypatch.delenv(PARAMS_ENV_VAR, raising=False)
+    model_file = tmpdir.join("model.py")
+    model_file.write(
+"""import json
+import sys
+
+import simtools
+
+options = simtools.parse_args(['params_filename', 'save_data'])
+params = simtools.load_params(options.params_filename)
+with open("params.json", 'w') as params_file:
+    json.dump([sys.argv[1:], params], params_file)
+""")
+    params = {'p1': 1, 'p2': [2.5, "abc"]}
+
+    # Parameters passed to a child process
+    sim_dir = tmpdir.mkdir("sim")
+    exit_status = run_sim(str(model_file), executable=sys.executable,
+                          sim_path=str(sim_dir), params=params)
+    assert exit_status == 0
+    assert json.loads(sim_dir.join("params.json").read()) == [["--save"],
+                                                              params]
+    assert PARAMS_ENV_VAR not in os.environ
+
+    # Parameters passed to a simulation launched in-process
+    sim_dir = tmpdir.mkdir("sim_inproc")
+    status = run_sim_inproc(str(model_file), sim_path=str(sim_dir),
+                            params=params)
+    assert status == 0
+    assert json.loads(sim_dir.join("params.json").read()) == [["--save"],
+                                                              params]
+    assert PARAMS_ENV_VAR not in os.environ
+
+    # Parameters passed to this process are not inherited by simulations
+    # launched without parameters
+    env_model_file = tmpdir.join("env_model.py")
+    env_model_file.write(
+"""import os
+
+with open("env.txt", 'w') as env_file:
+    env_file.write(repr(os.environ.get({!r})))
+""".format(PARAMS_ENV_VAR))
+    monkeypatch.setenv(PARAMS_ENV_VAR, '{"p0": 0}')
+    sim_dir = tmpdir.mkdir("sim_nested")
+    assert run_sim(str(env_model_file), executable=sys.executable,
+                   sim_path=str(sim_dir)) == 0
+    assert sim_dir.join("env.txt").read() == "None"
+    sim_dir = tmpdir.mkdir("sim_nested_inproc")
+    assert run_sim_inproc(str(env_model_file), sim_path=str(sim_dir)) == 0
+    assert sim_dir.join("env.txt").read() == "None"
+    assert os.environ[PARAMS_ENV_VAR] == '{"p0": 0}'
+
+    # Parameters too large to be passed through an environment variable
+    with pytest.raises(ValueError):
+        run_sim(str(model_file), executable=sys.executable,
+                sim_path=str(sim_dir), params={'p1': "x" * (1 << 17)})
+
+    # Both parameter file and parameters
+    with pytest.raises(ValueError):
+        run_sim(str(model_file), "params.json", params=params)
+
+
+def test_fork_server(tmpdir, model_file):
+    sim_dir = tmpdir.mkdir("sim")
+
+    with ForkServer() as server:
+        # Successful simulation
+        status = server.run_sim(str(model_file), sim_id="12345",
+                                sim_path=str(sim_dir))
+        assert status == 0
+        assert sim_dir.join("argv.txt").read() == "--simid 12345 --save"
+
+        # Failed simulation
+        process = server.start_sim(str(model_file), model_args=["3"],
+                                   sim_path=str(sim_dir))
+        process.join()
+        assert process.exitcode == 3
+        assert sim_dir.join("argv.txt").read() == "--save 3"
+
+    # Once the server has been closed, other modules can be preloaded
+    with ForkServer(['json']) as server:
+        assert server.run_sim(str(model_file), sim_path=str(sim_dir)) == 0
+    assert multiprocessing.forkserver._forkserver._forkserver_pid is None
+    with ForkServer(['csv']) as server:
+        assert server.run_sim(str(model_file), sim_path=str(sim_dir)) == 0
+
+
+def test_fork_server_preload_invalid(monkeypatch):
+    with pytest.raises(TypeError):
+        ForkServer(preload='json')
+    with pytest.raises(ImportError):
+        ForkServer(preload=['simtools_nonexistent_module'])
+
+    # Other modules cannot be preloaded once the server has been started
+    monkeypatch.setattr(ForkServer, '_started_preload', ['json'])
+    ForkServer(preload=['json'])
+    with pytest.raises(ValueError):
+        ForkServer(preload=['csv'])
+
+
 def test_load_sim_dirnames(tmpdir):
     sim_dirnames_file = tmpdir.join("dirnames.txt")
     sim_dirnames_file.write(
@@ -130,3 +794,76 @@ simulations\\20001020_060708\\
     assert sim_dirnames[3] == os.path.join("simulations", "20001020_050607")
     assert sim_dirnames[4] == os.path.join("simulations", "20001020_060708")
     assert sim_dirnames[5] == os.path.join("simulations", "20001020_070809")
+
+
+def test_iter_sim_dirnames(tmpdir, monkeypatch):
+    master_dir = tmpdir.mkdir("master")
+    for sim_dirname in ("20001020_010203", "20001020_020304",
+                        "20001021_010203", ".20001020_030405"):
+        master_dir.mkdir(sim_dirname).mkdir("data")
+    master_dir.join("20001020_040506").write("")
+    sim_dirnames_file = tmpdir.join("dirnames.txt")
+    sim_dirnames_file.write(
+"""# Simulation directories
+20001020_020304
+20001020_*
+    20001021_010203/
+20001021_010203
+2000102?_*/data
+20001022_*
+""")
+
+    # Glob patterns are expanded relative to the master directory, and
+    # duplicates are skipped
+    sim_dirnames = iter_sim_dirnames(str(sim_dirnames_file), str(master_dir))
+    assert next(sim_dirnames) == "20001020_020304"
+    assert list(sim_dirnames) == [
+        "20001020_010203", "20001021_010203",
+        os.path.join("20001020_010203", "data"),
+        os.path.join("20001020_020304", "data"),
+        os.path.join("20001021_010203", "data")]
+
+    # Duplicates are retained if requested
+    sim_dirnames = list(iter_sim_dirnames(str(sim_dirnames_file),
+                                          str(master_dir), unique=False))
+    assert len(sim_dirnames) == 8
+
+    # Names of simulation directories are read from the standard input
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(u"a\nb\na\n"))
+    assert list(iter_sim_dirnames("-")) == ["a", "b"]
+
+    # Simulation directories under partial names match only glob patterns
+    # that explicitly refer to them
+    master_dir.mkdir("_20001020_050607.partial")
+    sim_dirnames_file.write("*\n_*.partial\n")
+    assert list(iter_sim_dirnames(str(sim_dirnames_file),
+                                  str(master_dir))) == [
+        "20001020_010203", "20001020_020304", "20001021_010203",
+        "_20001020_050607.partial"]
+
+
+def test_iter_sim_dirnames_shard(tmpdir):
+    master_dir = tmpdir.mkdir("master")
+    for sim_dirname in ("20001020/01/20001020_010203",
+                        "20001020/02/20001020_020304",
+                        "20001021/01/20001021_010203"):
+        master_dir.ensure_dir(*sim_dirname.split("/"))
+    sim_dirnames_file = tmpdir.join("dirnames.txt")
+    sim_dirnames_file.write(
+"""20001021_010203
+20001020_*
+20001020/01/20001020_010203
+""")
+
+    # Bare names are resolved through the sharded layout and glob patterns
+    # match any shard directories
+    sim_dirnames = list(iter_sim_dirnames(str(sim_dirnames_file),
+                                          str(master_dir), shard='date'))
+    assert sim_dirnames == [
+        os.path.join("20001021", "01", "20001021_010203"),
+        os.path.join("20001020", "01", "20001020_010203"),
+        os.path.join("20001020", "02", "20001020_020304")]
+    assert load_sim_dirnames(str(sim_dirnames_file), shard='date') == [
+        os.path.join("20001021", "01", "20001021_010203"),
+        os.path.join("*", "*", "20001020_*"),
+        os.path.join("20001020", "01", "20001020_010203")]
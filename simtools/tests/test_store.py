@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Unit tests of content-addressed file store."""
+
+import errno
+import hashlib
+import os
+import stat
+
+import pytest
+
+from simtools.store import (dedup_files, FileStore, find_files, hash_file,
+                            STORE_DIRNAME)
+
+
+def test_hash_file(tmpdir):
+    data_file = tmpdir.join("data.txt")
+    data_file.write("abc")
+
+    assert hash_file(str(data_file)) == hashlib.sha256(b"abc").hexdigest()
+
+
+def test_file_store_add(tmpdir):
+    data_file = tmpdir.join("data.txt")
+    data_file.write("abc")
+    store = FileStore(str(tmpdir.join(STORE_DIRNAME)))
+
+    blob_path = store.add(str(data_file))
+    assert blob_path == store.blob_path(hashlib.sha256(b"abc").hexdigest())
+    assert open(blob_path).read() == "abc"
+    assert not os.stat(blob_path).st_mode & stat.S_IWUSR
+    assert not os.path.samefile(blob_path, str(data_file))
+
+    # Adding the same contents again reuses the blob
+    assert store.add(str(data_file)) == blob_path
+
+
+def test_file_store_place(tmpdir):
+    model_file = tmpdir.join("model.py")
+    model_file.write("x = 1")
+    sim_dirs = [tmpdir.mkdir("sim1"), tmpdir.mkdir("sim2")]
+    store = FileStore(str(tmpdir.join(STORE_DIRNAME)))
+
+    dst_filenames = [store.place(str(model_file), str(sim_dir))
+                     for sim_dir in sim_dirs]
+    assert dst_filenames == [str(sim_dir.join("model.py"))
+                             for sim_dir in sim_dirs]
+    assert os.path.samefile(*dst_filenames)
+    assert sim_dirs[0].join("model.py").read() == "x = 1"
+
+
+def test_find_files(tmpdir):
+    tmpdir.mkdir("sim1").join("data.txt").write("abc")
+    tmpdir.join("sim1", "empty.txt").write("")
+    store = FileStore(str(tmpdir.join(STORE_DIRNAME)))
+    store.add(str(tmpdir.join("sim1", "data.txt")))
+
+    paths = [path for path, _ in find_files([str(tmpdir)])]
+    assert paths == [str(tmpdir.join("sim1", "data.txt"))]
+
+
+def test_dedup_files(tmpdir):
+    for s in range(3):
+        sim_dir = tmpdir.mkdir("sim{}".format(s))
+        sim_dir.join("model.py").write("x = 1")
+        sim_dir.join("data.txt").write("data{}".format(s))
+    store = FileStore(str(tmpdir.join(STORE_DIRNAME)))
+
+    n_merged, n_bytes_saved = dedup_files(find_files([str(tmpdir)]), store,
+                                          n_workers=2)
+    assert n_merged == 2
+    assert n_bytes_saved == 10
+    for s in range(3):
+        model_path = str(tmpdir.join("sim{}".format(s), "model.py"))
+        assert open(model_path).read() == "x = 1"
+        assert os.path.samefile(model_path, str(tmpdir.join("sim0",
+                                                            "model.py")))
+        assert not os.path.samefile(
+            str(tmpdir.join("sim{}".format(s), "data.txt")),
+            str(tmpdir.join("sim0", "data.txt"))) or s == 0
+
+    # Deduplicating again does not merge anything
+    n_merged, n_bytes_saved = dedup_files(find_files([str(tmpdir)]), store)
+    assert n_merged == 0
+    assert n_bytes_saved == 0
+
+    # Files with different permissions are not merged
+    script_file = tmpdir.join("sim1", "run.sh")
+    script_file.write("x = 1")
+    script_file.chmod(0o755)
+    n_merged, n_bytes_saved = dedup_files(find_files([str(tmpdir)]), store)
+    assert n_merged == 0
+    assert os.access(str(script_file), os.X_OK)
+    assert not os.path.samefile(str(script_file),
+                                str(tmpdir.join("sim0", "model.py")))
+
+
+def test_file_store_merge_cross_device(monkeypatch, tmpdir):
+    data_file = tmpdir.join("data.txt")
+    data_file.write("abc")
+    store = FileStore(str(tmpdir.join(STORE_DIRNAME)))
+
+    def link(src, dst):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    # Files on a different file system than the store cannot be merged
+    monkeypatch.setattr(os, 'link', link)
+    with pytest.raises(OSError) as excinfo:
+        store.merge(str(data_file))
+    assert excinfo.value.errno == errno.EXDEV
+    assert excinfo.value.filename == str(data_file)
+    assert data_file.read() == "abc"
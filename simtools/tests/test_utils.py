@@ -6,7 +6,7 @@ import platform
 
 import pytest
 
-from simtools.utils import save_platform, save_versions
+from simtools.utils import save_manifest, save_platform, save_versions
 
 
 @pytest.fixture
@@ -154,3 +154,23 @@ def test_save_versions_forbid_kwargs(tmpdir, versions_dict, kwargs):
 
     with pytest.raises(TypeError):
         save_versions(str(versions_file), versions_dict, **kwargs)
+
+
+def test_save_manifest(tmpdir):
+    manifest_file = tmpdir.join("run.json")
+    run_info = {'cmd': ["model.py", "--save"], 'exit_status': 0,
+                'wall_time': 1.5}
+
+    save_manifest(str(manifest_file), run_info)
+    manifest_json = json.load(manifest_file)
+    assert manifest_json == run_info
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'fp': None},
+    {'obj': None}])
+def test_save_manifest_forbid_kwargs(tmpdir, kwargs):
+    manifest_file = tmpdir.join("run_forbid_kwargs.json")
+
+    with pytest.raises(TypeError):
+        save_manifest(str(manifest_file), {}, **kwargs)
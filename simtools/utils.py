@@ -4,7 +4,8 @@
 Miscellaneous utilities provide the following functionality:
 
 - saving platform information to a JSON file;
-- saving software versions to a JSON file.
+- saving software versions to a JSON file;
+- saving run information to a JSON file.
 """
 
 import collections
@@ -72,3 +73,22 @@ def save_versions(filename, versions_info, **kwargs):
     # Save software version information to a JSON file
     with open(filename, 'w') as versions_file:
         json.dump(versions_info, versions_file, indent=indent, **kwargs)
+
+
+def save_manifest(filename, run_info, **kwargs):
+    """Save run information to a file."""
+    DEFAULT_INDENT = 4
+
+    # If necessary, validate extra keyword arguments
+    if kwargs:
+        for arg in ('obj', 'fp'):
+            if arg in kwargs:
+                raise TypeError("save_manifest() got an unexpected keyword "
+                                "argument '{}'.".format(arg))
+
+    # Determine indentation
+    indent = kwargs.pop('indent', DEFAULT_INDENT)
+
+    # Save run information to a JSON file
+    with open(filename, 'w') as manifest_file:
+        json.dump(run_info, manifest_file, indent=indent, **kwargs)